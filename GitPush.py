@@ -1,13 +1,19 @@
+import argparse
+import contextlib
+import json
 import os
 import subprocess
 import re
+import shutil
 import sys
+import tempfile
+import time
 import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-# Start with more verbose output
-print("=== GitPush Script Starting ===")
-print(f"Python version: {sys.version}")
-print(f"Current working directory: {os.getcwd()}")
+from metrics import Metrics
 
 # Set the repository folder name (adjust if necessary)
 REPO_NAME = "WA_Group_Scrape"
@@ -15,8 +21,6 @@ REPO_NAME = "WA_Group_Scrape"
 # Use the current directory instead of a hardcoded path
 REPO_PATH = os.getcwd()
 
-print(f"Working with repository at: {REPO_PATH}")
-
 if not os.path.isdir(REPO_PATH):
     print(f"Error: Repository folder '{REPO_NAME}' not found at {REPO_PATH}.")
     exit(1)
@@ -24,11 +28,245 @@ if not os.path.isdir(REPO_PATH):
 # Change working directory to the repo
 os.chdir(REPO_PATH)
 
-def check_and_init_git():
+DEFAULT_COMMIT_TEMPLATE = "Automated sync {timestamp}"
+DEFAULT_REMOTE_URL = "https://github.com/StonerStyle/WA_Group_Scrape"
+
+# Phase timings and git command histograms; recorded only with --profile or --metrics-out
+metrics = Metrics("gitpush")
+
+# --- Git session ---
+#
+# All git commands go through a single GitSession. Read-only queries are
+# batched into as few invocations as possible (one for-each-ref for branches,
+# one config --list for settings, one porcelain v2 status for the working
+# tree) and cached until GitPush itself changes the repository. Each command's
+# wall time is recorded so a run can report where its time went.
+
+StatusEntry = namedtuple("StatusEntry", ["path", "index", "worktree", "orig_path"])
+
+class StatusSnapshot:
+    """Typed change set parsed from `git status --porcelain=v2 -z --branch`."""
+
+    def __init__(self, session=None):
+        self.branch = ""
+        self.head = None
+        self.upstream = None
+        self.ahead = 0
+        self.behind = 0
+        self.staged = []
+        self.unstaged = []
+        self.untracked = []
+        self.renamed = []
+        self.conflicted = []
+        self._session = session
+        self._ignored_tracked = None
+
+    @property
+    def has_changes(self):
+        return bool(self.staged or self.unstaged or self.untracked or self.conflicted)
+
+    @property
+    def ignored_tracked(self):
+        """Tracked files that match an ignore rule.
+
+        git status doesn't report these, so they are listed on first access
+        only and then kept for the lifetime of the snapshot.
+        """
+        if self._ignored_tracked is None:
+            session = self._session or GitSession()
+            result = session.run(["ls-files", "-z", "--cached", "--ignored", "--exclude-standard"])
+            self._ignored_tracked = [p for p in result.stdout.split("\0") if p]
+        return self._ignored_tracked
+
+    def changed_paths(self):
+        """All paths that differ from HEAD, in a stable order."""
+        paths = []
+        for entry in self.staged + self.unstaged + self.conflicted:
+            if entry.path not in paths:
+                paths.append(entry.path)
+        return paths + [p for p in self.untracked if p not in paths]
+
+def parse_porcelain_v2(output, session=None):
+    """Parse NUL-separated `git status --porcelain=v2 -z --branch` output."""
+    snapshot = StatusSnapshot(session)
+    records = output.split("\0")
+    i = 0
+    while i < len(records):
+        record = records[i]
+        i += 1
+        if not record:
+            continue
+
+        kind = record[0]
+        if kind == "#":
+            header = record[2:].split(" ", 1)
+            key, value = header[0], header[1] if len(header) > 1 else ""
+            if key == "branch.head":
+                snapshot.branch = "" if value == "(detached)" else value
+            elif key == "branch.oid":
+                snapshot.head = None if value == "(initial)" else value
+            elif key == "branch.upstream":
+                snapshot.upstream = value
+            elif key == "branch.ab":
+                ahead, behind = value.split(" ")
+                snapshot.ahead, snapshot.behind = int(ahead), -int(behind)
+        elif kind == "1":
+            # 1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>
+            fields = record.split(" ", 8)
+            _add_entry(snapshot, StatusEntry(fields[8], fields[1][0], fields[1][1], None))
+        elif kind == "2":
+            # 2 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <X><score> <path>\0<origPath>
+            fields = record.split(" ", 9)
+            orig_path = records[i] if i < len(records) else None
+            i += 1
+            entry = StatusEntry(fields[9], fields[1][0], fields[1][1], orig_path)
+            snapshot.renamed.append(entry)
+            _add_entry(snapshot, entry)
+        elif kind == "u":
+            # u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>
+            fields = record.split(" ", 10)
+            snapshot.conflicted.append(StatusEntry(fields[10], fields[1][0], fields[1][1], None))
+        elif kind == "?":
+            snapshot.untracked.append(record[2:])
+    return snapshot
+
+def _add_entry(snapshot, entry):
+    if entry.index != ".":
+        snapshot.staged.append(entry)
+    if entry.worktree != ".":
+        snapshot.unstaged.append(entry)
+
+class GitSession:
+    """Runs git commands for one repository, caching read-only queries."""
+
+    def __init__(self, cwd=None, metrics=None):
+        self.cwd = cwd
+        self.metrics = metrics or Metrics("git")
+        # Where uncaptured git output goes; None means the terminal
+        self.stdout = None
+        self.timings = []
+        self._status = None
+        self._refs = None
+        self._config = None
+        self._fetched = set()
+        self._remote_heads = {}
+        # Extra `git fetch` flags, e.g. --depth or --filter for partial fetches
+        self.fetch_options = []
+
+    def run(self, args, check=False, capture=True, mutates=False):
+        """Run `git <args>` and record its wall time.
+
+        Commands that change the repository must pass mutates=True so the
+        cached status and refs are dropped.
+        """
+        start = time.perf_counter()
+        try:
+            with self.metrics.span("git", command=args[0]):
+                if capture:
+                    return subprocess.run(["git"] + args, cwd=self.cwd, check=check, capture_output=True, text=True)
+                return subprocess.run(["git"] + args, cwd=self.cwd, check=check, stdout=self.stdout)
+        finally:
+            self.timings.append((" ".join(["git"] + args), time.perf_counter() - start))
+            if mutates:
+                self.invalidate()
+
+    def mutate(self, args, check=True, capture=False):
+        """Run a git command that changes the repository."""
+        return self.run(args, check=check, capture=capture, mutates=True)
+
+    def invalidate(self, config=False):
+        """Drop cached status and refs (and config if asked); the next query will read them again."""
+        self._status = None
+        self._refs = None
+        if config:
+            self._config = None
+
+    def status(self, refresh=False):
+        """Return the cached status snapshot, taking a new one if needed."""
+        if self._status is None or refresh:
+            result = self.run(["status", "--porcelain=v2", "-z", "--branch", "--untracked-files=all"])
+            self._status = parse_porcelain_v2(result.stdout, self)
+        return self._status
+
+    def _load_refs(self):
+        if self._refs is None:
+            result = self.run(["for-each-ref", "--format=%(refname)", "refs/heads", "refs/remotes"])
+            local, remote = set(), {}
+            for ref in result.stdout.splitlines():
+                if ref.startswith("refs/heads/"):
+                    local.add(ref[len("refs/heads/"):])
+                elif ref.startswith("refs/remotes/"):
+                    remote_name, _, branch = ref[len("refs/remotes/"):].partition("/")
+                    # Skip the symbolic origin/HEAD pointer
+                    if branch and branch != "HEAD":
+                        remote.setdefault(remote_name, set()).add(branch)
+            self._refs = (local, remote)
+        return self._refs
+
+    def local_branches(self):
+        return self._load_refs()[0]
+
+    def remote_branches(self, remote="origin"):
+        return self._load_refs()[1].get(remote, set())
+
+    def config_value(self, key, default=""):
+        """Look up a config value from a single cached `git config --list`."""
+        if self._config is None:
+            result = self.run(["config", "--list", "-z"])
+            self._config = {}
+            for entry in result.stdout.split("\0"):
+                if entry:
+                    name, _, value = entry.partition("\n")
+                    self._config[name.lower()] = value
+        return self._config.get(key.lower(), default)
+
+    def set_config(self, key, value):
+        """Set a local config value, skipping the write if it is already set."""
+        if self.config_value(key, None) == value:
+            return
+        self.run(["config", key, value], check=True)
+        if self._config is not None:
+            self._config[key.lower()] = value
+
+    def fetch(self, remote="origin", *refspecs, check=False):
+        """Fetch from a remote once per session; repeated fetches are skipped."""
+        key = (remote,) + refspecs
+        if key in self._fetched or (remote,) in self._fetched:
+            return None
+        result = self.run(["fetch"] + self.fetch_options + [remote] + list(refspecs), check=check, mutates=True)
+        if result.returncode == 0:
+            self._fetched.add(key)
+        return result
+
+    def remote_heads(self, remote="origin"):
+        """Branch names on the remote, listed with ls-remote so no objects are fetched."""
+        if remote not in self._remote_heads:
+            result = self.run(["ls-remote", "--heads", remote])
+            heads = set()
+            for line in result.stdout.splitlines():
+                ref = line.partition("\t")[2]
+                if ref.startswith("refs/heads/"):
+                    heads.add(ref[len("refs/heads/"):])
+            self._remote_heads[remote] = heads
+        return self._remote_heads[remote]
+
+    def report_timings(self):
+        """Print how many git processes ran and how long each took."""
+        total = sum(elapsed for _, elapsed in self.timings)
+        print(f"\n=== Git commands: {len(self.timings)} in {total:.2f}s ===")
+        for command, elapsed in self.timings:
+            print(f"{elapsed:7.3f}s  {command}")
+
+session = GitSession(metrics=metrics)
+
+@metrics.timed()
+def check_and_init_git(options=None):
     """Check if the directory is a Git repository and initialize it if necessary."""
     if not os.path.isdir(".git"):
+        if options is not None and options.existing_repo:
+            raise RuntimeError(f"{REPO_PATH} is not a Git repository.")
         print("No Git repository found in this directory. Initializing the repository...")
-        subprocess.run(["git", "init"], check=True)
+        session.mutate(["init"])
         print("Git repository initialized.")
     else:
         print("Git repository already initialized.")
@@ -36,46 +274,273 @@ def check_and_init_git():
     # Ensure git knows who we are (required for commits)
     try:
         # Check if user name is configured
-        user_name = subprocess.run(["git", "config", "user.name"], capture_output=True, text=True).stdout.strip()
-        user_email = subprocess.run(["git", "config", "user.email"], capture_output=True, text=True).stdout.strip()
+        user_name = session.config_value("user.name").strip()
+        user_email = session.config_value("user.email").strip()
         
         if not user_name or not user_email:
             print("Git user identity not fully configured. Setting default values...")
             if not user_name:
-                subprocess.run(["git", "config", "user.name", "WA_Group_Scrape_User"], check=True)
+                session.set_config("user.name", "WA_Group_Scrape_User")
             if not user_email:
-                subprocess.run(["git", "config", "user.email", "wa_script@example.com"], check=True)
+                session.set_config("user.email", "wa_script@example.com")
             print("Git user identity configured.")
     except Exception as e:
         print(f"Warning: Could not check git user identity: {str(e)}")
 
-def set_remote_url():
+@metrics.timed()
+def set_remote_url(options=None):
     """Set the new remote URL to the GitHub repository."""
-    new_remote_url = "https://github.com/StonerStyle/WA_Group_Scrape"
+    new_remote_url = (options.remote if options is not None else None) or DEFAULT_REMOTE_URL
     
     # Check if the remote already exists and update it if necessary
-    try:
-        subprocess.run(["git", "remote", "set-url", "origin", new_remote_url], check=True)
+    current_url = session.config_value("remote.origin.url", None)
+    if options is not None and options.existing_repo:
+        # Another repository's run (--manifest): its origin is its own
+        if current_url is not None:
+            print(f"Using the repository's remote: {current_url}")
+            return
+        if not options.remote:
+            raise RuntimeError("No 'origin' remote is configured in this repository.")
+    if current_url == new_remote_url:
+        print(f"Remote repository URL already set to: {new_remote_url}")
+    elif current_url is not None:
+        session.run(["remote", "set-url", "origin", new_remote_url], check=True)
         print(f"Remote repository URL set to: {new_remote_url}")
-    except subprocess.CalledProcessError:
+    else:
         # If the remote doesn't exist, add it
-        subprocess.run(["git", "remote", "add", "origin", new_remote_url], check=True)
+        session.run(["remote", "add", "origin", new_remote_url], check=True)
         print(f"Remote repository URL added: {new_remote_url}")
 
-def get_branches():
+def get_branches(options=None):
     """Retrieve the list of available remote Git branches."""
-    result = subprocess.run(["git", "branch", "-r"], capture_output=True, text=True)
-    if not result.stdout.strip():
+    if options is not None and options.single_branch:
+        # Nothing was fetched up front; ask the remote directly
+        branches = session.remote_heads("origin")
+    else:
+        branches = session.remote_branches("origin")
+    if not branches:
         print("No remote branches found. Have you pushed to the remote repository yet?")
         return []
-    
-    branches = result.stdout.strip().split("\n")
-    # Remove 'origin/' prefix and filter out HEAD references
-    branches = [b.strip().replace("origin/", "") for b in branches if "->" not in b and b.strip()]
-    return list(set(branches))  # Remove duplicates
+    return sorted(branches)
+
+# --- Partial fetches and sparse checkout ---
+#
+# On a scraper host the repository's history (and the data snapshots in it)
+# is mostly dead weight. --depth and --filter make every fetch shallow or
+# blobless, --single-branch fetches only the branch being worked on, and a
+# sparse-checkout profile limits which directories are written to disk.
+
+# Cone-mode directories per profile; files in the repository root are always
+# checked out. An empty list turns sparse checkout off.
+SPARSE_PROFILES = {
+    "full": [],
+    "scraper": ["modules", "prompts", "services", "ui"],
+    "services": ["prompts", "services"],
+}
+# Optional JSON file in the repository root adding or overriding profiles
+SPARSE_PROFILES_FILE = "sparse-profiles.json"
+
+def load_sparse_profiles():
+    """The built-in sparse-checkout profiles plus any from SPARSE_PROFILES_FILE."""
+    profiles = dict(SPARSE_PROFILES)
+    if os.path.exists(SPARSE_PROFILES_FILE):
+        with open(SPARSE_PROFILES_FILE, encoding="utf-8") as f:
+            profiles.update(json.load(f))
+    return profiles
+
+def fetch_options(options):
+    """Extra `git fetch` flags for the partial-fetch command line options."""
+    flags = []
+    if options.depth:
+        flags.append(f"--depth={options.depth}")
+    if options.filter:
+        flags.append(f"--filter={options.filter}")
+    if options.single_branch:
+        # Tags would pull in history from other branches
+        flags.append("--no-tags")
+    return flags
+
+def branch_refspec(branch, remote="origin"):
+    return f"+refs/heads/{branch}:refs/remotes/{remote}/{branch}"
+
+def fetch_branch(branch, options, check=False):
+    """Fetch the branch alone with --single-branch, otherwise everything (once per run)."""
+    if options.single_branch:
+        return session.fetch("origin", branch_refspec(branch), check=check)
+    return session.fetch("origin", check=check)
+
+@metrics.timed()
+def apply_sparse_profile(name):
+    """Limit the working tree to a profile's directories; returns False for an unknown profile."""
+    profiles = load_sparse_profiles()
+    if name not in profiles:
+        print(f"Unknown sparse-checkout profile '{name}'. Available: {', '.join(sorted(profiles))}")
+        return False
+    directories = profiles[name]
+    enabled = session.config_value("core.sparsecheckout", "false").lower() == "true"
+    if not directories:
+        if enabled:
+            print("Turning sparse checkout off; all files will be checked out.")
+            session.mutate(["sparse-checkout", "disable"])
+        return True
+    if enabled:
+        current = session.run(["sparse-checkout", "list"]).stdout.split()
+        if sorted(current) == sorted(directories):
+            print(f"Sparse checkout already uses the '{name}' profile.")
+            return True
+    print(f"Checking out only: {', '.join(directories)} (profile '{name}')")
+    session.mutate(["sparse-checkout", "set", "--cone"] + directories)
+    # sparse-checkout writes its settings to the config behind our cache
+    session.invalidate(config=True)
+    return True
 
-def select_branch(branches):
+# --- Data snapshots ---
+#
+# A raw sheet export committed on every sync is rewritten as one big file
+# each time. With --snapshot, GitPush records the export in an append-only
+# snapshot store (services.snapshots) under --snapshot-dir and commits that
+# instead; the export itself is untracked and kept out of the commit.
+
+SNAPSHOT_EXCLUDE_HEADER = "# Raw exports committed as snapshots"
+
+@metrics.timed()
+def snapshot_exports(exports, snapshot_dir, label):
+    """Record each export as a snapshot and keep the raw files out of git."""
+    # Imported here so GitPush runs without the services package unless --snapshot is used
+    from services.snapshots import SnapshotStore, read_export
+
+    rules, paths = [], []
+    for export in exports:
+        path = os.path.relpath(os.path.abspath(export), REPO_PATH).replace(os.sep, "/")
+        rules.append("/" + path)
+        paths.append(path)
+        if not os.path.exists(path):
+            print(f"Warning: export '{path}' not found; no snapshot taken.")
+            continue
+        columns, rows = read_export(path)
+        store = SnapshotStore(os.path.join(snapshot_dir, os.path.splitext(os.path.basename(path))[0]))
+        entry = store.write(rows, columns, label)
+        if entry is None:
+            print(f"{path}: unchanged since snapshot {store.snapshots[-1]['id']}.")
+        else:
+            print(f"{path}: snapshot {entry['id']} in {store.path} ({entry['added']} added, "
+                  f"{entry['changed']} changed, {entry['removed']} removed)")
+            if entry["duplicate_keys"]:
+                print(f"Warning: {entry['duplicate_keys']} rows of {path} repeat an earlier key.")
+
+    if os.path.isdir(".git"):
+        sync_ignore_file(os.path.join(".git", "info", "exclude"), rules, SNAPSHOT_EXCLUDE_HEADER)
+    tracked = [path for path in session.run(["ls-files", "-z", "--"] + paths).stdout.split("\0") if path]
+    if tracked:
+        print(f"Untracking raw exports now kept as snapshots: {', '.join(tracked)}")
+        session.mutate(["rm", "--cached", "-q", "--"] + tracked)
+
+def parse_args(argv=None):
+    """Parse command line options. With no options GitPush runs interactively."""
+    parser = argparse.ArgumentParser(description="Commit and push this folder, or overwrite it from a branch.")
+    parser.add_argument("--non-interactive", action="store_true",
+                        help="never prompt; unanswered questions use the defaults below")
+    parser.add_argument("--branch",
+                        help="branch to work with ('current' for the checked out branch, the default)")
+    parser.add_argument("--action", choices=["push", "overwrite"],
+                        help="push local changes (default) or overwrite the folder from the branch")
+    parser.add_argument("--message",
+                        help="commit message template; {timestamp}, {date}, {branch} and {files} are filled in "
+                             f"(default: '{DEFAULT_COMMIT_TEMPLATE}')")
+    parser.add_argument("--on-changes", choices=["commit", "stash", "discard", "abort"],
+                        help="what to do with uncommitted changes before switching branches (default: abort)")
+    parser.add_argument("--on-conflict", choices=["abort", "continue", "rebase"],
+                        help="what to do when pulling the branch fails (default: abort)")
+    parser.add_argument("--force-commit", action="store_true", default=None,
+                        help="create a commit even when git reports no changes")
+    parser.add_argument("--include-large", dest="exclude_large", action="store_false", default=None,
+                        help="don't untrack dist/, venv/, node_modules/ and auth_info before committing")
+    parser.add_argument("--large-files", choices=LARGE_FILE_POLICIES,
+                        help="what to do with oversized files before staging: leave them unstaged (skip, the "
+                             "default), stop the run (refuse), track them with Git LFS (lfs) or commit them anyway")
+    parser.add_argument("--max-file-size", type=float, default=LARGE_FILE_LIMIT_MB, metavar="MB",
+                        help=f"size limit for text files (default: {LARGE_FILE_LIMIT_MB})")
+    parser.add_argument("--max-binary-size", type=float, default=BINARY_FILE_LIMIT_MB, metavar="MB",
+                        help=f"size limit for binary files such as media, archives and builds "
+                             f"(default: {BINARY_FILE_LIMIT_MB})")
+    parser.add_argument("--json", action="store_true",
+                        help="print a JSON result on stdout; progress output goes to stderr")
+    parser.add_argument("--depth", type=int, metavar="N",
+                        help="fetch only the last N commits of each branch (shallow fetch)")
+    parser.add_argument("--filter", metavar="SPEC",
+                        help="partial fetch, e.g. 'blob:none' to download file contents only when checked out")
+    parser.add_argument("--single-branch", action="store_true",
+                        help="fetch only the selected branch instead of every branch up front")
+    parser.add_argument("--sparse", metavar="PROFILE",
+                        help="check out only the directories of a sparse-checkout profile "
+                             f"({', '.join(SPARSE_PROFILES)}, or one from {SPARSE_PROFILES_FILE}; 'full' turns it off)")
+    parser.add_argument("--snapshot", action="append", metavar="EXPORT",
+                        help="commit this CSV/JSON-lines export as an append-only snapshot instead of the raw "
+                             "file (repeatable)")
+    parser.add_argument("--snapshot-dir", default="snapshots",
+                        help="where snapshots are stored in the repository (default: snapshots)")
+    parser.add_argument("--remote", metavar="URL",
+                        help=f"URL to set for the 'origin' remote (default: {DEFAULT_REMOTE_URL})")
+    parser.add_argument("--existing-repo", action="store_true",
+                        help="refuse to initialize a new repository and keep an existing 'origin' as it is "
+                             "(used for the repositories of --manifest)")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="sync every repository listed in a JSON manifest instead of this folder")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="repositories synced at the same time with --manifest (default: 8)")
+    parser.add_argument("--repo-timeout", type=float, metavar="SECONDS",
+                        help="give up on a repository after this long with --manifest")
+    parser.add_argument("--profile", action="store_true",
+                        help="print how the run's wall time splits across phases and git commands")
+    parser.add_argument("--metrics-out", default=os.environ.get("GITPUSH_METRICS_OUT"), metavar="PATH_OR_URL",
+                        help="write timings and counters as JSON lines, as Prometheus text (*.prom) "
+                             "or POST them to a URL (default: $GITPUSH_METRICS_OUT)")
+    options = parser.parse_args(argv)
+    # Printing JSON only makes sense when nobody is at the terminal
+    if options.json or options.manifest:
+        options.non_interactive = True
+    return options
+
+def ask(options, name, prompt, default):
+    """Return the preset option, prompt for it, or fall back to the default.
+
+    An option given on the command line always wins. Otherwise the user is
+    prompted, unless GitPush runs non-interactively.
+    """
+    value = getattr(options, name, None)
+    if value is not None:
+        return value
+    if options.non_interactive:
+        return default
+    return input(prompt)
+
+def format_commit_message(template, branch):
+    """Fill in the placeholders of a commit message template.
+
+    Only the documented placeholders are replaced; other braces in a
+    user's --message are kept as written.
+    """
+    now = datetime.now()
+    values = {
+        "timestamp": lambda: now.strftime("%Y-%m-%d %H:%M:%S"),
+        "date": lambda: now.strftime("%Y-%m-%d"),
+        "branch": lambda: branch,
+        "files": lambda: len(session.status().changed_paths()),
+    }
+    message = template
+    for name, value in values.items():
+        placeholder = "{" + name + "}"
+        if placeholder in message:
+            message = message.replace(placeholder, str(value()))
+    return message
+
+def select_branch(branches, options=None):
     """Prompt user to select a branch by number."""
+    options = options or parse_args([])
+    if options.branch or options.non_interactive:
+        branch = options.branch or "current"
+        return get_current_branch() if branch == "current" else branch
+
     print("\nAvailable remote branches:")
     for i, branch in enumerate(branches, 1):
         print(f"{i}. {branch}")
@@ -111,74 +576,86 @@ def select_branch(branches):
 
 def get_current_branch():
     """Get the name of the current branch."""
-    result = subprocess.run(["git", "branch", "--show-current"], capture_output=True, text=True)
-    return result.stdout.strip()
+    return session.status().branch
 
+@metrics.timed()
 def check_for_changes():
     """Check if there are any changes to commit, including untracked files."""
     print("\n=== Checking Git Status ===")
-    
-    # Get a detailed status
-    status_result = subprocess.run(["git", "status"], capture_output=True, text=True)
-    print(status_result.stdout)
-    
-    # Check for changes using porcelain format for scripting
-    result = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True)
-    changes = result.stdout.strip()
-    
-    # Also check git diff to catch any changes that might be missed
-    diff_result = subprocess.run(["git", "diff", "--name-only"], capture_output=True, text=True)
-    diff_changes = diff_result.stdout.strip()
-    
-    # Check for untracked files
-    untracked_result = subprocess.run(["git", "ls-files", "--others", "--exclude-standard"], capture_output=True, text=True)
-    untracked_files = untracked_result.stdout.strip()
-    
+    status = session.status()
+
+    branch_line = f"On branch {status.branch}" if status.branch else "HEAD detached"
+    if status.upstream:
+        branch_line += f" (tracking {status.upstream}, ahead {status.ahead}, behind {status.behind})"
+    print(branch_line)
+
     # Print diagnostic information
     print("\n=== Changes Summary ===")
-    if changes:
-        print("Modified/Staged files detected:")
-        print(changes)
-    if diff_changes:
+    if status.staged:
+        print("Staged files detected:")
+        for entry in status.staged:
+            print(f"  {entry.index} {entry.path}")
+    if status.unstaged:
         print("\nChanged files in working directory:")
-        print(diff_changes)
-    if untracked_files:
+        for entry in status.unstaged:
+            print(f"  {entry.worktree} {entry.path}")
+    if status.renamed:
+        print("\nRenamed files:")
+        for entry in status.renamed:
+            print(f"  {entry.orig_path} -> {entry.path}")
+    if status.conflicted:
+        print("\nConflicted files:")
+        for entry in status.conflicted:
+            print(f"  {entry.path}")
+    if status.untracked:
         print("\nUntracked files detected:")
-        print(untracked_files)
-    
-    # Return True if any changes detected by any method
-    return bool(changes or diff_changes or untracked_files)
+        for path in status.untracked:
+            print(f"  {path}")
+
+    return status.has_changes
 
-def handle_uncommitted_changes():
+@metrics.timed()
+def handle_uncommitted_changes(options=None):
     """Handle uncommitted changes before switching branches"""
+    options = options or parse_args([])
     if check_for_changes():
-        print("\nYou have uncommitted changes that need to be handled before switching branches.")
-        print("1. Commit changes to current branch")
-        print("2. Stash changes (save them for later)")
-        print("3. Discard changes")
-        print("4. Cancel operation")
-        
-        choice = input("\nHow would you like to handle these changes? (1/2/3/4): ")
+        policies = {"commit": "1", "stash": "2", "discard": "3", "abort": "4"}
+        if options.on_changes or options.non_interactive:
+            choice = policies[options.on_changes or "abort"]
+        else:
+            print("\nYou have uncommitted changes that need to be handled before switching branches.")
+            print("1. Commit changes to current branch")
+            print("2. Stash changes (save them for later)")
+            print("3. Discard changes")
+            print("4. Cancel operation")
+
+            choice = input("\nHow would you like to handle these changes? (1/2/3/4): ")
         
         if choice == "1":
-            commit_message = input("Enter a commit message: ")
-            subprocess.run(["git", "add", "-A"], check=True)
-            subprocess.run(["git", "commit", "-m", commit_message], check=True)
+            commit_message = ask(options, "message", "Enter a commit message: ", DEFAULT_COMMIT_TEMPLATE)
+            if options.message or options.non_interactive:
+                commit_message = format_commit_message(commit_message, get_current_branch())
+            session.mutate(["add", "-A"])
+            session.mutate(["commit", "-m", commit_message])
             print("Changes committed.")
             return True
         elif choice == "2":
-            stash_message = input("Enter a stash message (optional): ")
+            stash_message = ask(options, "stash_message", "Enter a stash message (optional): ", "")
             if stash_message:
-                subprocess.run(["git", "stash", "save", stash_message], check=True)
+                session.mutate(["stash", "save", stash_message])
             else:
-                subprocess.run(["git", "stash"], check=True)
+                session.mutate(["stash"])
             print("Changes stashed.")
             return True
         elif choice == "3":
-            confirm = input("Are you sure you want to discard all changes? This cannot be undone. (y/n): ").lower()
+            # Passing --on-changes discard is the confirmation
+            if options.on_changes == "discard":
+                confirm = 'y'
+            else:
+                confirm = input("Are you sure you want to discard all changes? This cannot be undone. (y/n): ").lower()
             if confirm == 'y':
-                subprocess.run(["git", "reset", "--hard"], check=True)
-                subprocess.run(["git", "clean", "-fd"], check=True)
+                session.mutate(["reset", "--hard"])
+                session.mutate(["clean", "-fd"])
                 print("Changes discarded.")
                 return True
             else:
@@ -192,12 +669,13 @@ def handle_uncommitted_changes():
             return False
     return True  # No changes to handle
 
-def ensure_gitignore():
-    """Ensure the .gitignore file exists and has all necessary entries"""
-    if not os.path.exists('.gitignore'):
-        print("Creating .gitignore file with standard exclusions")
-        with open('.gitignore', 'w') as f:
-            f.write("""# Python virtual environments
+# --- Ignore rules ---
+#
+# The rules below are merged into .gitignore and .git/info/exclude only when
+# something is missing, so repeated runs leave both files untouched and git
+# doesn't have to parse an ever-growing exclude file.
+
+GITIGNORE_TEMPLATE = """# Python virtual environments
 venv/
 env/
 ENV/
@@ -214,9 +692,9 @@ __pycache__/
 node_modules/
 jspm_packages/
 
-# Build output
+# Build output (build/ holds the Electron build resources, so it stays tracked)
 dist/
-build/
+dist-new/
 out/
 
 # Authentication information (sensitive)
@@ -242,6 +720,9 @@ whatsapp_auth/
 *.dat
 *.pyc
 
+# Local state of the Python services
+data/
+
 # Log files
 *.log
 npm-debug.log*
@@ -263,35 +744,224 @@ Desktop.ini
 
 # Electron distribution files
 *.asar
-""")
+"""
+
+EXCLUDE_HEADER = "# Force ignored patterns"
+FORCE_IGNORED_PATTERNS = ["venv/", "dist/", "node_modules/", "auth_info/", "service-account.json"]
+
+# Folders that must never be tracked, even if they were committed in the past
+UNTRACKED_DIRS = ["dist/", "venv/", "node_modules/", "modules/auth_info/"]
+
+def merge_ignore_rules(lines, rules, header):
+    """Return `lines` with duplicate rules dropped and missing `rules` appended.
+
+    A rule is only treated as a duplicate if no negation (!pattern) appears
+    between it and its first occurrence, so the file still ignores exactly
+    the same paths. Repeated copies of `header` are dropped too.
+    """
+    merged, seen = [], set()
+    header_seen = False
+    for line in lines:
+        rule = line.strip()
+        if rule == header:
+            if header_seen:
+                continue
+            header_seen = True
+        elif rule and not rule.startswith("#"):
+            if rule.startswith("!"):
+                seen.clear()
+            elif rule in seen:
+                continue
+            seen.add(rule)
+        merged.append(line.rstrip("\n"))
+
+    present = {line.strip() for line in merged}
+    missing = [rule for rule in rules if rule not in present]
+    if missing:
+        if merged and merged[-1].strip():
+            merged.append("")
+        if not header_seen:
+            merged.append(header)
+        merged.extend(missing)
+    return merged
+
+def sync_ignore_file(path, rules, header):
+    """Bring an ignore file in line with `rules`, writing only if it changed.
+
+    Returns True if the file was modified.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = None
+
+    lines = current.splitlines() if current else []
+    updated = "\n".join(merge_ignore_rules(lines, rules, header)) + "\n"
+    if updated == current:
+        return False
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(updated)
+    # Ignore rules decide which files git status reports as untracked
+    session.invalidate()
+    return True
+
+def template_rules(template):
+    return [line.strip() for line in template.splitlines() if line.strip() and not line.startswith("#")]
+
+@metrics.timed()
+def ensure_gitignore():
+    """Ensure the .gitignore file exists and has all necessary entries"""
+    if not os.path.exists('.gitignore'):
+        print("Creating .gitignore file with standard exclusions")
+        with open('.gitignore', 'w') as f:
+            f.write(GITIGNORE_TEMPLATE)
+        session.invalidate()
         print(".gitignore file created.")
+    elif sync_ignore_file('.gitignore', template_rules(GITIGNORE_TEMPLATE), "# Added by GitPush"):
+        print(".gitignore updated with missing entries.")
     else:
-        print(".gitignore file already exists.")
+        print(".gitignore file already up to date.")
+
+@metrics.timed()
+def ensure_exclude_rules():
+    """Make sure .git/info/exclude force-ignores the sensitive and bulky folders."""
+    if not os.path.isdir('.git'):
+        return
+    os.makedirs(os.path.join('.git', 'info'), exist_ok=True)
+    if sync_ignore_file(os.path.join('.git', 'info', 'exclude'), FORCE_IGNORED_PATTERNS, EXCLUDE_HEADER):
+        print("Updated .git/info/exclude.")
+
+@metrics.timed()
+def untrack_ignored_dirs():
+    """Stop tracking UNTRACKED_DIRS with one batched `git rm --cached`.
+
+    Nothing runs beyond a single ls-files lookup unless one of the folders
+    actually has tracked files.
+    """
+    result = session.run(["ls-files", "-z", "--"] + UNTRACKED_DIRS)
+    tracked = [path for path in result.stdout.split("\0") if path]
+    dirs = [d for d in UNTRACKED_DIRS if any(path.startswith(d) for path in tracked)]
+    if not dirs:
+        return []
+    session.mutate(["rm", "-r", "--cached", "--quiet", "--"] + dirs, check=False)
+    for d in dirs:
+        print(f"Removed {d} folder from git tracking.")
+    return dirs
+
+# --- Large file guard ---
+#
+# Scraper runs leave logs, sheet exports, Electron builds and WhatsApp media
+# in the folder. Before anything is staged, every path `git add -A` would pick
+# up is checked against a size limit, with a lower limit for binary content.
+
+LARGE_FILE_LIMIT_MB = 50
+BINARY_FILE_LIMIT_MB = 5
+LARGE_FILE_POLICIES = ["skip", "refuse", "lfs", "commit"]
+
+# Leading bytes of the binary formats we usually find in the folder
+MAGIC_NUMBERS = [
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"OggS", "audio/ogg"),
+    (b"%PDF", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"MZ", "application/x-msdownload"),
+    (b"\x7fELF", "application/x-executable"),
+    (b"SQLite format 3", "application/x-sqlite3"),
+]
+
+LargeFile = namedtuple("LargeFile", ["path", "size", "content_type", "limit"])
+
+def sniff_content_type(path, sample_size=8192):
+    """Guess a file's content type from its first bytes."""
+    if path.endswith(".asar"):
+        return "application/x-asar"
+    with open(path, "rb") as f:
+        head = f.read(sample_size)
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream" if b"\0" in head else "text/plain"
+
+def _check_file(path, large_limit, binary_limit):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        # Deleted or unreadable; nothing to stage
+        return None
+    if size <= binary_limit:
+        return None
+    content_type = sniff_content_type(path)
+    limit = large_limit if content_type == "text/plain" else binary_limit
+    if size > limit:
+        return LargeFile(path, size, content_type, limit)
+    return None
+
+@metrics.timed()
+def scan_large_files(paths, large_limit_mb=LARGE_FILE_LIMIT_MB, binary_limit_mb=BINARY_FILE_LIMIT_MB):
+    """Return the paths that exceed their size limit, largest first.
+
+    Files are checked in parallel; only files above the binary limit have
+    their content sniffed, so small files cost a single stat.
+    """
+    large_limit = large_limit_mb * 1024 * 1024
+    binary_limit = min(binary_limit_mb, large_limit_mb) * 1024 * 1024
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        found = pool.map(lambda path: _check_file(path, large_limit, binary_limit), paths)
+        offenders = [item for item in found if item]
+    return sorted(offenders, key=lambda item: item.size, reverse=True)
+
+def print_large_files(offenders, limit=10):
+    print(f"\n=== {len(offenders)} file(s) over the size limit ===")
+    for item in offenders[:limit]:
+        print(f"{item.size / (1024 * 1024):9.1f} MB  {item.content_type:<26} {item.path}")
+    if len(offenders) > limit:
+        print(f"... and {len(offenders) - limit} more")
+
+def git_lfs_available():
+    return session.run(["lfs", "version"]).returncode == 0
+
+@metrics.timed()
+def push_to_git(options=None):
+    """Automate Git add, commit, and push with user input.
+
+    Returns a result dict describing what happened; with --json it is printed
+    for the caller (e.g. a scheduler) to inspect.
+    """
+    options = options or parse_args([])
+    result = {"repo": REPO_PATH, "status": "ok", "branch": None, "action": None,
+              "commit": None, "pushed": False, "message": ""}
 
-def push_to_git():
-    """Automate Git add, commit, and push with user input."""
     # Make sure .gitignore is present and properly configured
     ensure_gitignore()
     
     # Make sure git respects the .gitignore file
-    subprocess.run(["git", "config", "core.excludesfile", ".gitignore"], check=True)
+    session.set_config("core.excludesfile", ".gitignore")
     
     # Refresh the ignore list
-    if os.path.exists('.git/info/exclude'):
-        with open('.git/info/exclude', 'r+') as f:
-            content = f.read()
-            f.seek(0, 0)
-            f.write("# Force ignored patterns\n")
-            f.write("venv/\ndist/\nnode_modules/\nauth_info/\nservice-account.json\n")
-            f.write(content)
+    ensure_exclude_rules()
+
+    if options.sparse and not apply_sparse_profile(options.sparse):
+        result.update(status="error", message=f"Unknown sparse-checkout profile '{options.sparse}'.")
+        return result
     
     # Get available branches
-    branches = get_branches()
+    branches = get_branches(options)
     
     # Let user select which branch to work with
-    selected_branch = select_branch(branches)
+    selected_branch = select_branch(branches, options)
     if not selected_branch:
-        return
+        result.update(status="error", message="No branch selected.")
+        return result
+    result["branch"] = selected_branch
     
     print(f"\n=== Selected branch: {selected_branch} ===")
     
@@ -301,128 +971,150 @@ def push_to_git():
     # Check if the selected branch exists remotely
     remote_branches = [b for b in branches if b == selected_branch]
     branch_exists_remotely = len(remote_branches) > 0
+    if branch_exists_remotely and options.single_branch:
+        print(f"Fetching origin/{selected_branch}...")
+        fetch_branch(selected_branch, options)
     
     # Check if we're already on the selected branch
     if current_branch != selected_branch:
         print(f"Current branch is '{current_branch}', switching to '{selected_branch}'...")
         
         # Handle uncommitted changes before switching
-        if not handle_uncommitted_changes():
+        if not handle_uncommitted_changes(options):
             print("Branch switch cancelled. Please handle your uncommitted changes first.")
-            return
+            result.update(status="cancelled", message="Uncommitted changes were not handled.")
+            return result
     
         # Check if the selected branch exists locally
-        result = subprocess.run(["git", "branch", "--list", selected_branch], capture_output=True, text=True)
-        local_branch_exists = bool(result.stdout.strip())
+        local_branch_exists = selected_branch in session.local_branches()
         
         if not local_branch_exists:
             if branch_exists_remotely:
                 print(f"Local branch '{selected_branch}' doesn't exist. Creating and tracking the remote branch.")
                 try:
-                    subprocess.run(["git", "checkout", "-b", selected_branch, f"origin/{selected_branch}"], check=True)
+                    session.mutate(["checkout", "-b", selected_branch, f"origin/{selected_branch}"])
                     print(f"Created and switched to local branch '{selected_branch}'.")
                 except subprocess.CalledProcessError:
                     # Fallback if remote tracking fails
                     print(f"Error tracking remote branch. Creating local branch '{selected_branch}' instead.")
-                    subprocess.run(["git", "checkout", "-b", selected_branch], check=True)
+                    session.mutate(["checkout", "-b", selected_branch])
                     print(f"Created new local branch '{selected_branch}'.")
             else:
                 print(f"Creating new local branch '{selected_branch}'...")
-                subprocess.run(["git", "checkout", "-b", selected_branch], check=True)
+                session.mutate(["checkout", "-b", selected_branch])
                 print(f"Created new local branch '{selected_branch}'.")
         else:
             # Make sure we're on the selected branch
             print(f"Checking out local branch '{selected_branch}'...")
-            subprocess.run(["git", "checkout", selected_branch], check=True)
+            session.mutate(["checkout", selected_branch])
             print(f"Switched to branch '{selected_branch}'")
     else:
         print(f"Already on branch '{selected_branch}'")
     
     # Try to pull latest changes from remote if the branch exists remotely
-    if branch_exists_remotely:
-        try:
-            print(f"Pulling latest changes from origin/{selected_branch}...")
-            subprocess.run(["git", "pull", "origin", selected_branch], check=True)
-        except subprocess.CalledProcessError:
-            print(f"Warning: Could not pull latest changes from origin/{selected_branch}.")
+    if branch_exists_remotely and not pull_branch(selected_branch, options):
+        result.update(status="error", message=f"Could not pull latest changes from origin/{selected_branch}.")
+        return result
 
-    print(f"\nDo you want to push updates to '{selected_branch}' or overwrite this folder with the branch's files?")
-    print("1. Push updates to the branch")
-    print("2. Overwrite content in the folder with the selected branch")
-    
-    choice = input("\nEnter your choice (1 or 2): ")
+    choice = options.action or None
+    if choice is None and not options.non_interactive:
+        print(f"\nDo you want to push updates to '{selected_branch}' or overwrite this folder with the branch's files?")
+        print("1. Push updates to the branch")
+        print("2. Overwrite content in the folder with the selected branch")
+
+        choice = {"1": "push", "2": "overwrite"}.get(input("\nEnter your choice (1 or 2): "))
+    elif choice is None:
+        choice = "push"
+    result["action"] = choice
     
-    if choice == "1":
+    if choice == "push":
+        # Exports are excluded once snapshotted, so record them before looking for changes
+        if options.snapshot:
+            print("\nRecording data snapshots...")
+            snapshot_exports(options.snapshot, options.snapshot_dir, f"GitPush sync of {selected_branch}")
+
         # Check for changes before attempting to commit
         has_changes = check_for_changes()
         
         if not has_changes:
             # Even if no changes detected, give user option to force commit
-            force_commit = input("\nNo significant changes detected by Git. Force commit anyway? (y/n): ").lower()
-            if force_commit != 'y':
-                return
+            force_commit = ask(options, "force_commit",
+                               "\nNo significant changes detected by Git. Force commit anyway? (y/n): ", False)
+            if force_commit is not True and str(force_commit).lower() != 'y':
+                result.update(status="nothing_to_commit", message="No changes detected.")
+                return result
                 
-        print("\n=== Files to be included in commit ===")
-        # Show all tracked files that will be included
-        subprocess.run(["git", "ls-files"], check=True)
+        if not options.non_interactive:
+            print("\n=== Files to be included in commit ===")
+            # Show all tracked files that will be included
+            session.run(["ls-files"], check=True, capture=False)
         
         # Ask if user wants to exclude large binary files (like dist folder)
-        exclude_large_files = input("\nExclude large binary files from commit (recommended)? (y/n): ").lower() == 'y'
+        exclude_large_files = ask(options, "exclude_large",
+                                  "\nExclude large binary files from commit (recommended)? (y/n): ", True)
+        exclude_large_files = exclude_large_files is True or str(exclude_large_files).lower() == 'y'
         
         if exclude_large_files:
             print("\nExcluding large binary files as specified in .gitignore...")
-            # Make git respect the .gitignore file
-            subprocess.run(["git", "config", "core.excludesfile", ".gitignore"], check=True)
-            
             # Explicitly exclude common large directories/files
-            try:
-                subprocess.run(["git", "rm", "-r", "--cached", "dist/"], check=False)
-                print("Removed dist/ folder from git tracking.")
-            except:
-                pass
-                
-            try:
-                subprocess.run(["git", "rm", "-r", "--cached", "venv/"], check=False)
-                print("Removed venv/ folder from git tracking.")
-            except:
-                pass
-                
-            try:
-                subprocess.run(["git", "rm", "-r", "--cached", "node_modules/"], check=False)
-                print("Removed node_modules/ folder from git tracking.")
-            except:
-                pass
-                
-            try:
-                subprocess.run(["git", "rm", "-r", "--cached", "modules/auth_info/"], check=False)
-                print("Removed auth_info folder from git tracking.")
-            except:
-                pass
+            untrack_ignored_dirs()
+
+        # Check what's about to be staged before git copies it into the object store
+        offenders = scan_large_files(session.status().changed_paths(),
+                                     options.max_file_size, options.max_binary_size)
+        held_back = []
+        if offenders:
+            print_large_files(offenders)
+            result["large_files"] = [{"path": item.path, "size": item.size, "content_type": item.content_type}
+                                     for item in offenders]
+            policy = ask(options, "large_files",
+                         f"\nHow should these files be handled? ({'/'.join(LARGE_FILE_POLICIES)}): ", "skip")
+            policy = policy.strip().lower()
+            if policy == "lfs" and not git_lfs_available():
+                print("Git LFS is not installed; refusing to commit the large files.")
+                policy = "refuse"
+            if policy == "refuse" or policy not in LARGE_FILE_POLICIES:
+                print("Commit cancelled. Move the files above out of the folder or add them to .gitignore.")
+                result.update(status="cancelled", message="Files over the size limit would be committed.")
+                return result
+            if policy == "skip":
+                held_back = [item.path for item in offenders]
+                print("These files will be left out of the commit.")
+            elif policy == "lfs":
+                session.mutate(["lfs", "track", "--"] + [item.path for item in offenders])
+                print("Tracking the files above with Git LFS.")
 
         # Push local changes to the selected branch
-        commit_message = input("\nEnter commit message: ")
+        commit_message = ask(options, "message", "\nEnter commit message: ", DEFAULT_COMMIT_TEMPLATE)
+        if options.message or options.non_interactive:
+            commit_message = format_commit_message(commit_message, selected_branch)
         print(f"\nYou selected to push updates to branch: {selected_branch}")
         print(f"Commit message: {commit_message}")
         
-        # Use -A to include ALL changes including untracked files (except those in .gitignore)
-        if exclude_large_files:
-            # Add only non-ignored files (respecting .gitignore)
-            subprocess.run(["git", "add", "-A", "."], check=True)
-        else:
-            # Add everything including potentially large files
-            subprocess.run(["git", "add", "-A", "."], check=True)
+        # Use -A to include ALL changes including untracked files (except those in .gitignore).
+        # Held-back files are excluded by pathspec, so git never hashes them into the object store
+        session.mutate(["add", "-A", "--", "."] + [f":(top,exclude,literal){path}" for path in held_back])
             
         # Show what's actually staged for commit
         print("\n=== Files staged for commit ===")
-        subprocess.run(["git", "diff", "--name-only", "--cached"], check=True)
+        session.run(["diff", "--name-only", "--cached"], check=True, capture=False)
             
         # Only commit if there are staged changes
-        commit_result = subprocess.run(["git", "commit", "-m", commit_message], capture_output=True, text=True)
+        commit_cmd = ["commit", "-m", commit_message]
+        if not has_changes:
+            commit_cmd.append("--allow-empty")
+        commit_result = session.mutate(commit_cmd, check=False, capture=True)
         print(commit_result.stdout)
         
         if "nothing to commit" in commit_result.stdout:
             print("No changes to commit. Make sure you've added files to the repository.")
-            return
+            result.update(status="nothing_to_commit", message="Nothing to commit.")
+            return result
+        if commit_result.returncode != 0:
+            print(commit_result.stderr)
+            result.update(status="error", message="git commit failed.")
+            return result
+        result["commit"] = session.run(["rev-parse", "HEAD"]).stdout.strip()
             
         # For a new branch, set upstream
         push_cmd = ["git", "push"]
@@ -435,8 +1127,9 @@ def push_to_git():
         # Try pushing with a size limit
         try:
             print("\nAttempting to push to remote repository...")
-            subprocess.run(push_cmd, check=True)
+            session.mutate(push_cmd[1:])
             print(f"\nUpdates successfully pushed to {selected_branch}!")
+            result["pushed"] = True
         except subprocess.CalledProcessError:
             print("\nPush failed - likely due to large files. Trying with a single commit...")
             try:
@@ -446,8 +1139,9 @@ def push_to_git():
                 else:
                     push_cmd = ["git", "push", "--no-thin", "origin", selected_branch]
                     
-                subprocess.run(push_cmd, check=True)
+                session.mutate(push_cmd[1:])
                 print(f"\nUpdates successfully pushed to {selected_branch}!")
+                result["pushed"] = True
             except subprocess.CalledProcessError:
                 print("\nPush still failed. Please manually push or check your repository settings.")
                 print("You may need to use Git LFS for large files or increase server limits.")
@@ -457,44 +1151,318 @@ def push_to_git():
                     print(f"git push --set-upstream origin {selected_branch}")
                 else:
                     print(f"git push origin {selected_branch}")
+                result.update(status="error", message="Changes committed locally but push failed.")
 
-    elif choice == "2" and branch_exists_remotely:
+    elif choice == "overwrite" and branch_exists_remotely:
         # Overwrite local folder with remote branch content
         print(f"\nYou selected to overwrite the folder content with files from '{selected_branch}'...")
 
         # Ensure local changes are safely discarded
-        subprocess.run(["git", "reset", "--hard"], check=True)
-        subprocess.run(["git", "clean", "-fd"], check=True)
+        session.mutate(["reset", "--hard"])
+        session.mutate(["clean", "-fd"])
 
-        # Fetch latest branch data
-        subprocess.run(["git", "fetch", "origin"], check=True)
+        # Fetch latest branch data (skipped if already fetched this run)
+        fetch_branch(selected_branch, options, check=True)
 
         # Force checkout the selected branch
-        subprocess.run(["git", "checkout", "-B", selected_branch, f"origin/{selected_branch}"], check=True)
+        session.mutate(["checkout", "-B", selected_branch, f"origin/{selected_branch}"])
 
         print(f"\nContent from 'origin/{selected_branch}' successfully overwritten locally!")
-    elif choice == "2" and not branch_exists_remotely:
+        result["commit"] = session.status().head
+    elif choice == "overwrite" and not branch_exists_remotely:
         print(f"Cannot overwrite with remote branch because '{selected_branch}' doesn't exist remotely yet.")
+        result.update(status="error", message=f"'{selected_branch}' doesn't exist remotely.")
     else:
         print("Invalid choice. Exiting...")
+        result.update(status="cancelled", message="Invalid choice.")
+    return result
 
-if __name__ == "__main__":
+@metrics.timed()
+def pull_branch(branch, options):
+    """Pull the branch from origin, applying the conflict policy on failure.
+
+    Returns False when the run should stop.
+    """
+    policy = options.on_conflict or ("abort" if options.non_interactive else "continue")
+    pull_cmd = ["pull", "origin", branch]
+    if policy == "rebase":
+        pull_cmd.insert(1, "--rebase")
+    if session.fetch_options:
+        # `git pull` would fetch again without the partial-fetch flags, so
+        # merge the branch as fetched this run instead
+        pull_cmd = ["rebase" if policy == "rebase" else "merge", f"origin/{branch}"]
     try:
-        # Initialize the Git repository if necessary
-        check_and_init_git()
-        
-        # Ensure the remote URL is correctly set
-        set_remote_url()
-        
-        # Fetch the latest branches from the remote repository
-        print("Fetching remote branches...")
-        fetch_result = subprocess.run(["git", "fetch", "origin"], capture_output=True, text=True)
-        if fetch_result.stdout:
-            print(fetch_result.stdout)
-        
-        # Start the main function
-        push_to_git()
-        
-    except Exception as e:
-        print(f"\n=== ERROR ===\n{str(e)}\n")
-        traceback.print_exc()
+        print(f"Pulling latest changes from origin/{branch}...")
+        if session.fetch_options:
+            fetch_branch(branch, options, check=True)
+        session.mutate(pull_cmd)
+        return True
+    except subprocess.CalledProcessError:
+        print(f"Warning: Could not pull latest changes from origin/{branch}.")
+    if policy == "continue":
+        return True
+
+    # Leave the working tree as it was before the pull
+    if policy == "rebase":
+        session.mutate(["rebase", "--abort"], check=False)
+    else:
+        session.mutate(["merge", "--abort"], check=False)
+    return False
+
+# --- Multi-repository mode ---
+#
+# With --manifest, GitPush runs itself once per listed repository (the script
+# always works on its current directory) on a bounded thread pool, and prints
+# one table with every result. The runs share an SSH ControlMaster, so only
+# the first one opens a connection to the git host; HTTPS remotes share
+# whatever credential helper git is configured with.
+
+# Options passed on to each repository's run when given on the command line
+FORWARDED_OPTIONS = [("action", "--action"), ("message", "--message"), ("on_changes", "--on-changes"),
+                     ("on_conflict", "--on-conflict"), ("large_files", "--large-files"),
+                     ("max_file_size", "--max-file-size"), ("max_binary_size", "--max-binary-size"),
+                     ("depth", "--depth"), ("filter", "--filter"), ("sparse", "--sparse"),
+                     ("snapshot_dir", "--snapshot-dir")]
+FORWARDED_FLAGS = [("force_commit", True, "--force-commit"), ("exclude_large", False, "--include-large"),
+                   ("single_branch", True, "--single-branch")]
+OK_STATUSES = ("ok", "nothing_to_commit")
+
+def load_manifest(path):
+    """Repository entries from a JSON manifest.
+
+    The manifest is a list of entries, or {"defaults": {...}, "repos": [...]}.
+    An entry is a folder path or an object with "path" and optionally "name",
+    "branch", "message", "remote" (the origin URL to add if the repository
+    has none) and "args" (extra GitPush arguments). Relative paths are
+    relative to the manifest.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        data = data.get("repos", [])
+    base = os.path.dirname(os.path.abspath(path))
+    entries, seen = [], set()
+    for i, item in enumerate(data, 1):
+        if not isinstance(item, (str, dict)):
+            raise ValueError(f"entry {i} in {path} is neither a path nor an object")
+        entry = dict(defaults, **({"path": item} if isinstance(item, str) else item))
+        if not entry.get("path"):
+            raise ValueError(f"entry {i} in {path} has no \"path\"")
+        entry["path"] = os.path.normpath(os.path.join(base, os.path.expanduser(entry["path"])))
+        if entry["path"] in seen:
+            raise ValueError(f"{entry['path']} is listed twice in {path}")
+        seen.add(entry["path"])
+        entry.setdefault("name", os.path.basename(entry["path"]))
+        entries.append(entry)
+    return entries
+
+def child_command(entry, options):
+    """The GitPush command line for one manifest entry."""
+    command = [sys.executable, os.path.abspath(__file__), "--non-interactive", "--json", "--existing-repo"]
+    for attr, flag in FORWARDED_OPTIONS:
+        value = getattr(options, attr)
+        if value is not None:
+            command += [flag, str(value)]
+    for attr, value, flag in FORWARDED_FLAGS:
+        if getattr(options, attr) is value:
+            command.append(flag)
+    for export in options.snapshot or []:
+        command += ["--snapshot", export]
+    if entry.get("branch"):
+        command += ["--branch", entry["branch"]]
+    if entry.get("message"):
+        command += ["--message", entry["message"]]
+    if entry.get("remote"):
+        command += ["--remote", entry["remote"]]
+    return command + list(entry.get("args", []))
+
+def shared_git_env(control_dir):
+    """Environment for the child runs: no prompts, and one multiplexed SSH connection."""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    # Windows' OpenSSH has no ControlMaster; a user's own GIT_SSH_COMMAND wins
+    if sys.platform != "win32" and "GIT_SSH_COMMAND" not in os.environ:
+        env["GIT_SSH_COMMAND"] = (f"ssh -o ControlMaster=auto -o ControlPath={control_dir}/%C "
+                                  "-o ControlPersist=60")
+    return env
+
+def open_shared_connection(entries, env):
+    """Connect once before the pool starts, so the runs reuse the master instead of racing to open one."""
+    if "GIT_SSH_COMMAND" not in env:
+        return
+    for entry in entries:
+        if not os.path.isdir(os.path.join(entry["path"], ".git")):
+            continue
+        url = subprocess.run(["git", "ls-remote", "--get-url", "origin"], cwd=entry["path"],
+                             capture_output=True, text=True).stdout.strip()
+        if url.startswith(("ssh://", "git@")) or re.match(r"^[\w.-]+@[\w.-]+:", url):
+            print(f"Opening a shared SSH connection for {url}...")
+            try:
+                subprocess.run(["git", "ls-remote", "--heads", "origin"], cwd=entry["path"], env=env,
+                               capture_output=True, timeout=60)
+            except subprocess.TimeoutExpired:
+                print("Warning: could not open the shared SSH connection; each run will connect itself.")
+            return
+
+def sync_repo(entry, options, env):
+    """Run GitPush in one repository; returns its row for the results table."""
+    row = {"name": entry["name"], "path": entry["path"], "branch": entry.get("branch"), "status": "error",
+           "commit": None, "pushed": False, "message": "", "seconds": 0.0, "log": []}
+    start = time.perf_counter()
+    with metrics.span("repo", repo=entry["name"]):
+        if not os.path.isdir(entry["path"]):
+            row["message"] = "Folder not found."
+            return row
+        if not os.path.isdir(os.path.join(entry["path"], ".git")):
+            row["message"] = "Not a Git repository; run GitPush in it on its own first."
+            return row
+        try:
+            process = subprocess.run(child_command(entry, options), cwd=entry["path"], env=env,
+                                     capture_output=True, text=True, timeout=options.repo_timeout)
+        except subprocess.TimeoutExpired:
+            row["message"] = f"Timed out after {options.repo_timeout:g}s."
+        else:
+            lines = process.stdout.strip().splitlines()
+            try:
+                result = json.loads(lines[-1]) if lines else None
+            except ValueError:
+                result = None
+            if result:
+                for key in ("status", "branch", "commit", "pushed", "message"):
+                    row[key] = result.get(key, row[key])
+            else:
+                row["message"] = f"GitPush gave no result (exit code {process.returncode})."
+            row["log"] = process.stderr.strip().splitlines()[-15:]
+    row["seconds"] = round(time.perf_counter() - start, 2)
+    return row
+
+def print_results_table(results, elapsed):
+    headers = ("repo", "branch", "status", "commit", "pushed", "seconds")
+    rows = [(row["name"], row["branch"] or "-", row["status"], (row["commit"] or "-")[:8],
+             "yes" if row["pushed"] else "no", f"{row['seconds']:.1f}") for row in results]
+    widths = [max([len(header)] + [len(cells[i]) for cells in rows]) for i, header in enumerate(headers)]
+    print()
+    for cells in [headers, ["-" * width for width in widths]] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(cells, widths)).rstrip())
+
+    failed = [row for row in results if row["status"] not in OK_STATUSES]
+    total = sum(row["seconds"] for row in results)
+    print(f"\n{len(results) - len(failed)} of {len(results)} repositories synced in {elapsed:.1f}s "
+          f"({total:.1f}s if run one after another)")
+    for row in failed:
+        print(f"\n=== {row['name']}: {row['status']} - {row['message']} ===")
+        for line in row["log"]:
+            print(f"    {line}")
+
+def push_all(entries, options):
+    """Sync every manifest entry; returns their result rows in manifest order."""
+    if not entries:
+        print(f"No repositories listed in {options.manifest}.")
+        return []
+    jobs = max(1, min(options.jobs, len(entries)))
+    control_dir = tempfile.mkdtemp(prefix="gitpush-ssh-")
+    env = shared_git_env(control_dir)
+    print(f"Syncing {len(entries)} repositories, {jobs} at a time...")
+    start = time.perf_counter()
+    results = {}
+    try:
+        open_shared_connection(entries, env)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(metrics.bind(sync_repo), entry, options, env) for entry in entries]
+            for future in as_completed(futures):
+                row = future.result()
+                results[row["path"]] = row
+                print(f"[{len(results)}/{len(entries)}] {row['name']}: {row['status']} ({row['seconds']:.1f}s)")
+    finally:
+        shutil.rmtree(control_dir, ignore_errors=True)
+    results = [results[entry["path"]] for entry in entries]
+    print_results_table(results, time.perf_counter() - start)
+    return results
+
+def report_metrics(options):
+    """Print the profile and write the metrics file, as requested on the command line."""
+    if options.profile:
+        metrics.print_profile()
+    if options.metrics_out:
+        try:
+            metrics.export(options.metrics_out)
+        except Exception as e:
+            print(f"Warning: could not write metrics to {options.metrics_out}: {e}")
+
+def run_manifest(options, out):
+    """main() for --manifest: sync every listed repository and report them together."""
+    results = []
+    with contextlib.redirect_stdout(out):
+        try:
+            entries = load_manifest(options.manifest)
+        except (OSError, ValueError) as e:
+            print(f"Could not read the manifest {options.manifest}: {e}")
+            failed = True
+        else:
+            try:
+                results = push_all(entries, options)
+            finally:
+                report_metrics(options)
+            failed = any(row["status"] not in OK_STATUSES for row in results)
+    if options.json:
+        print(json.dumps({"manifest": os.path.abspath(options.manifest), "status": "error" if failed else "ok",
+                          "repos": results}, ensure_ascii=False))
+    return 1 if failed else 0
+
+def main(argv=None):
+    options = parse_args(argv)
+    # With --json, stdout carries only the result; everything else goes to stderr
+    out = sys.stderr if options.json else sys.stdout
+    if options.json:
+        session.stdout = sys.stderr
+    if options.profile or options.metrics_out:
+        metrics.enable()
+    session.fetch_options = fetch_options(options)
+    if options.manifest:
+        return run_manifest(options, out)
+
+    result = {"repo": REPO_PATH, "status": "error", "message": ""}
+    with contextlib.redirect_stdout(out):
+        print("=== GitPush Script Starting ===")
+        print(f"Python version: {sys.version}")
+        print(f"Working with repository at: {REPO_PATH}")
+        try:
+            # Initialize the Git repository if necessary
+            check_and_init_git(options)
+
+            # Ensure the remote URL is correctly set
+            set_remote_url(options)
+
+            # Fetch the latest branches from the remote repository
+            if options.single_branch:
+                print("Listing remote branches; only the selected one will be fetched.")
+            else:
+                print("Fetching remote branches...")
+                with metrics.span("fetch"):
+                    fetch_result = session.fetch("origin")
+                if fetch_result and fetch_result.stdout:
+                    print(fetch_result.stdout)
+
+            # Start the main function
+            result = push_to_git(options)
+
+        except Exception as e:
+            print(f"\n=== ERROR ===\n{str(e)}\n")
+            traceback.print_exc()
+            result["message"] = str(e)
+        finally:
+            if options.profile:
+                session.report_timings()
+            metrics.count("runs", status=result["status"])
+            report_metrics(options)
+
+    if options.json:
+        result["git_commands"] = len(session.timings)
+        if options.profile:
+            result["profile"] = metrics.phases()
+        print(json.dumps(result, ensure_ascii=False))
+    return 0 if result["status"] in ("ok", "nothing_to_commit") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,18 @@
+import argparse
+import hashlib
+import json
 import subprocess
 import os
+import shutil
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import Metrics
+
+# Step timings; recorded only with --profile or --metrics-out
+metrics = Metrics('install')
 
 def check_python_version():
     """Check if Python version is 3.8 or higher"""
@@ -8,6 +20,7 @@ def check_python_version():
         print("Error: Python 3.8 or higher is required")
         sys.exit(1)
 
+@metrics.timed()
 def check_node_version():
     """Check if Node.js is installed and version is 16 or higher"""
     try:
@@ -16,10 +29,12 @@ def check_node_version():
         if version_num < 16:
             print("Error: Node.js 16 or higher is required")
             sys.exit(1)
+        return node_version
     except:
         print("Error: Node.js is not installed")
         sys.exit(1)
 
+@metrics.timed()
 def create_venv():
     """Create and activate virtual environment"""
     if not os.path.exists('venv'):
@@ -37,41 +52,365 @@ def create_venv():
     else:
         print(f"    source ./venv/bin/activate")
 
-def install_dependencies():
-    """Install all required dependencies"""
-    commands = [
-        "pip install -r requirements.txt",  # Install Python dependencies
-        "npm init -y",  # Initialize npm
-        "npm install @whiskeysockets/baileys@6.5.0",  # Install specific version of baileys
-        "npm install qrcode-terminal@0.12.0",  # QR code generation
-        "npm install googleapis@129.0.0 dotenv@16.3.1",  # Google Sheets and env
-        "npm install openai@4.28.0",  # OpenAI for AI features
-        "npm install electron@28.2.0 --save-dev",  # Electron for UI
-    ]
+# Pinned npm packages; dev dependencies are marked with True
+NPM_PACKAGES = [
+    ("@whiskeysockets/baileys", "6.5.0", False),  # WhatsApp connection
+    ("qrcode-terminal", "0.12.0", False),  # QR code generation
+    ("googleapis", "129.0.0", False),  # Google Sheets
+    ("dotenv", "16.3.1", False),  # Environment variables
+    ("openai", "4.28.0", False),  # OpenAI for AI features
+    ("electron", "28.2.0", True),  # Electron for UI
+]
+
+def venv_python():
+    """Return the virtual environment's interpreter, falling back to this one."""
+    if sys.platform == 'win32':
+        path = os.path.join('venv', 'Scripts', 'python.exe')
+    else:
+        path = os.path.join('venv', 'bin', 'python')
+    return path if os.path.exists(path) else sys.executable
+
+def npm_command():
+    """Resolve npm so it can run without a shell (npm.cmd on Windows)."""
+    return shutil.which('npm') or 'npm'
+
+@metrics.timed()
+def ensure_package_json():
+    """Make sure package.json lists every npm package at its pinned version.
+
+    Pins are recorded as exact versions, so a single `npm install` resolves
+    the whole tree at once and installs what `npm install name@version`
+    used to. An entry at another version is reset to the pin.
+    Returns True if package.json was written.
+    """
+    if os.path.exists('package.json'):
+        with open('package.json', encoding='utf-8') as f:
+            package = json.load(f)
+    else:
+        package = {"name": os.path.basename(os.getcwd()).lower(), "version": "1.0.0"}
+
+    changed = not os.path.exists('package.json')
+    for name, version, dev in NPM_PACKAGES:
+        section = package.setdefault('devDependencies' if dev else 'dependencies', {})
+        current = section.get(name)
+        if current == version:
+            continue
+        if current is not None:
+            print(f"Pinning {name} to {version} (package.json had {current})")
+        section[name] = version
+        changed = True
+
+    if changed:
+        with open('package.json', 'w', encoding='utf-8') as f:
+            json.dump(package, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    return changed
+
+def pip_install_command(cache_dir=None):
+    command = [venv_python(), '-m', 'pip', 'install', '-r', 'requirements.txt']
+    if cache_dir:
+        command += ['--cache-dir', os.path.join(cache_dir, 'pip')]
+    return command
+
+def npm_install_command(cache_dir=None):
+    command = [npm_command(), 'install', '--prefer-offline', '--no-audit', '--no-fund']
+    if cache_dir:
+        command += ['--cache', os.path.join(cache_dir, 'npm')]
+    return command
+
+def run_step(name, command, env=None):
+    """Run one install step, returning (name, seconds, completed process)."""
+    print(f"\nRunning: {' '.join(command)}")
+    start = time.perf_counter()
+    with metrics.span('step', step=name):
+        result = subprocess.run(command, capture_output=True, text=True,
+                                env=dict(os.environ, **env) if env else None)
+    if result.returncode != 0:
+        metrics.count('step_failures', step=name)
+    return name, time.perf_counter() - start, result
+
+# --- Offline bundles ---
+#
+# A bundle is built on a connected machine and copied to hosts without
+# reliable internet. Its layout:
+#   wheels/           wheels for requirements.txt
+#   npm-cache/        npm cache holding the tarball of every package in the tree
+#   electron-cache/   Electron binary downloaded by its install script
+#   package-lock.json the tree the cache was filled from
+#   manifest.json     versions plus a sha256 for every file above
+
+BUNDLE_MANIFEST = 'manifest.json'
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _bundle_files(bundle):
+    for root, _, files in os.walk(bundle):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, bundle).replace(os.sep, '/')
+            if rel != BUNDLE_MANIFEST:
+                yield rel, path
+
+def bundle_npm_env(bundle):
+    return {'electron_config_cache': os.path.join(bundle, 'electron-cache')}
+
+@metrics.timed()
+def build_bundle(output, node_version=None, pip_platform=None, python_version=None):
+    """Download everything an install needs into `output` and write its manifest.
+
+    pip_platform/python_version fetch wheels for a different target, e.g.
+    building a Windows bundle on Linux.
+    """
+    output = os.path.abspath(output)
+    os.makedirs(output, exist_ok=True)
+    ensure_package_json()
+
+    pip_cmd = [sys.executable, '-m', 'pip', 'download', '-r', 'requirements.txt',
+               '-d', os.path.join(output, 'wheels')]
+    if pip_platform or python_version:
+        pip_cmd += ['--only-binary=:all:']
+        if pip_platform:
+            pip_cmd += ['--platform', pip_platform]
+        if python_version:
+            pip_cmd += ['--python-version', python_version]
+
+    # Resolve the npm tree in a scratch folder so the checkout's node_modules
+    # is left alone; the install fills the bundle's cache as a side effect.
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in ('package.json', 'package-lock.json'):
+            if os.path.exists(name):
+                shutil.copy(name, scratch)
+        npm_cmd = [npm_command(), 'install', '--prefix', scratch, '--no-audit', '--no-fund',
+                   '--cache', os.path.join(output, 'npm-cache')]
+        failed = run_steps([
+            ("pip", pip_cmd),
+            ("npm", npm_cmd, bundle_npm_env(output)),
+        ])
+        if failed:
+            sys.exit(1)
+        shutil.copy(os.path.join(scratch, 'package-lock.json'), output)
+
+    manifest = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": python_version or f"{sys.version_info.major}.{sys.version_info.minor}",
+        "platform": pip_platform or sys.platform,
+        "node": node_version,
+        "npm_packages": [f"{name}@{version}" for name, version, _ in NPM_PACKAGES],
+        "files": {rel: _sha256_file(path) for rel, path in sorted(_bundle_files(output))},
+    }
+    with open(os.path.join(output, BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"\nBundle written to {output} ({len(manifest['files'])} files)")
+
+@metrics.timed()
+def verify_bundle(bundle):
+    """Check every file in the bundle against its manifest hash."""
+    manifest_path = os.path.join(bundle, BUNDLE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        print(f"Error: {bundle} is not an install bundle (no {BUNDLE_MANIFEST})")
+        sys.exit(1)
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    problems = [rel for rel, expected in manifest["files"].items()
+                if not os.path.exists(os.path.join(bundle, rel))
+                or _sha256_file(os.path.join(bundle, rel)) != expected]
+    if problems:
+        print("Error: bundle is incomplete or corrupted:")
+        for rel in problems[:10]:
+            print(f"    {rel}")
+        sys.exit(1)
+    print(f"Verified bundle from {manifest['created']} ({len(manifest['files'])} files)")
+    return manifest
+
+def bundle_install_commands(bundle):
+    """Install commands that read only from the bundle, never the network."""
+    pip_cmd = [venv_python(), '-m', 'pip', 'install', '--no-index',
+               '--find-links', os.path.join(bundle, 'wheels'), '-r', 'requirements.txt']
+    npm_cmd = [npm_command(), 'install', '--offline', '--no-audit', '--no-fund',
+               '--cache', os.path.join(bundle, 'npm-cache')]
+    return {"pip": (pip_cmd, None), "npm": (npm_cmd, bundle_npm_env(bundle))}
+
+# Where each side's fingerprint is stored, next to the environment it describes
+FINGERPRINT_FILES = {
+    "pip": os.path.join('venv', '.install-fingerprint'),
+    "npm": os.path.join('node_modules', '.install-fingerprint'),
+}
+
+def _hash_files(digest, paths):
+    for path in paths:
+        digest.update(path.encode())
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(b'<missing>')
+
+@metrics.timed()
+def compute_fingerprints(node_version):
+    """Fingerprint the inputs of the pip and npm installs separately.
+
+    A change to requirements.txt or the venv's Python only affects pip; a
+    change to package.json, the lock file, the pins or Node only affects npm.
+    The installs themselves write the lock file, so the fingerprint stored
+    after an install is computed once it has finished.
+    """
+    pip = hashlib.sha256()
+    _hash_files(pip, ['requirements.txt', os.path.join('venv', 'pyvenv.cfg')])
+    pip.update(sys.version.encode())
+
+    npm = hashlib.sha256()
+    _hash_files(npm, ['package.json', 'package-lock.json'])
+    npm.update(repr(NPM_PACKAGES).encode())
+    npm.update((node_version or '').encode())
+    return {"pip": pip.hexdigest(), "npm": npm.hexdigest()}
+
+def read_fingerprint(name):
+    try:
+        with open(FINGERPRINT_FILES[name], encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def write_fingerprint(name, value):
+    path = FINGERPRINT_FILES[name]
+    if os.path.isdir(os.path.dirname(path)):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(value + '\n')
+
+def run_steps(steps):
+    """Run independent install steps concurrently and report per-step timing.
+
+    Output of each step is printed once it finishes so the two installers
+    don't interleave. Returns the names of the steps that failed.
+    """
+    timings = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+        futures = [pool.submit(metrics.bind(run_step), *step) for step in steps]
+        for future in as_completed(futures):
+            name, elapsed, result = future.result()
+            timings.append((name, elapsed))
+            print(f"\n=== {name} ({elapsed:.1f}s) ===")
+            print(result.stdout)
+            if result.returncode != 0:
+                print(f"Error running {name} step")
+                print(f"Error details: {result.stderr}")
+                failed.append(name)
+
+    print("\nStep timings:")
+    for name, elapsed in timings:
+        print(f"    {name:<5} {elapsed:6.1f}s")
+    return failed
+
+@metrics.timed()
+def install_dependencies(cache_dir=None, node_version=None, force=False, bundle=None):
+    """Install all required dependencies
+
+    pip and npm run in parallel, and all npm packages are resolved in a single
+    `npm install`. Pass cache_dir (or set WA_INSTALL_CACHE) to share the pip
+    and npm caches between machines or checkouts. A side whose inputs match
+    the fingerprint stored with its environment is skipped unless force is set.
+    With bundle, packages come from an offline bundle made by `install.py bundle`.
+    """
+    cache_dir = cache_dir or os.environ.get('WA_INSTALL_CACHE')
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)
+        print(f"Using package cache at {cache_dir}")
+
+    if ensure_package_json():
+        print("Updated package.json with pinned packages.")
+
+    fingerprints = compute_fingerprints(node_version)
+    commands = {
+        "pip": (pip_install_command(cache_dir), None),
+        "npm": (npm_install_command(cache_dir), None),
+    }
+    stale = [name for name in commands if force or read_fingerprint(name) != fingerprints[name]]
+    for name in commands:
+        if name not in stale:
+            print(f"{name} dependencies are up to date, skipping.")
+    if not stale:
+        return
+
+    if bundle:
+        bundle = os.path.abspath(bundle)
+        verify_bundle(bundle)
+        if not os.path.exists('package-lock.json'):
+            # Install exactly the tree the bundle's cache was filled from
+            shutil.copy(os.path.join(bundle, 'package-lock.json'), '.')
+        commands = bundle_install_commands(bundle)
 
     print("\nInstalling dependencies...")
-    for command in commands:
-        print(f"\nRunning: {command}")
+    steps = [(name,) + commands[name] for name in stale]
+    failed = run_steps(steps)
+    # npm install creates or rewrites package-lock.json, one of its own inputs
+    fingerprints = compute_fingerprints(node_version)
+    for name in stale:
+        if name not in failed:
+            write_fingerprint(name, fingerprints[name])
+    if failed:
+        sys.exit(1)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Install the Python and Node.js dependencies.")
+    parser.add_argument('--cache-dir', help="shared directory for the pip and npm package caches")
+    parser.add_argument('--force', action='store_true', help="reinstall even if nothing has changed")
+    parser.add_argument('--bundle', help="install offline from a bundle made with the 'bundle' command")
+    parser.add_argument('--profile', action='store_true', help="print how long each phase and step took")
+    parser.add_argument('--metrics-out', default=os.environ.get('INSTALL_METRICS_OUT'), metavar='PATH_OR_URL',
+                        help="write step timings as JSON lines, as Prometheus text (*.prom) or POST them to a URL")
+    commands = parser.add_subparsers(dest='command')
+    bundle = commands.add_parser('bundle', help="download everything into an offline install bundle")
+    bundle.add_argument('output', help="directory to write the bundle to")
+    bundle.add_argument('--platform', dest='pip_platform',
+                        help="pip platform tag of the target host, e.g. win_amd64")
+    bundle.add_argument('--python-version', help="Python version of the target host, e.g. 3.11")
+    return parser.parse_args(argv)
+
+def report_metrics(args):
+    """Print the profile and write the metrics file, as requested on the command line."""
+    if args.profile:
+        metrics.print_profile()
+    if args.metrics_out:
         try:
-            subprocess.run(command, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error running command: {command}")
-            print(f"Error details: {str(e)}")
-            sys.exit(1)
+            metrics.export(args.metrics_out)
+        except Exception as e:
+            print(f"Warning: could not write metrics to {args.metrics_out}: {e}")
 
-def main():
+def main(argv=None):
+    """Run the installation; the profile is reported even if a step fails"""
+    args = parse_args(argv)
+    if args.profile or args.metrics_out:
+        metrics.enable()
+    try:
+        run(args)
+    finally:
+        report_metrics(args)
+
+def run(args):
     """Main installation process"""
+    if args.command == 'bundle':
+        print("Building offline install bundle...")
+        build_bundle(args.output, check_node_version(), args.pip_platform, args.python_version)
+        return
+
     print("Starting installation process...")
     
     # Check versions
     check_python_version()
-    check_node_version()
+    node_version = check_node_version()
     
     # Create virtual environment
     create_venv()
     
     # Install dependencies
-    install_dependencies()
+    install_dependencies(args.cache_dir, node_version, args.force, args.bundle)
     
     print("\nInstallation completed successfully!")
     print("\nNext steps:")
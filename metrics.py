@@ -0,0 +1,289 @@
+"""Timing spans, counters and histograms for the project's Python scripts.
+
+A Metrics object records nothing until it is enabled, and a disabled span
+costs one attribute check, so scripts can instrument their steps
+unconditionally and only pay for it when asked (--profile, --metrics-out).
+
+    metrics = Metrics("gitpush")
+
+    with metrics.span("fetch"):
+        ...
+
+    @metrics.timed("scan")
+    def scan_files(...):
+        ...
+
+    metrics.count("retries")
+    metrics.observe("batch_rows", 50)
+
+Spans nest per thread (bind() carries the nesting into a worker thread),
+and every span's duration also goes into the <namespace>_span_seconds
+histogram. export() writes JSON lines (one per span, counter and
+histogram), Prometheus text format (paths ending in .prom) or POSTs the
+Prometheus text to an http(s) URL such as a Pushgateway.
+"""
+import contextlib
+import functools
+import json
+import re
+import threading
+import time
+import urllib.request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{_metric_name(key)}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs, ending with +Inf."""
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs + [("+Inf", self.count)]
+
+
+class _Span:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        stack = self.metrics._stack()
+        self.path = "/".join([span.name for span in stack] + [self.name])
+        stack.append(self)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        self.metrics._stack().pop()
+        self.metrics._finish(self, seconds, exc_type.__name__ if exc_type else None)
+        return False
+
+
+class Metrics:
+    def __init__(self, namespace, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.namespace = _metric_name(namespace)
+        self.enabled = enabled
+        self.buckets = buckets
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self):
+        """Start recording; wall time for the profile is counted from here."""
+        if not self.enabled:
+            self.enabled = True
+            self.started_at = time.time()
+            self.started = time.perf_counter()
+        return self
+
+    # --- Recording ---
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def span(self, name, **labels):
+        """Context manager timing a block of work."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, tuple(sorted(labels.items())))
+
+    def timed(self, name=None, **labels):
+        """Decorator timing every call of a function as a span."""
+        def decorate(fn):
+            span_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(span_name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def bind(self, fn):
+        """Wrap fn so spans it opens on another thread nest under the current one."""
+        if not self.enabled:
+            return fn
+        parents = list(self._stack())
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            saved = stack[:]
+            stack[:] = parents
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stack[:] = saved
+        return wrapper
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self._observe(name, tuple(sorted(labels.items())), value)
+
+    def _observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def _finish(self, span, seconds, error):
+        record = {"name": span.name, "path": span.path, "labels": dict(span.labels),
+                  "start": round(span.started_at, 6), "seconds": round(seconds, 6)}
+        if error:
+            record["error"] = error
+        with self.lock:
+            self.spans.append(record)
+        self._observe("span_seconds", (("span", span.name),) + span.labels, seconds)
+
+    # --- Reporting ---
+
+    def wall_seconds(self):
+        return time.perf_counter() - self.started
+
+    def phases(self):
+        """Spans grouped by path and labels, in the order they first ran."""
+        phases = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in sorted(spans, key=lambda span: span["start"]):
+            label = " ".join(str(value) for value in span["labels"].values())
+            key = (span["path"], label)
+            phase = phases.get(key)
+            if phase is None:
+                phase = phases[key] = {"phase": span["path"], "labels": label,
+                                       "depth": span["path"].count("/"), "calls": 0, "seconds": 0.0}
+            phase["calls"] += 1
+            phase["seconds"] += span["seconds"]
+        for phase in phases.values():
+            phase["seconds"] = round(phase["seconds"], 6)
+        return list(phases.values())
+
+    def print_profile(self, file=None):
+        """Print the per-phase wall time breakdown."""
+        wall = self.wall_seconds()
+        print(f"\n=== Profile: {wall:.2f}s wall ===", file=file)
+        print(f"{'calls':>6} {'seconds':>9} {'%':>6}  phase", file=file)
+        for phase in self.phases():
+            name = "  " * phase["depth"] + phase["phase"].rsplit("/", 1)[-1]
+            if phase["labels"]:
+                name += f" {phase['labels']}"
+            share = 100 * phase["seconds"] / wall if wall else 0.0
+            print(f"{phase['calls']:>6} {phase['seconds']:>9.3f} {share:>6.1f}  {name}", file=file)
+        with self.lock:
+            counters = list(self.counters.items())
+        for (name, labels), value in counters:
+            print(f"{name}{_label_text(labels)} = {value}", file=file)
+
+    def prometheus_text(self):
+        """Counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{_metric_name(name)}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_label_text(labels)} {_format_value(value)}")
+        for (name, labels), histogram in histograms:
+            metric = f"{self.namespace}_{_metric_name(name)}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram.cumulative():
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {_format_value(histogram.sum)}")
+            lines.append(f"{metric}_count{_label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def json_lines(self):
+        """One JSON object per span, counter and histogram of this run."""
+        run = {"source": self.namespace, "run": round(self.started_at, 6)}
+        with self.lock:
+            records = [dict(run, type="span", **span) for span in self.spans]
+            records += [dict(run, type="counter", name=name, labels=dict(labels), value=value)
+                        for (name, labels), value in self.counters.items()]
+            records += [dict(run, type="histogram", name=name, labels=dict(labels),
+                             count=histogram.count, sum=round(histogram.sum, 6),
+                             buckets={str(bound): count for bound, count in histogram.cumulative()})
+                        for (name, labels), histogram in self.histograms.items()]
+        records.append(dict(run, type="run", seconds=round(self.wall_seconds(), 6)))
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def export(self, target):
+        """Write the metrics to target.
+
+        An http(s) URL gets the Prometheus text in a POST, a path ending in
+        .prom is overwritten with it, and any other path has JSON lines
+        appended so successive runs accumulate in one file.
+        """
+        if target.startswith(("http://", "https://")):
+            request = urllib.request.Request(target, data=self.prometheus_text().encode("utf-8"), method="POST",
+                                             headers={"Content-Type": "text/plain; version=0.0.4"})
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+        elif target.endswith(".prom"):
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+        else:
+            with open(target, "a", encoding="utf-8") as f:
+                f.write(self.json_lines())
@@ -0,0 +1,6 @@
+"""Python services that sit next to the Node.js scraper.
+
+Each module is runnable with `python -m services.<module>` from the project
+root and exposes its lookups over a small local JSON API, so the listener and
+query bot can use them without talking to Google Sheets directly.
+"""
@@ -0,0 +1,176 @@
+"""Durable asset-ID allocator that leases blocks of IDs to writers.
+
+dataUtils.getNextAssetId() reads the whole Asset ID column and returns
+max + 1, which costs a full column read per listing and hands out the same
+ID twice when two messages are processed at once. Here the next free ID is
+a counter in SQLite. Writers lease a block of IDs in one short transaction
+and then hand them out from memory, so an allocation is O(1) and two
+writers, even in different processes, never get the same ID.
+
+The counter is reconciled once at startup with the highest ID in the sheet,
+so rows added by other tools are never reused. IDs left in a block when a
+writer stops are skipped, which leaves gaps but never duplicates.
+
+Usage:
+    python -m services.asset_ids serve [--port 8773] [--block 100]
+    python -m services.asset_ids reconcile
+"""
+import argparse
+import collections
+import sqlite3
+import threading
+import time
+
+from services import config
+from services.http_api import serve
+from services.schema import format_asset_id, parse_asset_id
+from services.sheets_client import client_from_env
+
+ASSET_ID_RANGE = 'Assets!A:A'
+RATE_WINDOW = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counter (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    first_id INTEGER NOT NULL,
+    end_id INTEGER NOT NULL,
+    leased_at REAL NOT NULL
+);
+"""
+
+
+def highest_sheet_id(client):
+    """Highest asset ID in the sheet's ID column, read the way getNextAssetId does."""
+    ids = [parse_asset_id(row[0]) for row in client.get_values(ASSET_ID_RANGE) if row]
+    return max([number for number in ids if number is not None], default=0)
+
+
+class AssetIdAllocator:
+    def __init__(self, path=None, block_size=100, owner='local'):
+        self.path = path or config.data_path('asset_ids.db')
+        self.block_size = block_size
+        self.owner = owner
+        # isolation_level=None so BEGIN IMMEDIATE can be issued explicitly
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.executescript(SCHEMA)
+        self.db.execute("INSERT OR IGNORE INTO counter (name, next_id) VALUES ('assets', 1)")
+        # db_lock guards the connection, lock the in-memory block
+        self.db_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.block = iter(())
+        self.recent = collections.deque()
+        self.started = time.time()
+        self.stats = {'allocations': 0, 'leases': 0, 'reconciled_to': None}
+
+    def _next_id(self):
+        return self.db.execute("SELECT next_id FROM counter WHERE name = 'assets'").fetchone()[0]
+
+    def lease(self, size=None, owner=None):
+        """Reserve size consecutive IDs; returns (first, end) with end exclusive."""
+        size = size or self.block_size
+        if size < 1:
+            raise ValueError('Lease size must be positive')
+        with self.db_lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent
+            # leases from other processes queue instead of reading the same counter
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                first = self._next_id()
+                self.db.execute("UPDATE counter SET next_id = ? WHERE name = 'assets'", (first + size,))
+                self.db.execute('INSERT INTO leases (owner, first_id, end_id, leased_at) VALUES (?, ?, ?, ?)',
+                                (owner or self.owner, first, first + size, time.time()))
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        self.stats['leases'] += 1
+        return first, first + size
+
+    def allocate(self, count=1):
+        """Next count asset IDs, formatted like "0001"."""
+        ids = []
+        with self.lock:
+            for _ in range(count):
+                number = next(self.block, None)
+                if number is None:
+                    first, end = self.lease(max(self.block_size, count - len(ids)))
+                    self.block = iter(range(first, end))
+                    number = next(self.block)
+                ids.append(format_asset_id(number))
+            now = time.time()
+            self.recent.extend([now] * count)
+            while self.recent and now - self.recent[0] > RATE_WINDOW:
+                self.recent.popleft()
+        self.stats['allocations'] += count
+        return ids
+
+    def reconcile(self, highest):
+        """Move the counter past highest if the sheet is ahead of it; returns the next ID."""
+        with self.lock, self.db_lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                next_id = max(self._next_id(), highest + 1)
+                self.db.execute("UPDATE counter SET next_id = ? WHERE name = 'assets'", (next_id,))
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            # A block leased before the sheet was checked may overlap it
+            self.block = iter(())
+        self.stats['reconciled_to'] = next_id
+        return next_id
+
+    def report(self):
+        elapsed = time.time() - self.started
+        with self.db_lock:
+            next_id = self._next_id()
+        recent = len(self.recent)
+        return dict(self.stats,
+                    next_unleased_id=format_asset_id(next_id),
+                    block_size=self.block_size,
+                    allocations_per_second=round(self.stats['allocations'] / elapsed, 2) if elapsed else 0.0,
+                    recent_per_second=round(recent / min(elapsed, RATE_WINDOW), 2) if elapsed else 0.0)
+
+    def routes(self):
+        def allocate(query, body):
+            return {'ids': self.allocate(int((body or {}).get('count', 1)))}
+
+        def lease(query, body):
+            body = body or {}
+            first, end = self.lease(body.get('size'), body.get('owner', 'http'))
+            return {'first': format_asset_id(first), 'last': format_asset_id(end - 1)}
+
+        return {
+            ('POST', '/ids'): allocate,
+            ('POST', '/leases'): lease,
+            ('GET', '/stats'): lambda query, body: self.report(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Durable asset-ID allocator.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    reconcile = commands.add_parser('reconcile', help='move the counter past the highest ID in the sheet')
+    reconcile.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    serve_cmd = commands.add_parser('serve', help='hand out IDs over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8773)
+    serve_cmd.add_argument('--block', type=int, default=100, help='IDs leased at a time')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    allocator = AssetIdAllocator(block_size=getattr(args, 'block', 100))
+    next_id = allocator.reconcile(highest_sheet_id(client_from_env(args.sheets_url)))
+    print(f'Next asset ID: {format_asset_id(next_id)}')
+    if args.command == 'serve':
+        serve(allocator.routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""Backfill a group's history from exported WhatsApp chats.
+
+The listener only sees messages that arrive while it is connected. A group's
+older messages can be exported from WhatsApp ("Export chat") as a .txt file
+or a .zip holding one. This module reads such exports as a stream of lines,
+one message in memory at a time, so exports of hundreds of MB don't need
+much memory. Each message becomes a dict with the fields processMessage
+builds (groupId, groupName, sender, phone, timestamp, text).
+
+Both export layouts are understood, with the bidi marks that Hebrew-locale
+exports put around timestamps and names:
+
+    12/03/2024, 14:35 - Sender: text        (Android)
+    [12.03.2024, 14:35:12] Sender: text     (iOS)
+
+Lines that don't start with a timestamp continue the previous message.
+System messages, media placeholders and messages that don't look like a
+listing are dropped locally before anything is sent to OpenAI. The rest run
+through services.ingest in batches. After every batch its rows are queued
+for Sheets and the number of messages read is saved as a checkpoint, in one
+transaction of the writer's queue file, so an interrupted backfill resumes
+after the last finished batch without queueing any of its rows twice. A
+batch with a failed extraction stops the run before its checkpoint; cached
+results make the rerun cheap.
+
+Usage:
+    python -m services.backfill scan export.zip [more exports...]
+    python -m services.backfill run export.zip [--group-name NAME] [--batch 50]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import re
+import time
+import zipfile
+from datetime import datetime
+
+from openai import AsyncOpenAI
+
+from services import config
+from services.asset_ids import AssetIdAllocator, highest_sheet_id
+from services.extraction_worker import ExtractionService, full_prompt
+from services.ingest import NON_TEXT, IngestPipeline
+from services.prompt_compaction import INVISIBLE_CHARS, PromptCompactor, load_prompt_template
+from services.reference_lists import ReferenceLists
+from services.sheets_client import client_from_env
+from services.sheets_mirror import SheetsMirror
+from services.sheets_writer import SheetsWriteQueue
+
+DATE_TIME = (r'(?P<date>\d{1,2}[./-]\d{1,2}[./-]\d{2,4}),?\s(?P<time>\d{1,2}:\d{2}(?::\d{2})?)'
+             r'(?:\s?(?P<ampm>[AaPp]\.?\s?[Mm]\.?|לפנה["״]צ|אחה["״]צ))?')
+HEADERS = (
+    re.compile(r'^\[' + DATE_TIME + r'\]\s(?P<rest>.*)$'),
+    re.compile(r'^' + DATE_TIME + r'\s-\s(?P<rest>.*)$'),
+)
+SENDER = re.compile(r'^(?P<sender>[^:]{1,80}?):\s(?P<text>.*)$', re.S)
+EXPORT_NAME = re.compile(r'^(?:WhatsApp Chat (?:with|-) |צ\'אט WhatsApp עם |צ׳אט WhatsApp עם )(?P<name>.+)$')
+MEDIA = re.compile(
+    r'^(?:<Media omitted>|<המדיה לא נכללה>|<מדיה הושמטה>|'
+    r'(?:image|video|audio|sticker|GIF|document|Contact card) omitted|'
+    r'(?:תמונה|סרטון|שמע|מדבקה|GIF|מסמך|כרטיס איש קשר) (?:הושמט|הושמטה)|'
+    r'.+ \(file attached\)|.+ \(קובץ מצורף\))$')
+DELETED = re.compile(r'^(?:This message was deleted|You deleted this message|הודעה זו נמחקה|מחקת את ההודעה הזו)\.?$')
+EDITED = re.compile(r'\s*<(?:This message was edited|ההודעה נערכה)>$')
+LISTING_SIGNALS = re.compile(
+    r'חדר|חד[׳\']|דירה|דירת|פנטהאוז|קוטג|דופלקס|נכס|למכירה|להשכרה|בלעדי|'
+    r'מ["״]ר|מטר|₪|ש["״]?ח\b|מחיר|מיליון|מליון|\d{1,3},\d{3}')
+MIN_LENGTH = 25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    source TEXT PRIMARY KEY,
+    messages INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def clean_line(line):
+    return INVISIBLE_CHARS.sub('', line.rstrip('\r\n'))
+
+
+def parse_timestamp(date, time_, ampm=None, month_first=False):
+    """DD/MM/YYYY HH:MM like processMessage, from an export's date and time."""
+    first, second, year = (int(part) for part in re.split('[./-]', date))
+    day, month = (second, first) if month_first else (first, second)
+    if year < 100:
+        year += 2000
+    hour, minute = (int(part) for part in time_.split(':')[:2])
+    if ampm:
+        afternoon = ampm[0] in 'Pp' or ampm.startswith('אחה')
+        hour = hour % 12 + (12 if afternoon else 0)
+    return datetime(year, month, day, hour, minute).strftime('%d/%m/%Y %H:%M')
+
+
+def phone_from_sender(sender):
+    """Digits of a sender shown as a phone number (no saved contact), else ''."""
+    if re.fullmatch(r'\+?[\d\s().-]+', sender):
+        digits = re.sub(r'\D', '', sender)
+        if len(digits) >= 7:
+            return digits
+    return ''
+
+
+def message_text(text):
+    text = EDITED.sub('', text)
+    if MEDIA.match(text.strip()):
+        return NON_TEXT
+    return text
+
+
+def parse_export(lines, group_name='', group_id='', month_first=False):
+    """Message dicts from the lines of an export, one message buffered at a time.
+
+    System messages (no sender) are dropped; unparseable dates keep the line
+    as part of the previous message.
+    """
+    current = None
+    for line in lines:
+        line = clean_line(line)
+        match = HEADERS[0].match(line) or HEADERS[1].match(line)
+        timestamp = None
+        if match:
+            try:
+                timestamp = parse_timestamp(match['date'], match['time'], match['ampm'], month_first)
+            except ValueError:
+                timestamp = None
+        if timestamp is None:
+            if current is not None:
+                current['text'] += '\n' + line
+            continue
+
+        if current is not None:
+            current['text'] = message_text(current['text'])
+            yield current
+        sender = SENDER.match(match['rest'])
+        if not sender:
+            # "X joined", "Messages are end-to-end encrypted" and the like
+            current = None
+            continue
+        current = {
+            'groupId': group_id,
+            'groupName': group_name,
+            'sender': sender['sender'].strip(),
+            'phone': phone_from_sender(sender['sender'].strip()),
+            'timestamp': timestamp,
+            'text': sender['text'],
+        }
+    if current is not None:
+        current['text'] = message_text(current['text'])
+        yield current
+
+
+def skip_reason(message):
+    """Why a message can't be a listing, or None if it should be extracted."""
+    text = message['text'].strip()
+    if not text:
+        return 'empty'
+    if text == NON_TEXT:
+        return 'media'
+    if DELETED.match(text):
+        return 'deleted'
+    if len(text) < MIN_LENGTH:
+        return 'short'
+    if not LISTING_SIGNALS.search(text):
+        return 'no_listing_terms'
+    return None
+
+
+def group_name_from(path):
+    """Group name from an export's file name, e.g. "WhatsApp Chat with X.txt"."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = EXPORT_NAME.match(stem)
+    return match['name'] if match else stem
+
+
+@contextlib.contextmanager
+def _open_member(path, member):
+    with zipfile.ZipFile(path) as archive, archive.open(member) as raw:
+        yield io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace')
+
+
+def export_sources(path):
+    """(source key, group name, opener) for each chat in a .txt or .zip export."""
+    if not zipfile.is_zipfile(path):
+        yield (os.path.abspath(path), group_name_from(path),
+               lambda: open(path, encoding='utf-8-sig', errors='replace'))
+        return
+    with zipfile.ZipFile(path) as archive:
+        members = [name for name in archive.namelist() if name.lower().endswith('.txt')]
+    for member in members:
+        # "_chat.txt" (iOS) says nothing, the archive's own name does
+        name = group_name_from(path if os.path.basename(member).startswith('_') else member)
+        opener = (lambda member=member: _open_member(path, member))
+        key = os.path.abspath(path) + ('' if len(members) == 1 else ':' + member)
+        yield key, name, opener
+
+
+class Checkpoints:
+    """Per-source progress, kept in the writer's queue file (a SheetsWriteQueue)."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        with writer.lock:
+            writer.db.executescript(SCHEMA)
+
+    def get(self, source):
+        """(messages read, rows queued) so far for a source."""
+        with self.writer.lock:
+            row = self.writer.db.execute('SELECT messages, rows FROM checkpoints WHERE source = ?',
+                                         (source,)).fetchone()
+        return row or (0, 0)
+
+    def save(self, source, messages, rows, queued=()):
+        """Record progress, queueing the rows of the batch in the same transaction."""
+        def record(db):
+            db.execute(
+                'INSERT INTO checkpoints (source, messages, rows, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(source) DO UPDATE SET messages = excluded.messages, rows = excluded.rows, '
+                'updated_at = excluded.updated_at',
+                (source, messages, rows, time.time()))
+
+        self.writer.enqueue(list(queued), then=record)
+
+    def reset(self, source):
+        with self.writer.lock, self.writer.db:
+            self.writer.db.execute('DELETE FROM checkpoints WHERE source = ?', (source,))
+
+
+class RowBuffer:
+    """Stands in for the writer while a batch runs, so its rows are queued together."""
+
+    def __init__(self):
+        self.rows = []
+
+    def enqueue(self, rows, range_=None):
+        self.rows.extend(rows)
+        return len(self.rows)
+
+
+def batches(messages, size):
+    """Lists of (messages read, messages to extract), size extractable messages at a time."""
+    read, batch = 0, []
+    for message in messages:
+        read += 1
+        if message is not None:
+            batch.append(message)
+        if len(batch) >= size:
+            yield read, batch
+            read, batch = 0, []
+    if read:
+        yield read, batch
+
+
+class Backfill:
+    """Runs parsed exports through an IngestPipeline with per-source checkpoints."""
+
+    def __init__(self, pipeline, checkpoints, batch_size=50, month_first=False):
+        self.pipeline = pipeline
+        # The pipeline fills the buffer; a finished batch is queued with its checkpoint
+        self.buffer = pipeline.writer = RowBuffer()
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.month_first = month_first
+        self.skipped = {}
+        self.stats = {'messages': 0, 'extracted': 0, 'rows': 0, 'resumed_from': 0}
+
+    def _filtered(self, messages):
+        # None marks a message that was read but dropped, so it still counts
+        # towards the checkpoint
+        for message in messages:
+            self.stats['messages'] += 1
+            reason = skip_reason(message)
+            if reason:
+                self.skipped[reason] = self.skipped.get(reason, 0) + 1
+                yield None
+            else:
+                yield message
+
+    async def run_source(self, source, messages):
+        done, rows = self.checkpoints.get(source)
+        if done:
+            self.stats['resumed_from'] += done
+            print(f'{source}: resuming after {done} messages ({rows} rows already queued)')
+        for read, batch in batches(self._filtered(itertools.islice(messages, done, None)), self.batch_size):
+            errors = self.pipeline.stats['errors']
+            self.buffer.rows = []
+            await asyncio.gather(*(self.pipeline.process(message) for message in batch))
+            if self.pipeline.stats['errors'] > errors:
+                # Extractions that worked are cached, so a rerun redoes the batch cheaply
+                raise RuntimeError(f'{source}: extraction failed in the batch after message {done}; '
+                                   'run again to resume from there')
+            done += read
+            rows += len(self.buffer.rows)
+            self.checkpoints.save(source, done, rows, self.buffer.rows)
+            self.stats['extracted'] += len(batch)
+            self.stats['rows'] += len(self.buffer.rows)
+            print(f'{source}: {done} messages read, {rows} rows queued')
+        return done, rows
+
+    def report(self):
+        return dict(self.stats, skipped=dict(self.skipped), errors=self.pipeline.stats['errors'])
+
+
+def scan(paths, month_first=False):
+    """Parse and pre-filter exports without calling any API; prints counts per export."""
+    for path in paths:
+        for source, name, opener in export_sources(path):
+            counts, kept = {}, 0
+            with opener() as lines:
+                for message in parse_export(lines, name, month_first=month_first):
+                    reason = skip_reason(message)
+                    if reason:
+                        counts[reason] = counts.get(reason, 0) + 1
+                    else:
+                        kept += 1
+            total = kept + sum(counts.values())
+            skipped = ', '.join(f'{reason} {count}' for reason, count in sorted(counts.items()))
+            print(f'{source} ({name}): {total} messages, {kept} to extract'
+                  + (f' (skipped: {skipped})' if skipped else ''))
+
+
+async def run_backfill(backfill, sources, extraction):
+    extraction.start()
+    try:
+        for source, name, group_id, opener in sources:
+            with opener() as lines:
+                await backfill.run_source(source, parse_export(lines, name, group_id, backfill.month_first))
+    finally:
+        await extraction.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill listings from exported WhatsApp chats.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan_cmd = commands.add_parser('scan', help='count messages and listings without calling any API')
+    run_cmd = commands.add_parser('run', help='extract listings and queue them for the Assets sheet')
+    for command in (scan_cmd, run_cmd):
+        command.add_argument('exports', nargs='+', help='.txt or .zip chat exports')
+        command.add_argument('--month-first', action='store_true', help='dates are MM/DD/YYYY')
+    run_cmd.add_argument('--group-name', help='group name for the rows (default: from the file name)')
+    run_cmd.add_argument('--group-id', default='', help='group JID, if known')
+    run_cmd.add_argument('--batch', type=int, default=50, help='messages extracted between checkpoints')
+    run_cmd.add_argument('--workers', type=int, default=4, help='concurrent OpenAI requests')
+    run_cmd.add_argument('--compact-prompt', action='store_true',
+                         help='send only the Streets rows relevant to each message')
+    run_cmd.add_argument('--restart', action='store_true', help='ignore saved checkpoints')
+    run_cmd.add_argument('--openai-url', help='OpenAI API base URL, e.g. a local stand-in')
+    run_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    if args.command == 'scan':
+        scan(args.exports, args.month_first)
+        return
+
+    client = client_from_env(args.sheets_url)
+    mirror = SheetsMirror(client)
+    mirror.sync()
+    lists = ReferenceLists(client)
+    template = load_prompt_template()
+    prompt = PromptCompactor(template, lists) if args.compact_prompt else full_prompt(lambda: lists.prompt(template))
+    api_key = config.openai_api_key() or ('local' if args.openai_url else None)
+    extraction = ExtractionService(prompt, client=AsyncOpenAI(api_key=api_key, base_url=args.openai_url),
+                                   workers=args.workers, queue_size=max(args.batch, 1)).warm()
+    allocator = AssetIdAllocator(owner='backfill')
+    allocator.reconcile(highest_sheet_id(client))
+    # Its own queue file, so a running sheets_writer doesn't flush the same rows
+    writer = SheetsWriteQueue(client, path=config.data_path('backfill_queue.db')).start()
+
+    checkpoints = Checkpoints(writer)
+    sources = []
+    for path in args.exports:
+        for source, name, opener in export_sources(path):
+            if args.restart:
+                checkpoints.reset(source)
+            sources.append((source, args.group_name or name, args.group_id, opener))
+
+    backfill = Backfill(IngestPipeline(extraction, mirror, allocator, writer=None), checkpoints,
+                        args.batch, args.month_first)
+    try:
+        asyncio.run(run_backfill(backfill, sources, extraction))
+    except RuntimeError as error:
+        print(error)
+    finally:
+        print('Waiting for queued rows to reach Sheets...')
+        if not writer.stop(flush=True):
+            print('The remaining rows are written by the next backfill run.')
+    report = backfill.report()
+    skipped = ', '.join(f'{reason} {count}' for reason, count in sorted(report['skipped'].items()))
+    print(f"Read {report['messages']} messages, extracted {report['extracted']}, "
+          f"queued {report['rows']} rows, {report['errors']} errors"
+          + (f' (skipped: {skipped})' if skipped else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Settings shared by the Python services, read from the project's .env file."""
+import os
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Local state (SQLite mirrors, queues, caches) lives here and is never committed
+DATA_DIR = os.environ.get('WA_DATA_DIR', os.path.join(PROJECT_ROOT, 'data'))
+
+SERVICE_ACCOUNT_FILE = os.environ.get('GOOGLE_SERVICE_ACCOUNT_FILE',
+                                      os.path.join(PROJECT_ROOT, 'service-account.json'))
+
+
+def spreadsheet_id():
+    value = os.environ.get('SPREADSHEET_ID')
+    if not value:
+        raise RuntimeError('Missing SPREADSHEET_ID configuration')
+    return value
+
+
+def openai_api_key():
+    # The Node modules use both spellings
+    return os.environ.get('OPENAI_API_KEY') or os.environ.get('OpenAI_API_KEY')
+
+
+def data_path(name):
+    """Path of a file in DATA_DIR, creating the directory if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
@@ -0,0 +1,406 @@
+"""Near-duplicate index that spots listings we already have.
+
+Realtors post the same apartment to many groups, often with small edits or a
+new price, and each copy currently becomes a new Assets row. The index keeps
+a MinHash signature per listing, built from the word pairs of the message
+text plus tokens for the phone, address and room count, and buckets the
+signatures with LSH. A lookup only compares the handful of listings that
+share a bucket, so it stays fast however large the Assets sheet grows.
+
+Assets rows seeded from the sheet have no message text, so their word pairs
+rarely resemble a realtor's message. Listings with a phone and a street are
+also keyed on phone, address and room count: a message from the same phone
+about the same address matches, whether the address comes from its
+extracted fields or is mentioned in the text.
+
+classify() labels a message as:
+    new           no listing is similar enough
+    duplicate     a similar listing exists with the same (or no) price
+    price_update  a similar listing exists with a different price
+
+Signatures and buckets are stored in SQLite, so restarts don't rebuild.
+
+Usage:
+    python -m services.dedup_index seed            # index the mirrored Assets rows
+    python -m services.dedup_index classify "text" [--phone 0501234567]
+    python -m services.dedup_index serve [--port 8770]
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import struct
+import threading
+import time
+
+from services import config
+from services.http_api import serve
+from services.prompt_compaction import HEBREW_PREFIXES, normalize_name
+from services.schema import PRICE_COLUMNS, asset_value
+from services.sheets_mirror import clean_location
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+DUPLICATE_THRESHOLD = 0.6
+# Prices closer than this are the same price written differently
+PRICE_TOLERANCE = 0.005
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    asset_id TEXT,
+    phone TEXT,
+    price INTEGER,
+    signature BLOB NOT NULL,
+    added_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_asset_id ON listings(asset_id);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    listing_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets(band, bucket);
+CREATE TABLE IF NOT EXISTS listing_keys (
+    listing_id INTEGER PRIMARY KEY,
+    phone TEXT NOT NULL,
+    address TEXT NOT NULL,
+    rooms TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listing_keys_phone ON listing_keys(phone);
+"""
+
+
+def _permutations():
+    # Fixed seeds, so signatures stay comparable across runs and machines
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.sha256(f'minhash-{i}'.encode()).digest()
+        a, b = struct.unpack('<QQ', digest[:16])
+        perms.append((a % (MERSENNE_PRIME - 1) + 1, b % MERSENNE_PRIME))
+    return perms
+
+
+PERMUTATIONS = _permutations()
+
+PRICE_PATTERN = re.compile(
+    r'(?:₪\s*)?(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*'
+    r'(מיליון|מליון|מ׳|אלף|k|₪|ש"ח|שח|ש״ח|nis)?', re.IGNORECASE)
+MULTIPLIERS = {'מיליון': 1000000, 'מליון': 1000000, 'מ׳': 1000000, 'אלף': 1000, 'k': 1000}
+ROOMS_PATTERN = re.compile(r'(\d+(?:\.5)?)\s*(?:חדרים|חד׳|חד\b)')
+
+
+def parse_price(text):
+    """Best guess at the asking price in a message, or None.
+
+    Only numbers with a currency or magnitude word (₪, ש"ח, אלף, מיליון) count,
+    so room counts and sizes aren't taken for prices.
+    """
+    for match in PRICE_PATTERN.finditer(text or ''):
+        number, unit = match.groups()
+        if not unit and not match.group(0).startswith('₪'):
+            continue
+        value = float(number.replace(',', '')) * MULTIPLIERS.get((unit or '').lower(), 1)
+        if value >= 1000:
+            return int(value)
+    return None
+
+
+def parse_price_value(value):
+    """A price cell like "2,450,000" or "2.45 מיליון" as an int, or None."""
+    value = str(value or '').strip()
+    if re.fullmatch(r'[\d,]+(\.\d+)?', value):
+        return int(float(value.replace(',', '')))
+    return parse_price(value)
+
+
+def address_key(fields):
+    parts = [clean_location(fields.get(name) or '') for name in ('street', 'house_number', 'city')]
+    return normalize_name(' '.join(part for part in parts if part))
+
+
+def phone_key(phone):
+    """The last nine digits of a phone number, so 050-... and +97250... agree."""
+    return re.sub(r'\D', '', phone or '')[-9:]
+
+
+def rooms_key(rooms):
+    try:
+        return f'{float(str(rooms).strip()):g}'
+    except ValueError:
+        return ''
+
+
+def word_forms(text):
+    """The words of a message, also with up to two Hebrew prefix letters removed."""
+    forms = set()
+    for word in normalize_name(text).split():
+        forms.add(word)
+        for cut in (1, 2):
+            if len(word) - cut < 2 or word[cut - 1] not in HEBREW_PREFIXES:
+                break
+            forms.add(word[cut:])
+    return forms
+
+
+def features(text, phone='', fields=None):
+    """Shingles for a listing: word pairs of the text plus structured tokens."""
+    words = normalize_name(re.sub(r'(?<=\d),(?=\d)', '', text or '')).split()
+    shingles = {' '.join(words[i:i + 2]) for i in range(max(len(words) - 1, 0))}
+    shingles.update(words if len(words) < 2 else ())
+    digits = phone_key(phone)
+    if digits:
+        shingles.add(f'phone:{digits}')
+    fields = fields or {}
+    address = address_key(fields)
+    if address:
+        shingles.add(f'address:{address}')
+    if fields.get('rooms'):
+        shingles.add(f"rooms:{fields['rooms']}")
+    return shingles
+
+
+def minhash(shingles):
+    hashes = [struct.unpack('<Q', hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest())[0]
+              for s in shingles]
+    if not hashes:
+        return [MERSENNE_PRIME] * NUM_PERM
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+
+def similarity(sig1, sig2):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / NUM_PERM
+
+
+def band_buckets(signature):
+    for band in range(BANDS):
+        chunk = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS_PER_BAND}Q', *chunk), digest_size=8).digest()
+        # SQLite integers are signed 64-bit
+        yield band, struct.unpack('<q', digest)[0]
+
+
+class DedupIndex:
+    def __init__(self, path=None, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.db = sqlite3.connect(path or config.data_path('dedup_index.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.stats = {'lookups': 0, 'new': 0, 'duplicate': 0, 'price_update': 0,
+                      'candidates': 0, 'lookup_seconds': 0.0}
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def _candidates(self, signature):
+        buckets = list(band_buckets(signature))
+        query = ' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))
+        params = [value for pair in buckets for value in pair]
+        with self.lock:
+            return self.db.execute(
+                'SELECT id, asset_id, phone, price, signature FROM listings WHERE id IN '
+                f'(SELECT listing_id FROM buckets WHERE {query})', params).fetchall()
+
+    def _key_match(self, text, phone, fields):
+        """The listing with the same phone, address and rooms as a message, or None.
+
+        The address comes from fields, or else must be mentioned in the text.
+        Rooms only rule a listing out when both sides know them.
+        """
+        phone = phone_key(phone)
+        if not phone:
+            return None
+        fields = fields or {}
+        address = address_key(fields)
+        rooms = rooms_key(fields.get('rooms') or '')
+        if not rooms:
+            match = ROOMS_PATTERN.search(text or '')
+            rooms = rooms_key(match.group(1)) if match else ''
+        forms = None if address else word_forms(text or '')
+        with self.lock:
+            keys = self.db.execute('SELECT listing_id, address, rooms FROM listing_keys WHERE phone = ? '
+                                   'ORDER BY listing_id DESC', (phone,)).fetchall()
+            for listing_id, listing_address, listing_rooms in keys:
+                if address:
+                    if address != listing_address:
+                        continue
+                elif not all(word in forms for word in listing_address.split()):
+                    continue
+                if rooms and listing_rooms and rooms != listing_rooms:
+                    continue
+                return self.db.execute('SELECT id, asset_id, phone, price, signature FROM listings WHERE id = ?',
+                                       (listing_id,)).fetchone()
+        return None
+
+    def classify(self, text, phone='', fields=None, price=None):
+        """Classify a listing against the index.
+
+        Returns {"status", "asset_id", "listing_id", "similarity", "match",
+        "price", "previous_price"}, where match tells whether a listing was
+        found by its text ("text") or by phone and address ("key"). Unless
+        price is given, it is taken from fields["price"] or, failing that,
+        parsed from the text.
+        """
+        start = time.perf_counter()
+        signature = minhash(features(text, phone, fields))
+        if price is None:
+            price = parse_price_value((fields or {}).get('price')) or parse_price(text)
+
+        best, best_score = None, 0.0
+        candidates = self._candidates(signature)
+        for row in candidates:
+            score = similarity(signature, struct.unpack(f'<{NUM_PERM}Q', row[4]))
+            if score > best_score:
+                best, best_score = row, score
+
+        match = 'text' if best and best_score >= self.threshold else None
+        if match is None:
+            keyed = self._key_match(text, phone, fields)
+            if keyed:
+                best, best_score, match = keyed, similarity(signature, struct.unpack(f'<{NUM_PERM}Q', keyed[4])), 'key'
+
+        result = {'status': 'new', 'asset_id': None, 'listing_id': None, 'similarity': round(best_score, 3),
+                  'match': match, 'price': price, 'previous_price': None}
+        if match:
+            listing_id, asset_id, _, previous_price, _ = best
+            result.update(asset_id=asset_id, listing_id=listing_id, previous_price=previous_price)
+            changed = price and previous_price and abs(price - previous_price) > PRICE_TOLERANCE * previous_price
+            result['status'] = 'price_update' if changed else 'duplicate'
+
+        self.stats['lookups'] += 1
+        self.stats[result['status']] += 1
+        self.stats['candidates'] += len(candidates)
+        self.stats['lookup_seconds'] += time.perf_counter() - start
+        return result
+
+    def _insert(self, asset_id, text, phone, fields, price, now):
+        signature = minhash(features(text, phone, fields))
+        if price is None:
+            price = parse_price_value((fields or {}).get('price')) or parse_price(text)
+        cursor = self.db.execute(
+            'INSERT INTO listings (asset_id, phone, price, signature, added_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (asset_id, phone, price, struct.pack(f'<{NUM_PERM}Q', *signature), now, now))
+        listing_id = cursor.lastrowid
+        self.db.executemany('INSERT INTO buckets (band, bucket, listing_id) VALUES (?, ?, ?)',
+                            [(band, bucket, listing_id) for band, bucket in band_buckets(signature)])
+        self._insert_key(listing_id, phone, fields)
+        return listing_id
+
+    def _insert_key(self, listing_id, phone, fields):
+        fields = fields or {}
+        phone = phone_key(phone)
+        # Without a street, a phone and city would match every listing the realtor has there
+        if not phone or not clean_location(fields.get('street') or ''):
+            return
+        self.db.execute('INSERT OR IGNORE INTO listing_keys (listing_id, phone, address, rooms) VALUES (?, ?, ?, ?)',
+                        (listing_id, phone, address_key(fields), rooms_key(fields.get('rooms') or '')))
+
+    def add(self, asset_id, text, phone='', fields=None, price=None):
+        """Index a listing; returns its listing id."""
+        with self.lock, self.db:
+            return self._insert(asset_id, text, phone, fields, price, time.time())
+
+    def update_price(self, listing_id, price):
+        with self.lock, self.db:
+            self.db.execute('UPDATE listings SET price = ?, updated_at = ? WHERE id = ?',
+                            (price, time.time(), listing_id))
+
+    def observe(self, asset_id, text, phone='', fields=None):
+        """Classify a listing and record it: new ones are added, price updates stored.
+
+        asset_id is only used for new listings; it may be None when the caller
+        allocates IDs after classification.
+        """
+        result = self.classify(text, phone, fields)
+        if result['status'] == 'new':
+            result['listing_id'] = self.add(asset_id, text, phone, fields, price=result['price'])
+            result['asset_id'] = asset_id
+        elif result['status'] == 'price_update':
+            self.update_price(result['listing_id'], result['price'])
+        return result
+
+    def seed_from_assets(self, rows):
+        """Index Assets rows (e.g. SheetsMirror.asset_rows()) that aren't indexed yet.
+
+        Rows carry extracted fields rather than the original message, so the
+        text indexed for them is rebuilt from the address, type, size and notes.
+        """
+        with self.lock:
+            known = dict(self.db.execute('SELECT asset_id, id FROM listings'))
+        added, now = 0, time.time()
+        # One transaction for the whole batch; seeding can cover a very large sheet
+        with self.lock, self.db:
+            for row in rows:
+                asset_id = asset_value(row, 'asset_id')
+                if not asset_id:
+                    continue
+                fields = {name: asset_value(row, name)
+                          for name in ('street', 'house_number', 'city', 'rooms')}
+                if asset_id in known:
+                    # Indexes seeded before listings were keyed get their keys now
+                    self._insert_key(known[asset_id], asset_value(row, 'phone'), fields)
+                    continue
+                text = ' '.join(asset_value(row, name) or '' for name in
+                                ('apartment_type', 'rooms', 'neighborhood', 'street', 'house_number',
+                                 'city', 'size_tabu', 'floor', 'notes'))
+                prices = [parse_price_value(asset_value(row, column)) for column in PRICE_COLUMNS]
+                prices = [price for price in prices if price]
+                known[asset_id] = self._insert(asset_id, text, asset_value(row, 'phone') or '', fields,
+                                               prices[-1] if prices else None, now)
+                added += 1
+        return added
+
+    def report(self):
+        lookups = self.stats['lookups']
+        return dict(self.stats,
+                    listings=len(self),
+                    lookup_seconds=round(self.stats['lookup_seconds'], 3),
+                    avg_lookup_ms=round(1000 * self.stats['lookup_seconds'] / lookups, 3) if lookups else 0.0,
+                    avg_candidates=round(self.stats['candidates'] / lookups, 2) if lookups else 0.0)
+
+    def routes(self):
+        def classify(query, body):
+            return self.classify(body['text'], body.get('phone', ''), body.get('fields'))
+
+        def observe(query, body):
+            return self.observe(body.get('assetId'), body['text'], body.get('phone', ''), body.get('fields'))
+
+        return {
+            ('POST', '/classify'): classify,
+            ('POST', '/listings'): observe,
+            ('GET', '/stats'): lambda query, body: self.report(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Near-duplicate listing index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('seed', help='index the Assets rows in the local sheets mirror')
+    classify = commands.add_parser('classify', help='classify one message')
+    classify.add_argument('text')
+    classify.add_argument('--phone', default='')
+    serve_cmd = commands.add_parser('serve', help='serve classification over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8770)
+    args = parser.parse_args(argv)
+
+    index = DedupIndex()
+    if args.command == 'seed':
+        from services.sheets_mirror import SheetsMirror
+        added = index.seed_from_assets(SheetsMirror(client=None).asset_rows())
+        print(f'Indexed {added} assets ({len(index)} listings in total)')
+    elif args.command == 'classify':
+        print(json.dumps(index.classify(args.text, args.phone), ensure_ascii=False))
+    else:
+        serve(index.routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
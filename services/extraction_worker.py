@@ -0,0 +1,298 @@
+"""Concurrent listing extraction with a persistent result cache.
+
+groupListener.processMessage sends every message to OpenAI one at a time,
+and realtors cross-post the same listing to many groups, so identical texts
+are extracted again and again. This service runs extractions on a bounded
+pool of asyncio workers and caches each result under a hash of the
+normalized message text, the prompt version and the model. Cross-posted
+copies are answered from the cache, and copies arriving while the first is
+still in flight share its API call.
+
+The cache only stores what the model extracted from the listing text. The
+per-message fields (group, sender, phone, timestamp) are filled in from the
+message itself, the same way groupListener builds its row.
+
+Usage:
+    python -m services.extraction_worker serve [--port 8768] [--workers 4]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from openai import AsyncOpenAI
+
+from services import config
+from services.http_api import serve
+from services.prompt_compaction import INVISIBLE_CHARS, PromptCompactor, load_prompt_template
+from services.reference_lists import LISTS_PLACEHOLDER, ReferenceLists
+from services.sheets_client import client_from_env
+
+MODEL = 'gpt-4o-mini-2024-07-18'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    key TEXT PRIMARY KEY,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def normalize_text(text):
+    """Canonical form of a message for cache lookups."""
+    text = INVISIBLE_CHARS.sub('', text or '')
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def prompt_version(system_prompt):
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(text, version, model=MODEL):
+    return hashlib.sha256(f'{model}\0{version}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def build_user_message(message):
+    """The metadata-enhanced message groupListener sends to the model."""
+    return (f"Group id: {message.get('groupId', '')}\n"
+            f"Group name: {message.get('groupName', '')}\n"
+            f"Sender name: {message.get('sender', '')}\n"
+            f"Phone number: {message.get('phone', '')}\n"
+            f"Timestamp: {message.get('timestamp', '')}\n\n"
+            f"Message:\n{message.get('text', '')}")
+
+
+def parse_extraction(response_text):
+    """Parse the model's JSON answer, tolerating code fences and unescaped ש"ח."""
+    text = re.sub(r'```json', '', response_text, flags=re.IGNORECASE).replace('```', '').strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(text.replace('ש"ח', 'ש\\"ח'))
+
+
+def full_prompt(system_prompt):
+    """Prompt builder that sends the whole system prompt with every message.
+
+    system_prompt is a callable returning the current prompt text.
+    """
+    def build(message):
+        text = system_prompt()
+        return [{'role': 'system', 'content': text}], prompt_version(text)
+
+    build.warm = system_prompt
+    return build
+
+
+class ExtractionCache:
+    def __init__(self, path=None):
+        self.db = sqlite3.connect(path or config.data_path('extraction_cache.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock, self.db:
+            row = self.db.execute('SELECT result FROM extractions WHERE key = ?', (key,)).fetchone()
+            if row:
+                self.db.execute('UPDATE extractions SET hits = hits + 1 WHERE key = ?', (key,))
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, version, model, result):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO extractions (key, prompt_version, model, result, created_at) '
+                            'VALUES (?, ?, ?, ?, ?)',
+                            (key, version, model, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM extractions').fetchone()[0]
+
+
+class ExtractionService:
+    """Bounded pool of asyncio workers in front of the OpenAI extraction call.
+
+    prompt is a callable taking the message and returning its system
+    messages and a version string for the cache key, e.g. full_prompt() or
+    a services.prompt_compaction.PromptCompactor. Call warm() before the
+    event loop starts.
+    """
+
+    def __init__(self, prompt, client=None, cache=None, workers=4, queue_size=100, model=MODEL):
+        self.prompt = prompt
+        self.client = client or AsyncOpenAI(api_key=config.openai_api_key())
+        self.cache = cache if cache is not None else ExtractionCache()
+        self.workers = workers
+        self.model = model
+        self.queue_size = queue_size
+        self.queue = None
+        self.inflight = {}
+        self.tasks = []
+        self.stats = {'requests': 0, 'cache_hits': 0, 'shared_inflight': 0, 'api_calls': 0,
+                      'errors': 0, 'api_seconds': 0.0}
+
+    def warm(self):
+        """Build the prompt once, outside the event loop.
+
+        The first build can load the reference lists from Sheets, a blocking
+        call that would otherwise stall every worker while it runs.
+        """
+        warm = getattr(self.prompt, 'warm', None)
+        if warm:
+            warm()
+        return self
+
+    def start(self):
+        """Start the workers; call from inside the event loop that will run them."""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def stop(self):
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def extract(self, message):
+        """Extracted listing fields for a message dict, or None for non-text messages.
+
+        message has the fields processMessage collects: groupId, groupName,
+        sender, phone, timestamp and text.
+        """
+        text = message.get('text') or ''
+        if not text.strip() or text == '[Non-text message]':
+            return None
+        self.stats['requests'] += 1
+
+        system_messages, version = self.prompt(message)
+        key = cache_key(text, version, self.model)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        # A cross-post of a message that is still being extracted waits for it
+        if key in self.inflight:
+            self.stats['shared_inflight'] += 1
+            return await asyncio.shield(self.inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        await self.queue.put((key, version, system_messages, message, future))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.inflight.pop(key, None)
+
+    async def _worker(self):
+        while True:
+            key, version, system_messages, message, future = await self.queue.get()
+            try:
+                result = await self._call_model(system_messages, message)
+                self.cache.put(key, version, self.model, result)
+                future.set_result(result)
+            except Exception as error:
+                self.stats['errors'] += 1
+                future.set_exception(error)
+            finally:
+                self.queue.task_done()
+
+    async def _call_model(self, system_messages, message):
+        self.stats['api_calls'] += 1
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=system_messages + [{'role': 'user', 'content': build_user_message(message)}],
+            )
+        finally:
+            self.stats['api_seconds'] += time.perf_counter() - start
+        return parse_extraction(response.choices[0].message.content.strip())
+
+    def report(self):
+        """Stats plus cache hit rate and current queue depth."""
+        answered = self.stats['cache_hits'] + self.stats['shared_inflight']
+        prompt_report = getattr(self.prompt, 'report', None)
+        return dict(self.stats,
+                    prompt=prompt_report() if prompt_report else None,
+                    api_seconds=round(self.stats['api_seconds'], 3),
+                    hit_rate=round(answered / self.stats['requests'], 3) if self.stats['requests'] else 0.0,
+                    queue_depth=self.queue.qsize() if self.queue else 0,
+                    inflight=len(self.inflight),
+                    cached_results=len(self.cache))
+
+
+def run_service(service):
+    """Run the service's event loop on a background thread; returns the loop."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        service.start()
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name='extraction-loop', daemon=True).start()
+    ready.wait()
+    return loop
+
+
+def routes(service, loop):
+    def extract(query, body):
+        messages = body['messages'] if 'messages' in body else [body]
+        futures = [asyncio.run_coroutine_threadsafe(service.extract(message), loop) for message in messages]
+        results = [future.result() for future in futures]
+        return {'results': results} if 'messages' in body else results[0]
+
+    return {
+        ('POST', '/extract'): extract,
+        ('GET', '/stats'): lambda query, body: service.report(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent listing extraction with a result cache.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_cmd = commands.add_parser('serve', help='serve extractions over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8768)
+    serve_cmd.add_argument('--workers', type=int, default=4, help='concurrent OpenAI requests')
+    serve_cmd.add_argument('--openai-url', help='OpenAI API base URL, e.g. a local stand-in')
+    serve_cmd.add_argument('--lists-file', help='fixed text for the predefined lists instead of reading Sheets')
+    serve_cmd.add_argument('--lists-ttl', type=int, default=600, help='seconds before the lists are reloaded')
+    serve_cmd.add_argument('--compact-prompt', action='store_true',
+                           help='send only the Streets rows relevant to each message')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    template = load_prompt_template()
+    if args.lists_file:
+        with open(args.lists_file, encoding='utf-8') as f:
+            prompt = template.replace(LISTS_PLACEHOLDER, f.read())
+        prompt_builder = full_prompt(lambda: prompt)
+    else:
+        lists = ReferenceLists(client_from_env(args.sheets_url), ttl=args.lists_ttl)
+        if args.compact_prompt:
+            prompt_builder = PromptCompactor(template, lists)
+        else:
+            prompt_builder = full_prompt(lambda: lists.prompt(template))
+
+    # A local stand-in doesn't check the key
+    api_key = config.openai_api_key() or ('local' if args.openai_url else None)
+    client = AsyncOpenAI(api_key=api_key, base_url=args.openai_url)
+    service = ExtractionService(prompt_builder, client=client, workers=args.workers).warm()
+    loop = run_service(service)
+    serve(routes(service, loop), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions with a listing extraction made up from the
+message with a few regexes, after an optional delay, and counts requests and
+prompt tokens. Point the openai client at it with base_url=server.url + '/v1'.
+
+Usage:
+    python -m services.fake_openai [--port 8774] [--latency 0.8]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services.prompt_compaction import count_tokens
+
+ROOMS_PATTERN = re.compile(r'(\d+(?:\.5)?)\s*(?:חדרים|חד׳|חד\b)')
+PRICE_PATTERN = re.compile(r'(\d{1,3}(?:,\d{3})+|\d{4,})\s*(?:₪|ש"ח|שח)')
+LOCATION_PATTERNS = {
+    'רחוב': re.compile(r'ברחוב\s+(\S+)'),
+    'שכונה': re.compile(r'בשכונת\s+(\S+)'),
+    'עיר': re.compile(r'בעיר\s+(\S+)'),
+}
+
+
+def fake_extraction(message):
+    """An extraction answer in the groups_listener output format."""
+    text = message.split('Message:\n', 1)[-1]
+    result = {}
+    for key, pattern in LOCATION_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            result[key] = match.group(1).strip(',.')
+    rooms = ROOMS_PATTERN.search(text)
+    if rooms:
+        result['מספר החדרים'] = rooms.group(1)
+    price = PRICE_PATTERN.search(text)
+    if price:
+        result['מחיר מעודכן 1'] = price.group(1).replace(',', '')
+    result['סוג הדירה'] = 'דירה'
+    result['הערות (פרטי הנכס)'] = text[:80]
+    # Wrapped in a code fence like the real model often does
+    return '```json\n' + json.dumps(result, ensure_ascii=False) + '\n```'
+
+
+class FakeOpenAIServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.stats = {'requests': 0, 'prompt_tokens': 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake-openai', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def complete(self, body):
+        messages = body.get('messages', [])
+        prompt_tokens = sum(count_tokens(m.get('content') or '') for m in messages)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['prompt_tokens'] += prompt_tokens
+        content = fake_extraction(messages[-1]['content'] if messages else '')
+        return {
+            'id': f"chatcmpl-fake-{self.stats['requests']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', ''),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': count_tokens(content),
+                      'total_tokens': prompt_tokens + count_tokens(content)},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                if self.path.rstrip('/') != '/v1/chat/completions':
+                    status, payload = 404, {'error': {'message': f'Unknown path {self.path}'}}
+                else:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    status, payload = 200, server.complete(body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fake OpenAI chat completions endpoint for local testing.')
+    parser.add_argument('--port', type=int, default=8774)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(port=args.port, latency=args.latency)
+    print(f'Fake OpenAI API on {server.url}/v1')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
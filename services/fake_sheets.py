@@ -0,0 +1,233 @@
+"""In-memory stand-in for the Google Sheets values API.
+
+Implements just enough of values.get, values:batchGet, values.append and
+values:batchUpdate for the services in this package, plus optional latency
+and a per-minute quota that answers 429 like the real API. Point a
+SheetsClient at it with base_url=server.url.
+
+Usage:
+    python -m services.fake_sheets [--port 8766] [--quota 60] [--latency 0.2]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+RANGE_PATTERN = re.compile(r"^(?:'?([^'!]+)'?!)?([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def column_letters(number):
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def parse_range(range_):
+    """Split "Sheet!A2:C" into (sheet, first_row, last_row, first_col, last_col), 1-based.
+
+    Missing bounds come back as None, meaning "to the edge of the data".
+    """
+    match = RANGE_PATTERN.match(range_)
+    if not match:
+        raise ValueError(f'Unable to parse range: {range_}')
+    sheet, col1, row1, col2, row2 = match.groups()
+    if match.group(4) is None and match.group(5) is None:
+        col2, row2 = col1, row1
+    return (sheet or 'Sheet1',
+            int(row1) if row1 else 1, int(row2) if row2 else None,
+            column_number(col1) if col1 else 1, column_number(col2) if col2 else None)
+
+
+class FakeSpreadsheet:
+    """Rows per sheet, stored as lists of strings (row 1 is index 0)."""
+
+    def __init__(self, sheets=None):
+        self.sheets = {name: [list(row) for row in rows] for name, rows in (sheets or {}).items()}
+        self.lock = threading.Lock()
+
+    def get(self, range_):
+        sheet, row1, row2, col1, col2 = parse_range(range_)
+        with self.lock:
+            rows = self.sheets.get(sheet, [])
+            selected = rows[row1 - 1:row2]
+            values = [row[col1 - 1:col2] for row in selected]
+        # Like the real API, trailing empty rows are dropped
+        while values and not any(values[-1]):
+            values.pop()
+        return {'range': range_, 'majorDimension': 'ROWS', 'values': values}
+
+    def append(self, range_, values):
+        sheet, row1, _, col1, _ = parse_range(range_)
+        with self.lock:
+            rows = self.sheets.setdefault(sheet, [])
+            while rows and not any(rows[-1]):
+                rows.pop()
+            start = max(len(rows) + 1, row1)
+            while len(rows) < start - 1:
+                rows.append([])
+            for row in values:
+                rows.append([''] * (col1 - 1) + [str(value) for value in row])
+            end = len(rows)
+        return {'updates': {'updatedRange': f'{sheet}!{column_letters(col1)}{start}:{end}',
+                            'updatedRows': len(values)}}
+
+    def update(self, range_, values):
+        sheet, row1, _, col1, _ = parse_range(range_)
+        with self.lock:
+            rows = self.sheets.setdefault(sheet, [])
+            for offset, row in enumerate(values):
+                index = row1 - 1 + offset
+                while len(rows) <= index:
+                    rows.append([])
+                target = rows[index]
+                while len(target) < col1 - 1 + len(row):
+                    target.append('')
+                target[col1 - 1:col1 - 1 + len(row)] = [str(value) for value in row]
+        return {'updatedRange': range_, 'updatedRows': len(values)}
+
+
+class FakeSheetsServer:
+    """Serves a FakeSpreadsheet on a background thread.
+
+    quota_per_minute limits requests per rolling minute (0 disables it);
+    latency adds a fixed delay to every request.
+    """
+
+    def __init__(self, spreadsheet=None, host='127.0.0.1', port=0, quota_per_minute=0, latency=0.0):
+        self.spreadsheet = spreadsheet or FakeSpreadsheet()
+        self.quota_per_minute = quota_per_minute
+        self.latency = latency
+        self.requests = []
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake-sheets', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _over_quota(self):
+        now = time.monotonic()
+        with self._lock:
+            self.requests = [t for t in self.requests if now - t < 60]
+            if self.quota_per_minute and len(self.requests) >= self.quota_per_minute:
+                self.throttled += 1
+                return 60 - (now - self.requests[0])
+            self.requests.append(now)
+        return None
+
+    def _handle(self, method, path, query, body):
+        # Paths look like /<spreadsheetId>/values/<range>[:append] or /<id>/values:batchGet
+        _, _, rest = path.lstrip('/').partition('/')
+        if rest == 'values:batchGet' and method == 'GET':
+            return {'valueRanges': [self.spreadsheet.get(r) for r in query.get('ranges', [])]}
+        if rest == 'values:batchUpdate' and method == 'POST':
+            responses = [self.spreadsheet.update(block['range'], block['values']) for block in body['data']]
+            return {'totalUpdatedRows': sum(r['updatedRows'] for r in responses), 'responses': responses}
+        if rest.startswith('values/'):
+            range_ = unquote(rest[len('values/'):])
+            if range_.endswith(':append') and method == 'POST':
+                return self.spreadsheet.append(range_[:-len(':append')], body['values'])
+            if method == 'GET':
+                return self.spreadsheet.get(range_)
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method):
+                if server.latency:
+                    time.sleep(server.latency)
+                retry_after = server._over_quota()
+                if retry_after is not None:
+                    return self._reply(429, {'error': {'code': 429, 'message': 'Quota exceeded',
+                                                       'status': 'RESOURCE_EXHAUSTED'}},
+                                       {'Retry-After': f'{max(retry_after, 0.01):.2f}'})
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                try:
+                    result = server._handle(method, unquote(url.path), parse_qs(url.query), body)
+                except (KeyError, ValueError) as error:
+                    return self._reply(400, {'error': {'code': 400, 'message': str(error)}})
+                if result is None:
+                    return self._reply(404, {'error': {'code': 404, 'message': f'Unknown path {url.path}'}})
+                self._reply(200, result)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fake Google Sheets values API for local testing.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--quota', type=int, default=0, help='requests allowed per minute (0 = unlimited)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--load', help='JSON file mapping sheet names to rows to start with')
+    args = parser.parse_args(argv)
+
+    sheets = None
+    if args.load:
+        with open(args.load, encoding='utf-8') as f:
+            sheets = json.load(f)
+    server = FakeSheetsServer(FakeSpreadsheet(sheets), port=args.port,
+                              quota_per_minute=args.quota, latency=args.latency)
+    print(f'Fake Sheets API on {server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
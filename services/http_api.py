@@ -0,0 +1,67 @@
+"""Tiny JSON-over-HTTP server used to expose a service to the Node.js side."""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_handler(routes):
+    """Build a request handler for routes keyed by (method, path).
+
+    Each route is called as fn(query, body) where query maps parameter names
+    to single values and body is the decoded JSON payload (or None). Its
+    return value is sent back as JSON.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _dispatch(self, method):
+            url = urlparse(self.path)
+            route = routes.get((method, url.path))
+            if route is None:
+                return self._send(404, {'error': f'No route for {method} {url.path}'})
+
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            body = None
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                try:
+                    body = json.loads(self.rfile.read(length))
+                except ValueError:
+                    return self._send(400, {'error': 'Request body is not valid JSON'})
+            try:
+                self._send(200, route(query, body))
+            except (KeyError, ValueError) as error:
+                self._send(400, {'error': str(error)})
+            except Exception as error:
+                self._send(500, {'error': str(error)})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def log_message(self, format, *args):
+            # Lookups are frequent; keep the console quiet
+            pass
+
+    return Handler
+
+
+def serve(routes, host='127.0.0.1', port=8765):
+    """Serve routes until interrupted."""
+    server = ThreadingHTTPServer((host, port), make_handler(routes))
+    print(f'Listening on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
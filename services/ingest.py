@@ -0,0 +1,157 @@
+"""The groupListener ingest path, stage by stage, on top of the Python services.
+
+processMessage() in groupListener.js runs each message through extraction,
+location validation, realtor lookup, asset-ID allocation and the Sheets
+append. IngestPipeline does the same with the services in this package and
+times every stage, so the path can be benchmarked (services.replay_bench)
+or run over old messages (backfills) without WhatsApp.
+"""
+import time
+from datetime import datetime
+
+from services.schema import ASSET_COLUMNS
+
+# Keys of the model's JSON answer for each Assets column, as groupListener reads them
+OUTPUT_KEYS = {
+    'neighborhood': 'שכונה',
+    'street': 'רחוב',
+    'city': 'עיר',
+    'house_number': 'מספר בית',
+    'apartment_type': 'סוג הדירה',
+    'rooms': 'מספר החדרים',
+    'size_tabu': 'גודל בטאבו',
+    'size_arnona': 'גודל בארנונה',
+    'dining_area': 'פינת אוכל מוגדרת',
+    'currency': 'מטבע',
+    'price_1': 'מחיר מעודכן 1',
+    'price_2': 'מחיר מעודכן 2',
+    'price_3': 'מחיר מעודכן 3',
+    'price_4': 'מחיר מעודכן 4',
+    'floor': 'קומה/מתוך כמה',
+    'accessibility_details': 'נגישות (מפורט)',
+    'accessibility_level': 'רמת נגישות',
+    'elevator': 'מעלית',
+    'balcony_1': 'מרפסת 1 (מפורט)',
+    'balcony_2': 'מרפסת 2 (מפורט)',
+    'balcony_3': 'מרפסת 3 (מפורט)',
+    'storage': 'מחסן (מפורט)',
+    'shelter': 'מקלט (מפורט)',
+    'garden': 'גינה (מפורט)',
+    'parking': 'חניה (מפורט)',
+    'condition': 'מצב הדירה',
+    'vacancy': 'פינוי (מתי)',
+    'notes': 'הערות (פרטי הנכס)',
+    'status': 'סטטוס',
+    'internal_notes': 'הערות פנימיות',
+}
+DEFAULTS = {'currency': 'ש"ח', 'status': 'פעיל'}
+LOCATION_KEYS = {'שכונה': 'neighborhood', 'רחוב': 'street', 'עיר': 'city'}
+NON_TEXT = '[Non-text message]'
+STAGES = ('extract', 'validate', 'realtor', 'allocate', 'append')
+
+
+def format_timestamp(seconds):
+    """DD/MM/YYYY HH:MM in local time, like processMessage."""
+    dt = datetime.fromtimestamp(seconds) if seconds else datetime.now()
+    return dt.strftime('%d/%m/%Y %H:%M')
+
+
+def message_from_upsert(msg, group_names=None):
+    """The fields processMessage reads from one messages.upsert message."""
+    key = msg.get('key') or {}
+    group_id = key.get('remoteJid', '')
+    raw_phone = key.get('participant') or group_id or 'Unknown'
+    content = msg.get('message') or {}
+    if content.get('conversation'):
+        text = content['conversation']
+    elif (content.get('extendedTextMessage') or {}).get('text'):
+        text = content['extendedTextMessage']['text']
+    else:
+        text = NON_TEXT if content else ''
+    return {
+        'groupId': group_id,
+        'groupName': (group_names or {}).get(group_id, ''),
+        'sender': msg.get('pushName') or 'Unknown',
+        'phone': raw_phone.replace('@s.whatsapp.net', '').replace('@g.us', ''),
+        'timestamp': format_timestamp(int(msg.get('messageTimestamp') or 0)),
+        'text': text,
+    }
+
+
+def build_row(parsed, asset_id, realtor, message):
+    """The Assets row processMessage appends, from the model's parsed output."""
+    row = []
+    for column in ASSET_COLUMNS:
+        if column == 'asset_id':
+            row.append(asset_id)
+        elif column == 'realtor_name':
+            row.append(realtor['name'] if realtor else '')
+        elif column == 'phone':
+            row.append(message['phone'])
+        elif column == 'timestamp':
+            row.append(message['timestamp'])
+        elif column == 'group_name':
+            row.append(message['groupName'])
+        else:
+            row.append(parsed.get(OUTPUT_KEYS[column]) or DEFAULTS.get(column, ''))
+    return row
+
+
+class IngestPipeline:
+    """extraction -> validation -> realtor lookup -> ID allocation -> append.
+
+    extraction is an ExtractionService, mirror a SheetsMirror, allocator an
+    AssetIdAllocator and writer a SheetsWriteQueue.
+    """
+
+    def __init__(self, extraction, mirror, allocator, writer):
+        self.extraction = extraction
+        self.mirror = mirror
+        self.allocator = allocator
+        self.writer = writer
+        self.timings = {stage: [] for stage in STAGES}
+        self.stats = {'messages': 0, 'rows': 0, 'skipped': 0, 'errors': 0}
+
+    def _timed(self, stage, start):
+        now = time.perf_counter()
+        self.timings[stage].append(now - start)
+        return now
+
+    async def process(self, message):
+        """Run one message dict through every stage; returns the appended row or None."""
+        self.stats['messages'] += 1
+        start = time.perf_counter()
+        try:
+            parsed = await self.extraction.extract(message)
+        except Exception as error:
+            self.stats['errors'] += 1
+            print(f"Extraction failed for a message from {message.get('phone')}: {error}")
+            return None
+        start = self._timed('extract', start)
+        if not parsed:
+            self.stats['skipped'] += 1
+            return None
+
+        # The cache hands out shared results, so work on a copy
+        parsed = dict(parsed)
+        notes = []
+        for key, kind in LOCATION_KEYS.items():
+            if parsed.get(key):
+                note = self.mirror.validate_location(parsed[key], kind)['internalNote']
+                if note:
+                    notes.append(note)
+        if notes:
+            parsed['הערות פנימיות'] = (parsed.get('הערות פנימיות') or '') + '\n' + '\n'.join(notes)
+        start = self._timed('validate', start)
+
+        realtor = self.mirror.realtor_info(message['phone'])
+        start = self._timed('realtor', start)
+
+        (asset_id,) = self.allocator.allocate()
+        start = self._timed('allocate', start)
+
+        row = build_row(parsed, asset_id, realtor, message)
+        self.writer.enqueue([row])
+        self._timed('append', start)
+        self.stats['rows'] += 1
+        return row
@@ -0,0 +1,224 @@
+"""Token-budgeted assembly of the listener system prompt.
+
+The full Streets list is pasted into the groups_listener prompt for every
+message, and it grows with every city we cover. The compactor splits the
+prompt in two system messages:
+
+1. A stable prefix: the template with the apartment type and condition lists
+   and the list of cities. It only changes when those lists change, so the
+   provider's prompt caching can reuse it across messages.
+2. A per-message slice of the Streets rows whose neighborhood or street is
+   mentioned in the message, found with a cheap local word match that
+   tolerates Hebrew prefixes (ב, ה, ו, ל, מ, ש, כ).
+
+Rows for a city that is mentioned without a known street or neighborhood are
+added too, so the model can still pick the neighborhood. The slice is capped
+at max_rows rows and max_slice_tokens tokens. Token counts use tiktoken when
+it is installed and a character estimate otherwise.
+
+Usage:
+    python -m services.prompt_compaction report messages.txt [--sheets-url URL]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+from services import config
+from services.reference_lists import (APT_CONDITIONS_TITLE, APT_TYPES_TITLE, FALLBACK_FRAGMENT,
+                                      LISTS_PLACEHOLDER, STREETS_TITLE, ReferenceLists,
+                                      format_lists, format_section)
+from services.sheets_client import client_from_env
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('o200k_base')
+except Exception:
+    _ENCODING = None
+
+PROMPT_FILE = os.path.join(config.PROJECT_ROOT, 'prompts', 'groups_listener.txt')
+HEBREW_PREFIXES = 'בהולמשכ'
+CITIES_TITLE = 'רשימת ערים:'
+SLICE_NOTE = ('רשימת השכונות והרחובות הרלוונטיים להודעה מופיעה בהודעת המערכת הבאה, '
+              'בפורמט [שכונה, רחוב, עיר].')
+MAX_NAME_WORDS = 4
+# Direction marks and zero-width characters WhatsApp clients sprinkle into Hebrew text
+INVISIBLE_CHARS = re.compile('[\u200b-\u200f\u202a-\u202e\u2066-\u2069\ufeff]')
+
+
+def load_prompt_template():
+    with open(PROMPT_FILE, encoding='utf-8') as f:
+        return f.read()
+
+
+def count_tokens(text):
+    """Prompt tokens for text; an estimate when tiktoken isn't installed."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # Hebrew averages about three characters per token with the gpt-4o tokenizer
+    return (len(text) + 2) // 3
+
+
+def normalize_name(text):
+    text = INVISIBLE_CHARS.sub('', text).lower()
+    text = re.sub('["\'׳״]', '', text)
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def _variants(word):
+    """A word plus the words left after removing up to two Hebrew prefix letters."""
+    yield word
+    for cut in (1, 2):
+        if len(word) - cut < 2 or word[cut - 1] not in HEBREW_PREFIXES:
+            return
+        yield word[cut:]
+
+
+class LocationIndex:
+    """Looks up which Streets rows a message mentions."""
+
+    def __init__(self, rows):
+        self.rows = [list(row) + [''] * (3 - len(row)) for row in rows]
+        self.places = {}
+        self.cities = {}
+        for i, (neighborhood, street, city) in enumerate(self.rows):
+            for name in (neighborhood, street):
+                if name:
+                    self.places.setdefault(normalize_name(name), []).append(i)
+            if city:
+                self.cities.setdefault(normalize_name(city), []).append(i)
+        self.city_names = sorted({row[2] for row in self.rows if row[2]})
+
+    def _candidates(self, text):
+        words = normalize_name(text).split()
+        for start in range(len(words)):
+            for length in range(1, MAX_NAME_WORDS + 1):
+                if start + length > len(words):
+                    break
+                rest = words[start + 1:start + length]
+                for first in _variants(words[start]):
+                    yield ' '.join([first] + rest)
+
+    def match(self, text, max_rows=60):
+        """Indices of relevant rows: exact place matches first, then rows of mentioned cities."""
+        places, cities = [], []
+        for candidate in set(self._candidates(text)):
+            places.extend(self.places.get(candidate, ()))
+            cities.extend(self.cities.get(candidate, ()))
+        selected = list(dict.fromkeys(sorted(places)))
+        if len(selected) < max_rows:
+            mentioned = {self.rows[i][2] for i in selected}
+            # A city with no matched street or neighborhood: offer its neighborhoods
+            seen = set()
+            for i in sorted(cities):
+                neighborhood, _, city = self.rows[i]
+                if city in mentioned or (neighborhood, city) in seen:
+                    continue
+                seen.add((neighborhood, city))
+                selected.append(i)
+                if len(selected) >= max_rows:
+                    break
+        return selected[:max_rows]
+
+
+class PromptCompactor:
+    """Builds the system messages for one message; callable as an extraction prompt builder."""
+
+    def __init__(self, template, lists, max_rows=60, max_slice_tokens=1500):
+        self.template = template
+        self.lists = lists
+        self.max_rows = max_rows
+        self.max_slice_tokens = max_slice_tokens
+        self._built_version = None
+        self.stats = {'messages': 0, 'full_tokens': 0, 'compact_tokens': 0, 'rows_sent': 0}
+
+    def _rebuild(self, version):
+        data = self.lists.lists or {'streets': [], 'apt_types': [], 'apt_conditions': []}
+        self.index = LocationIndex(data['streets'])
+        if self.lists.lists is None:
+            fragment = FALLBACK_FRAGMENT
+        else:
+            fragment = '\n' + '\n\n'.join([
+                format_section(CITIES_TITLE, self.index.city_names),
+                SLICE_NOTE,
+                format_section(APT_TYPES_TITLE, data['apt_types']),
+                format_section(APT_CONDITIONS_TITLE, data['apt_conditions'])])
+        self.prefix = self.template.replace(LISTS_PLACEHOLDER, fragment)
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.full_tokens = count_tokens(self.template.replace(
+            LISTS_PLACEHOLDER,
+            format_lists(data['streets'], data['apt_types'], data['apt_conditions'])
+            if self.lists.lists is not None else FALLBACK_FRAGMENT))
+        self.version = hashlib.sha256(f'{version}\0{self.prefix}'.encode('utf-8')).hexdigest()[:16]
+        self._built_version = version
+
+    def build(self, text):
+        """(system messages, prompt version, report) for a message text."""
+        version, _ = self.lists.current()
+        if version != self._built_version:
+            self._rebuild(version)
+
+        rows, budget = [], self.max_slice_tokens
+        for i in self.index.match(text, self.max_rows):
+            # Each row costs its JSON plus a few tokens of indentation and brackets
+            budget -= count_tokens(json.dumps(self.index.rows[i], ensure_ascii=False)) + 4
+            if budget < 0:
+                break
+            rows.append(self.index.rows[i])
+        slice_text = format_section(STREETS_TITLE, rows)
+        messages = [{'role': 'system', 'content': self.prefix},
+                    {'role': 'system', 'content': slice_text}]
+
+        compact = self.prefix_tokens + count_tokens(slice_text)
+        report = {'full_tokens': self.full_tokens, 'compact_tokens': compact,
+                  'saved_tokens': self.full_tokens - compact, 'rows': len(rows)}
+        self.stats['messages'] += 1
+        self.stats['full_tokens'] += self.full_tokens
+        self.stats['compact_tokens'] += compact
+        self.stats['rows_sent'] += len(rows)
+        return messages, self.version, report
+
+    def __call__(self, message):
+        messages, version, _ = self.build(message.get('text') or '')
+        return messages, version
+
+    def warm(self):
+        """Load the lists and build the prefix without counting a message."""
+        version, _ = self.lists.current()
+        if version != self._built_version:
+            self._rebuild(version)
+
+    def report(self):
+        messages = self.stats['messages']
+        saved = self.stats['full_tokens'] - self.stats['compact_tokens']
+        return dict(self.stats,
+                    saved_tokens=saved,
+                    saved_per_message=round(saved / messages, 1) if messages else 0.0,
+                    prefix_tokens=getattr(self, 'prefix_tokens', 0),
+                    exact_token_counts=_ENCODING is not None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure prompt compaction on sample messages.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser('report', help='print tokens saved per message')
+    report.add_argument('messages', help='text file with one message per paragraph (blank-line separated)')
+    report.add_argument('--max-rows', type=int, default=60)
+    report.add_argument('--max-slice-tokens', type=int, default=1500)
+    report.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    compactor = PromptCompactor(load_prompt_template(), ReferenceLists(client_from_env(args.sheets_url)),
+                                max_rows=args.max_rows, max_slice_tokens=args.max_slice_tokens)
+    with open(args.messages, encoding='utf-8') as f:
+        messages = [m.strip() for m in f.read().split('\n\n') if m.strip()]
+    for text in messages:
+        _, _, result = compactor.build(text)
+        print(f"{result['full_tokens']:>7} -> {result['compact_tokens']:>6} tokens "
+              f"({result['rows']} rows)  {text.splitlines()[0][:60]}")
+    print(json.dumps(compactor.report()))
+
+
+if __name__ == '__main__':
+    main()
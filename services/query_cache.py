@@ -0,0 +1,219 @@
+"""Query bot pipeline with caches in front of both LLM calls.
+
+queryBot.processQuery() makes two OpenAI calls per question: interpretQuery
+turns the text into a filter and summarizeResults writes the answer. Agents
+ask the same few questions all day, so this module keeps two LRU caches:
+
+- interpretations, keyed on the normalized question and the prompt version;
+- summaries, keyed on the normalized question, the filter and a fingerprint
+  of the results (the count plus the five rows shown to the model).
+
+The fingerprint keeps a summary from outliving the rows it describes, and
+the summary cache is also emptied whenever the query engine reloads Assets.
+Filtering runs on services.query_engine, so a repeated question is answered
+without any LLM or Sheets round trip.
+
+Usage:
+    python -m services.query_cache ask "דירת 3 חדרים בחיפה עד 2 מיליון"
+    python -m services.query_cache serve [--port 8772] [--sheets-url URL]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from openai import OpenAI
+
+from services import config
+from services.http_api import serve
+from services.prompt_compaction import INVISIBLE_CHARS
+from services.query_engine import QueryEngine, js_parse_float
+from services.schema import COLUMN_INDEX, PRICE_COLUMNS
+from services.sheets_client import client_from_env
+from services.sheets_mirror import SheetsMirror
+
+INTERPRET_MODEL = 'gpt-4o-mini-2024-07-18'
+SUMMARY_MODEL = 'gpt-3.5-turbo'
+INTERPRET_SYSTEM = 'You are a helpful assistant that extracts filter criteria from real estate queries.'
+SUMMARY_SYSTEM = 'אתה עוזר מועיל המסכם תוצאות חיפוש נדלן'
+SHORT_LIST_SIZE = 5
+
+
+def _prompt(name):
+    with open(os.path.join(config.PROJECT_ROOT, 'prompts', name), encoding='utf-8') as f:
+        return f.read()
+
+
+def normalize_query(query):
+    """Canonical form of a question: case, spacing and trailing punctuation don't matter."""
+    query = INVISIBLE_CHARS.sub('', query or '').lower()
+    query = re.sub('[״“”]', '"', query)
+    query = re.sub(r'\s+', ' ', query).strip()
+    return query.rstrip('?!.,; ')
+
+
+def _digest(*parts):
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, size=len(self.entries), capacity=self.capacity,
+                    hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0)
+
+
+def format_property(row):
+    """Port of queryBot.formatPropertyForSummary()."""
+    def cell(name):
+        index = COLUMN_INDEX[name]
+        return row[index] if index < len(row) and row[index] else ''
+
+    prices = [price for price in (js_parse_float(cell(name)) for name in PRICE_COLUMNS) if price > 0]
+    history = [f'{price:,.0f} ₪' for price in prices]
+    text = (f"נכס ב{cell('city')}, {cell('neighborhood')}, {cell('street')} {cell('house_number')}\n"
+            f"סוג: {cell('apartment_type')}, {cell('rooms')} חדרים, {cell('size_tabu')} מ\"ר\n"
+            f"קומה: {cell('floor')}, {'יש' if cell('elevator') else 'אין'} מעלית\n"
+            f"מצב: {cell('condition')}, פינוי: {cell('vacancy')}\n"
+            f"מחיר עדכני: {history[0] if history else 'לא צוין'}")
+    if len(history) > 1:
+        text += '\nהיסטוריית מחירים: ' + ', '.join(history[1:])
+    return text + f"\nהערות: {cell('notes')}"
+
+
+class QueryAssistant:
+    def __init__(self, engine, client=None, interpret_capacity=1000, summary_capacity=500):
+        self.engine = engine
+        self.client = client or OpenAI(api_key=config.openai_api_key())
+        self.interpret_prompt = _prompt('query_interpret.txt')
+        self.summarize_prompt = _prompt('query_summarize.txt')
+        self.prompt_version = _digest(self.interpret_prompt, self.summarize_prompt)[:16]
+        self.interpretations = LRUCache(interpret_capacity)
+        self.summaries = LRUCache(summary_capacity)
+        self.loads_seen = engine.stats['loads']
+        self.stats = {'questions': 0, 'llm_calls': 0, 'invalidations': 0}
+
+    def _chat(self, model, system, prompt):
+        self.stats['llm_calls'] += 1
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}])
+        return response.choices[0].message.content.strip()
+
+    def interpret(self, query):
+        key = _digest(self.prompt_version, normalize_query(query))
+        cached = self.interpretations.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        raw = self._chat(INTERPRET_MODEL, INTERPRET_SYSTEM, self.interpret_prompt.replace('<USER_QUERY>', query))
+        try:
+            filter_ = json.loads(raw)
+        except ValueError:
+            raise ValueError('Failed to parse query interpretation')
+        # Stored as JSON so callers can't modify the cached filter
+        self.interpretations.put(key, json.dumps(filter_, ensure_ascii=False))
+        return filter_
+
+    def _check_assets(self):
+        loads = self.engine.stats['loads']
+        if loads != self.loads_seen:
+            self.loads_seen = loads
+            if len(self.summaries.entries):
+                self.summaries.clear()
+                self.stats['invalidations'] += 1
+
+    def summarize(self, query, filter_, rows, count):
+        self._check_assets()
+        shown = rows[:SHORT_LIST_SIZE]
+        fingerprint = _digest(str(count), json.dumps(shown, ensure_ascii=False))
+        key = _digest(self.prompt_version, normalize_query(query),
+                      json.dumps(filter_, ensure_ascii=False, sort_keys=True), fingerprint)
+        cached = self.summaries.get(key)
+        if cached is not None:
+            return cached
+        prompt = (self.summarize_prompt
+                  .replace('<USER_QUERY>', query)
+                  .replace('<FILTER_JSON>', json.dumps(filter_, ensure_ascii=False, indent=2))
+                  .replace('<COUNT>', str(count))
+                  .replace('<SHORT_LIST>', '\n\n'.join(format_property(row) for row in shown)))
+        summary = self._chat(SUMMARY_MODEL, SUMMARY_SYSTEM, prompt)
+        self.summaries.put(key, summary)
+        return summary
+
+    def ask(self, query):
+        """Answer a question like queryBot.processQuery(); returns summary, filter and count."""
+        self.stats['questions'] += 1
+        filter_ = self.interpret(query)
+        rows, count = self.engine.query(filter_, limit=SHORT_LIST_SIZE)
+        return {'summary': self.summarize(query, filter_, rows, count), 'filter': filter_, 'count': count}
+
+    def report(self):
+        questions = self.stats['questions']
+        return dict(self.stats,
+                    llm_calls_per_question=round(self.stats['llm_calls'] / questions, 3) if questions else 0.0,
+                    interpretations=self.interpretations.report(),
+                    summaries=self.summaries.report())
+
+    def routes(self):
+        return {
+            ('POST', '/ask'): lambda query, body: self.ask(body['query']),
+            ('GET', '/stats'): lambda query, body: self.report(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cached query bot pipeline.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ask = commands.add_parser('ask', help='answer one question from the mirrored Assets rows')
+    ask.add_argument('query')
+    serve_cmd = commands.add_parser('serve', help='answer questions over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8772)
+    serve_cmd.add_argument('--interval', type=int, default=60, help='seconds between mirror syncs')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    if args.command == 'ask':
+        assistant = QueryAssistant(QueryEngine(SheetsMirror(client=None)))
+        print(assistant.ask(args.query)['summary'])
+        return
+
+    mirror = SheetsMirror(client_from_env(args.sheets_url))
+    mirror.sync()
+    engine = QueryEngine(mirror)
+    engine.load()
+    engine.start_background_sync(args.interval)
+    serve(QueryAssistant(engine).routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
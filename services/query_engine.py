@@ -0,0 +1,252 @@
+"""Columnar, in-memory engine for queryBot property searches.
+
+queryBot.filterProperties() downloads the whole Assets range for every query
+and filters it row by row, parsing every cell as it goes. This engine loads
+the rows once (from the sheets mirror) into NumPy columns: text columns are
+lowercased and dictionary-encoded, numeric columns are parsed once, and rooms,
+size and price get sorted indexes for range lookups. A filter JSON from the
+query_interpret prompt then runs as a handful of vectorized masks.
+
+Matching follows filterProperties() exactly, including its quirks: numbers
+are read like JS parseFloat ("1,200,000" is 1), an unset or 0 bound means no
+bound, text filters are case-insensitive substring matches, a row without
+prices matches any price range, and only rows whose status contains "פעיל"
+match unless includeSold is set.
+
+Usage:
+    python -m services.query_engine query '{"city": "ירושלים", "minRooms": 3}'
+    python -m services.query_engine serve [--port 8771] [--interval 60]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from services.http_api import serve
+from services.schema import COLUMN_INDEX, PRICE_COLUMNS
+from services.sheets_client import client_from_env
+from services.sheets_mirror import SheetsMirror
+
+TEXT_FILTERS = {
+    'city': 'city',
+    'neighborhood': 'neighborhood',
+    'street': 'street',
+    'propertyType': 'apartment_type',
+}
+RANGE_FILTERS = {
+    'rooms': ('minRooms', 'maxRooms'),
+    'size_tabu': ('minSize', 'maxSize'),
+}
+ACTIVE_STATUS = 'פעיל'
+DEFAULT_MAX_PRICE = 999999999
+
+JS_FLOAT = re.compile(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+
+
+def js_parse_float(value):
+    """parseFloat(value) || 0, as filterProperties reads numeric cells."""
+    match = JS_FLOAT.match(str(value or ''))
+    return float(match.group(1)) if match else 0.0
+
+
+def js_number(value):
+    """A filter bound the way JS comparison coerces it; NaN when it isn't numeric."""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip() or 0)
+    except ValueError:
+        return float('nan')
+
+
+class TextColumn:
+    """Lowercased values stored as codes into a table of distinct values."""
+
+    def __init__(self, values):
+        lowered = [str(value or '').lower() for value in values]
+        uniques, codes = np.unique(np.array(lowered, dtype=object), return_inverse=True)
+        self.uniques = list(uniques)
+        self.codes = codes.astype(np.int32)
+
+    def contains(self, needle):
+        # Substring tests run once per distinct value, not once per row
+        needle = needle.lower()
+        matching = [code for code, value in enumerate(self.uniques) if needle in value]
+        return np.isin(self.codes, matching)
+
+
+class SortedColumn:
+    """Float column with a sorted index for range lookups."""
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted = self.values[self.order]
+
+    def between(self, low=None, high=None):
+        mask = np.zeros(len(self.values), dtype=bool)
+        if np.isnan(low or 0) or np.isnan(high or 0):
+            # Comparisons with NaN are false in JS, so nothing matches
+            return mask
+        start = 0 if low is None else np.searchsorted(self.sorted, low, side='left')
+        end = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, side='right')
+        mask[self.order[start:end]] = True
+        return mask
+
+
+class AssetTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.size = len(rows)
+
+        def column(name):
+            index = COLUMN_INDEX[name]
+            return [row[index] if index < len(row) else '' for row in rows]
+
+        self.text = {name: TextColumn(column(name)) for name in TEXT_FILTERS.values()}
+        status = TextColumn(column('status'))
+        self.active = status.contains(ACTIVE_STATUS)
+        self.numbers = {name: SortedColumn([js_parse_float(value) for value in column(name)])
+                        for name in RANGE_FILTERS}
+
+        # Every positive price as a (row, price) pair, sorted by price
+        prices = np.array([[js_parse_float(value) for value in column(name)] for name in PRICE_COLUMNS],
+                          dtype=np.float64).reshape(len(PRICE_COLUMNS), self.size)
+        positive = prices > 0
+        self.has_price = positive.any(axis=0)
+        price_rows = np.nonzero(positive)[1]
+        price_values = prices[positive]
+        order = np.argsort(price_values, kind='stable')
+        self.price_rows = price_rows[order]
+        self.price_sorted = price_values[order]
+
+    def _price_mask(self, low, high):
+        mask = ~self.has_price
+        if np.isnan(low) or np.isnan(high):
+            return mask
+        start = np.searchsorted(self.price_sorted, low, side='left')
+        end = np.searchsorted(self.price_sorted, high, side='right')
+        mask[self.price_rows[start:end]] = True
+        return mask
+
+    def mask(self, filter_):
+        """Boolean mask of the rows filterProperties(filter_) would return."""
+        mask = np.ones(self.size, dtype=bool)
+        for key, name in TEXT_FILTERS.items():
+            if filter_.get(key):
+                mask &= self.text[name].contains(str(filter_[key]))
+
+        for name, (low_key, high_key) in RANGE_FILTERS.items():
+            low, high = filter_.get(low_key), filter_.get(high_key)
+            if low:
+                mask &= self.numbers[name].between(low=js_number(low))
+            if high:
+                mask &= self.numbers[name].between(high=js_number(high))
+
+        low = js_number(filter_.get('minPrice') or 0)
+        high = js_number(filter_.get('maxPrice') or DEFAULT_MAX_PRICE)
+        mask &= self._price_mask(low, high)
+
+        if not filter_.get('includeSold'):
+            mask &= self.active
+        return mask
+
+    def query(self, filter_, limit=None):
+        """Matching rows in sheet order, and how many matched in total."""
+        matches = np.flatnonzero(self.mask(filter_))
+        selected = matches if limit is None else matches[:limit]
+        return [self.rows[i] for i in selected], len(matches)
+
+
+class QueryEngine:
+    """Keeps an AssetTable built from the sheets mirror up to date."""
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.table = None
+        self.stats = {'queries': 0, 'query_seconds': 0.0, 'loads': 0, 'load_seconds': None, 'rows': 0}
+
+    def load(self):
+        start = time.perf_counter()
+        # Queries keep using the old table until the new one is fully built
+        table = self.table = AssetTable(self.mirror.asset_rows())
+        self.stats['loads'] += 1
+        self.stats['rows'] = table.size
+        self.stats['load_seconds'] = round(time.perf_counter() - start, 3)
+        return table
+
+    def query(self, filter_, limit=None):
+        table = self.table or self.load()
+        start = time.perf_counter()
+        rows, count = table.query(filter_, limit)
+        self.stats['queries'] += 1
+        self.stats['query_seconds'] += time.perf_counter() - start
+        return rows, count
+
+    def start_background_sync(self, interval=60):
+        """Sync the mirror every interval seconds and reload when Assets changed."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.mirror.sync()['assets']:
+                        self.load()
+                except Exception as error:
+                    print(f'Query engine sync failed: {error}')
+
+        thread = threading.Thread(target=loop, name='query-engine-sync', daemon=True)
+        thread.start()
+        return thread
+
+    def routes(self):
+        def query(query_, body):
+            rows, count = self.query(body['filter'], body.get('limit'))
+            return {'count': count, 'rows': rows}
+
+        def stats(query_, body):
+            queries = self.stats['queries']
+            return dict(self.stats,
+                        query_seconds=round(self.stats['query_seconds'], 3),
+                        avg_query_ms=round(1000 * self.stats['query_seconds'] / queries, 3) if queries else 0.0)
+
+        return {
+            ('POST', '/query'): query,
+            ('GET', '/stats'): stats,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='In-memory columnar engine for property queries.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    query_cmd = commands.add_parser('query', help='run one filter against the mirrored Assets rows')
+    query_cmd.add_argument('filter', help='filter JSON as produced by the query_interpret prompt')
+    query_cmd.add_argument('--limit', type=int, default=5)
+    serve_cmd = commands.add_parser('serve', help='serve queries over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8771)
+    serve_cmd.add_argument('--interval', type=int, default=60, help='seconds between mirror syncs')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    if args.command == 'query':
+        engine = QueryEngine(SheetsMirror(client=None))
+        rows, count = engine.query(json.loads(args.filter), args.limit)
+        print(f'{count} matching properties')
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+        return
+
+    mirror = SheetsMirror(client_from_env(args.sheets_url))
+    mirror.sync()
+    engine = QueryEngine(mirror)
+    engine.load()
+    engine.start_background_sync(args.interval)
+    serve(engine.routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
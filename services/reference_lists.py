@@ -0,0 +1,196 @@
+"""Versioned in-memory cache of the predefined lists used in the extraction prompt.
+
+groupListener.loadPredefinedLists() reads Streets, Apt_Types and
+Apt_Conditions from Sheets for every message and formats them into the
+{DYNAMIC_LISTS_PLACEHOLDER} part of the system prompt. The lists hardly ever
+change, so this cache loads them once with a single batched request, keeps
+the formatted prompt fragment in memory and refreshes it in the background
+once it is older than ttl seconds. The version number only goes up when the
+content actually changed, which makes it usable as a prompt cache key.
+
+The last good copy is saved to data/, so a restart while Sheets is
+unreachable still has lists to hand out.
+
+Usage:
+    python -m services.reference_lists serve [--port 8769] [--ttl 600]
+    python -m services.reference_lists show
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+from services import config
+from services.http_api import serve
+from services.schema import APT_CONDITIONS_RANGE, APT_TYPES_RANGE, STREETS_RANGE
+from services.sheets_client import client_from_env
+
+LISTS_PLACEHOLDER = '{DYNAMIC_LISTS_PLACEHOLDER}'
+# What groupListener puts in the prompt when the lists can't be loaded
+FALLBACK_FRAGMENT = 'Error loading lists - using free text input'
+STREETS_TITLE = 'רשימת ערים, שכונות ורחובות:'
+APT_TYPES_TITLE = 'רשימת סוגי דירות:'
+APT_CONDITIONS_TITLE = 'רשימת מצבי דירה:'
+
+
+def _flat(rows):
+    return [value for row in rows for value in row]
+
+
+def format_section(title, values):
+    return f'{title}\n{json.dumps(values, ensure_ascii=False, indent=2)}'
+
+
+def format_lists(streets, apt_types, apt_conditions):
+    """The prompt fragment, formatted exactly like loadPredefinedLists()."""
+    return '\n' + '\n\n'.join([format_section(STREETS_TITLE, streets),
+                                format_section(APT_TYPES_TITLE, apt_types),
+                                format_section(APT_CONDITIONS_TITLE, apt_conditions)])
+
+
+class ReferenceLists:
+    def __init__(self, client, ttl=600, path=None):
+        self.client = client
+        self.ttl = ttl
+        self.path = path or config.data_path('reference_lists.json')
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.lists = None
+        self.digest = None
+        self.version = 0
+        self.fragment = FALLBACK_FRAGMENT
+        self.loaded_at = 0.0
+        self._prompts = {}
+        self.stats = {'lookups': 0, 'refreshes': 0, 'changes': 0, 'sheet_calls': 0, 'errors': 0}
+        self._load_saved()
+
+    def _load_saved(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            saved = json.load(f)
+        # Loaded from disk but never checked against Sheets, so treat it as stale
+        self._apply(saved['lists'], saved['version'], loaded_at=0.0)
+
+    def _apply(self, lists, version, loaded_at):
+        self.lists = lists
+        self.digest = hashlib.sha1(json.dumps(lists, ensure_ascii=False).encode('utf-8')).hexdigest()
+        self.version = version
+        self.fragment = format_lists(lists['streets'], lists['apt_types'], lists['apt_conditions'])
+        self.loaded_at = loaded_at
+        self._prompts = {}
+
+    def refresh(self):
+        """Reload the lists from Sheets; returns True when their content changed."""
+        streets, apt_types, apt_conditions = self.client.batch_get(
+            [STREETS_RANGE, APT_TYPES_RANGE, APT_CONDITIONS_RANGE])
+        self.stats['sheet_calls'] += 1
+        self.stats['refreshes'] += 1
+        lists = {'streets': streets, 'apt_types': _flat(apt_types), 'apt_conditions': _flat(apt_conditions)}
+        digest = hashlib.sha1(json.dumps(lists, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+        with self.lock:
+            if digest == self.digest:
+                self.loaded_at = time.time()
+                return False
+            self._apply(lists, self.version + 1, time.time())
+            version = self.version
+        self.stats['changes'] += 1
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'lists': lists}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        return True
+
+    def _refresh_in_background(self):
+        def run():
+            try:
+                self.refresh()
+            except Exception as error:
+                self.stats['errors'] += 1
+                print(f'Reference lists refresh failed: {error}')
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, name='reference-lists-refresh', daemon=True).start()
+
+    def current(self):
+        """(version, fragment) for the prompt placeholder.
+
+        Only the very first call waits for Sheets. After that a stale copy
+        is handed out while a background refresh fetches the new one.
+        """
+        self.stats['lookups'] += 1
+        if self.lists is None:
+            try:
+                self.refresh()
+            except Exception as error:
+                self.stats['errors'] += 1
+                print(f'Error loading predefined lists: {error}')
+        elif time.time() - self.loaded_at > self.ttl:
+            with self.lock:
+                start = not self.refreshing
+                self.refreshing = True
+            if start:
+                self._refresh_in_background()
+        with self.lock:
+            return self.version, self.fragment
+
+    def prompt(self, template):
+        """template with the placeholder filled in, built once per list version."""
+        version, fragment = self.current()
+        key = (version, hash(template))
+        built = self._prompts.get(key)
+        if built is None:
+            built = self._prompts[key] = template.replace(LISTS_PLACEHOLDER, fragment)
+        return built
+
+    def invalidate(self):
+        """Mark the lists stale so the next lookup refreshes them."""
+        self.loaded_at = 0.0
+
+    def routes(self):
+        def fragment(query, body):
+            version, text = self.current()
+            return {'version': version, 'fragment': text}
+
+        def refresh(query, body):
+            changed = self.refresh()
+            return {'version': self.version, 'changed': changed}
+
+        return {
+            ('GET', '/lists/fragment'): fragment,
+            ('GET', '/lists'): lambda query, body: dict(self.lists or {}, version=self.version),
+            ('POST', '/lists/refresh'): refresh,
+            ('GET', '/stats'): lambda query, body: dict(self.stats, version=self.version,
+                                                        age_seconds=round(time.time() - self.loaded_at, 1)),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Versioned cache of the predefined prompt lists.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='load the lists once and print the prompt fragment')
+    show.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    serve_cmd = commands.add_parser('serve', help='serve the prompt fragment over HTTP')
+    serve_cmd.add_argument('--port', type=int, default=8769)
+    serve_cmd.add_argument('--ttl', type=int, default=600, help='seconds before the lists are refreshed')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    lists = ReferenceLists(client_from_env(args.sheets_url), ttl=getattr(args, 'ttl', 600))
+    if args.command == 'show':
+        lists.refresh()
+        print(f'Version {lists.version}')
+        print(lists.fragment)
+        return
+
+    lists.current()
+    serve(lists.routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
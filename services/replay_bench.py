@@ -0,0 +1,256 @@
+"""Offline replay benchmark for the groupListener ingest path.
+
+Replays a corpus of messages.upsert payloads through services.ingest
+(extraction -> validation -> realtor lookup -> ID allocation -> append)
+against local stand-ins: services.fake_openai with configurable latency and
+services.fake_sheets with optional quota. Nothing touches WhatsApp, OpenAI
+or Google. The report has messages/sec, p50/p99 latency per stage and API
+calls per message. --min-throughput and --max-calls turn it into a
+pass/fail check.
+
+The corpus is JSON lines, one messages.upsert payload per line. Without one,
+a synthetic corpus is generated, with --dup-rate of the messages being
+cross-posts of earlier ones.
+
+Usage:
+    python -m services.replay_bench [--corpus upserts.jsonl] [--messages 500]
+        [--openai-latency 0.5] [--sheets-quota 60] [--concurrency 8] [--json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from openai import AsyncOpenAI
+
+from services.asset_ids import AssetIdAllocator
+from services.extraction_worker import ExtractionCache, ExtractionService, full_prompt
+from services.fake_openai import FakeOpenAIServer
+from services.fake_sheets import FakeSheetsServer, FakeSpreadsheet
+from services.ingest import STAGES, IngestPipeline, message_from_upsert
+from services.prompt_compaction import PromptCompactor, load_prompt_template
+from services.reference_lists import ReferenceLists
+from services.schema import ASSET_COLUMNS
+from services.sheets_client import SheetsClient
+from services.sheets_mirror import SheetsMirror
+from services.sheets_writer import SheetsWriteQueue
+
+CITIES = {
+    'ירושלים': ['רמות', 'גילה', 'בקעה', 'קטמון', 'תלפיות'],
+    'תל אביב': ['פלורנטין', 'הצפון הישן', 'רמת אביב', 'נווה צדק'],
+    'חיפה': ['כרמל', 'נווה שאנן', 'בת גלים'],
+}
+STREETS = ['הרצל', 'יפו', 'ז׳בוטינסקי', 'הנביאים', 'בן יהודה', 'העצמאות', 'הגפן', 'התאנה']
+TEMPLATES = [
+    'למכירה בעיר {city} בשכונת {neighborhood} ברחוב {street} {number}, דירת {rooms} חדרים, קומה {floor}, '
+    'מחיר {price} ש"ח. לפרטים {name}',
+    'להשכרה! {rooms} חד׳ ברחוב {street} בשכונת {neighborhood}, משופצת, מעלית וחניה. {price} ₪',
+    'בלעדי בשכונת {neighborhood}: {rooms} חדרים ברחוב {street}, מרפסת שמש, מחיר {price} ש"ח',
+]
+
+
+def generate_corpus(count, dup_rate=0.3, groups=20, realtors=50, seed=1):
+    """Synthetic (payloads, group names); dup_rate of the messages repeat an earlier text."""
+    rng = random.Random(seed)
+    group_names = {f'1203630{i:05d}@g.us': f'נדל"ן קבוצה {i}' for i in range(groups)}
+    phones = [f'97250{rng.randrange(10 ** 7):07d}' for _ in range(realtors)]
+    texts, payloads = [], []
+    start = int(time.time()) - count * 30
+    for i in range(count):
+        if texts and rng.random() < dup_rate:
+            text, phone = rng.choice(texts)
+        else:
+            city = rng.choice(list(CITIES))
+            text = rng.choice(TEMPLATES).format(
+                city=city, neighborhood=rng.choice(CITIES[city]), street=rng.choice(STREETS),
+                number=rng.randint(1, 120), rooms=rng.choice([2, 3, 3.5, 4, 5]), floor=rng.randint(0, 12),
+                price=f'{rng.randrange(1200, 6000) * 1000:,}', name=rng.choice(['דני', 'מירב', 'יוסי']))
+            phone = rng.choice(phones)
+            texts.append((text, phone))
+        payloads.append({'type': 'notify', 'messages': [{
+            'key': {'remoteJid': rng.choice(list(group_names)), 'participant': f'{phone}@s.whatsapp.net',
+                    'id': f'BENCH{i:06d}'},
+            'pushName': 'מתווך',
+            'messageTimestamp': start + i * 30,
+            'message': {'conversation': text},
+        }]})
+    return payloads, group_names
+
+
+def reference_sheets(realtor_phones=()):
+    """Starting content for the fake spreadsheet."""
+    streets = [[neighborhood, street, city] for city, hoods in CITIES.items()
+               for neighborhood in hoods for street in STREETS]
+    return {
+        'Streets': streets,
+        'Realtors': [[f'מתווך {i}', phone] for i, phone in enumerate(realtor_phones)],
+        'Apt_Types': [['דירה'], ['פנטהאוז'], ['דירת גן'], ['קוטג׳']],
+        'Apt_Conditions': [['משופצת'], ['חדשה'], ['דרוש שיפוץ']],
+        'Assets': [ASSET_COLUMNS],
+    }
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def replay(pipeline, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with semaphore:
+            await pipeline.process(message)
+
+    pipeline.extraction.start()
+    await asyncio.gather(*(one(message) for message in messages))
+    await pipeline.extraction.stop()
+
+
+def run_benchmark(payloads, group_names, concurrency=8, workers=8, openai_latency=0.5,
+                  sheets_latency=0.05, sheets_quota=0, batch=50, compact_prompt=False):
+    messages = [message_from_upsert(msg, group_names) for payload in payloads for msg in payload['messages']]
+    phones = sorted({message['phone'] for message in messages})
+
+    sheets = FakeSheetsServer(FakeSpreadsheet(reference_sheets(phones[::2])),
+                              quota_per_minute=sheets_quota, latency=sheets_latency)
+    openai_server = FakeOpenAIServer(latency=openai_latency)
+    # The stack closes every SQLite connection before the work directory is removed
+    with tempfile.TemporaryDirectory(prefix='replay-bench-') as workdir, \
+            sheets, openai_server, contextlib.ExitStack() as connections:
+        client = SheetsClient('bench', base_url=sheets.url)
+        mirror = SheetsMirror(client, path=os.path.join(workdir, 'mirror.db'))
+        connections.callback(mirror.db.close)
+        mirror.sync(full=True)
+        lists = ReferenceLists(client, path=os.path.join(workdir, 'lists.json'))
+        template = load_prompt_template()
+        prompt = (PromptCompactor(template, lists) if compact_prompt
+                  else full_prompt(lambda: lists.prompt(template)))
+
+        extraction = ExtractionService(
+            prompt,
+            client=AsyncOpenAI(api_key='bench', base_url=openai_server.url + '/v1', max_retries=0),
+            cache=ExtractionCache(os.path.join(workdir, 'extractions.db')),
+            workers=workers).warm()
+        connections.callback(extraction.cache.db.close)
+        allocator = AssetIdAllocator(os.path.join(workdir, 'ids.db'))
+        connections.callback(allocator.db.close)
+        allocator.reconcile(0)
+        writer = SheetsWriteQueue(client, path=os.path.join(workdir, 'queue.db'), max_batch=batch,
+                                  max_delay=1.0, max_backoff=10.0).start()
+        connections.callback(writer.db.close)
+        connections.callback(writer.stop, flush=False)
+        pipeline = IngestPipeline(extraction, mirror, allocator, writer)
+
+        setup_calls = client.calls
+        start = time.perf_counter()
+        asyncio.run(replay(pipeline, messages, concurrency))
+        processed = time.perf_counter() - start
+        writer.stop(flush=True)
+        elapsed = time.perf_counter() - start
+
+        count = len(messages) or 1
+        stages = {}
+        for stage in STAGES:
+            values = pipeline.timings[stage]
+            stages[stage] = {'count': len(values),
+                             'p50_ms': round(1000 * percentile(values, 0.5), 3) if values else None,
+                             'p99_ms': round(1000 * percentile(values, 0.99), 3) if values else None}
+        extraction_report = extraction.report()
+        return {
+            'messages': len(messages),
+            'rows': pipeline.stats['rows'],
+            'errors': pipeline.stats['errors'],
+            'seconds': round(elapsed, 3),
+            'drain_seconds': round(elapsed - processed, 3),
+            'messages_per_second': round(len(messages) / elapsed, 2) if elapsed else 0.0,
+            'stages': stages,
+            'api_calls_per_message': {
+                'openai': round(openai_server.stats['requests'] / count, 3),
+                'sheets': round((client.calls - setup_calls) / count, 3),
+            },
+            'prompt_tokens_per_message': round(openai_server.stats['prompt_tokens'] / count, 1),
+            'extraction_hit_rate': extraction_report['hit_rate'],
+            'sheets_throttled': sheets.throttled,
+            'rows_in_sheet': len(sheets.spreadsheet.sheets['Assets']) - 1,
+        }
+
+
+def print_report(report):
+    print(f"{report['messages']} messages, {report['rows']} rows in {report['seconds']}s "
+          f"({report['messages_per_second']} msg/s, {report['drain_seconds']}s draining the writer)")
+    print(f"{'stage':<10}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}")
+    for stage, values in report['stages'].items():
+        p50 = '-' if values['p50_ms'] is None else values['p50_ms']
+        p99 = '-' if values['p99_ms'] is None else values['p99_ms']
+        print(f"{stage:<10}{values['count']:>8}{p50:>12}{p99:>12}")
+    calls = report['api_calls_per_message']
+    print(f"API calls per message: openai {calls['openai']}, sheets {calls['sheets']}")
+    print(f"Prompt tokens per message: {report['prompt_tokens_per_message']}, "
+          f"extraction cache hit rate: {report['extraction_hit_rate']}, "
+          f"Sheets 429s: {report['sheets_throttled']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay messages through the ingest path against local fakes.')
+    parser.add_argument('--corpus', help='JSON lines of messages.upsert payloads')
+    parser.add_argument('--groups', help='JSON file mapping group ids to names for --corpus')
+    parser.add_argument('--messages', type=int, default=500, help='size of the synthetic corpus')
+    parser.add_argument('--dup-rate', type=float, default=0.3, help='share of cross-posted messages')
+    parser.add_argument('--save-corpus', help='write the synthetic corpus to this file')
+    parser.add_argument('--concurrency', type=int, default=8, help='messages in flight')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent OpenAI requests')
+    parser.add_argument('--openai-latency', type=float, default=0.5)
+    parser.add_argument('--sheets-latency', type=float, default=0.05)
+    parser.add_argument('--sheets-quota', type=int, default=0, help='Sheets requests per minute (0 = unlimited)')
+    parser.add_argument('--batch', type=int, default=50, help='rows per Sheets append')
+    parser.add_argument('--compact-prompt', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--min-throughput', type=float, help='fail below this many messages/sec')
+    parser.add_argument('--max-calls', type=float, help='fail above this many API calls per message')
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        group_names = {}
+        if args.groups:
+            with open(args.groups, encoding='utf-8') as f:
+                group_names = json.load(f)
+    else:
+        payloads, group_names = generate_corpus(args.messages, args.dup_rate)
+        if args.save_corpus:
+            with open(args.save_corpus, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(payload, ensure_ascii=False) + '\n' for payload in payloads)
+
+    # With --json, progress messages from the services go to stderr
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        report = run_benchmark(payloads, group_names, concurrency=args.concurrency, workers=args.workers,
+                               openai_latency=args.openai_latency, sheets_latency=args.sheets_latency,
+                               sheets_quota=args.sheets_quota, batch=args.batch,
+                               compact_prompt=args.compact_prompt)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    if args.min_throughput and report['messages_per_second'] < args.min_throughput:
+        failures.append(f"throughput {report['messages_per_second']} msg/s is below {args.min_throughput}")
+    calls = sum(report['api_calls_per_message'].values())
+    if args.max_calls is not None and calls > args.max_calls:
+        failures.append(f'{calls} API calls per message is above {args.max_calls}')
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Column layout of the Assets sheet (A:AI), matching the row groupListener builds."""
+import re
+
+ASSET_COLUMNS = [
+    'asset_id',               # A  Asset ID ("0001")
+    'realtor_name',           # B
+    'phone',                  # C
+    'neighborhood',           # D  שכונה
+    'street',                 # E  רחוב
+    'city',                   # F  עיר
+    'house_number',           # G  מספר בית
+    'apartment_type',         # H  סוג הדירה
+    'rooms',                  # I  מספר החדרים
+    'size_tabu',              # J  גודל בטאבו
+    'size_arnona',            # K  גודל בארנונה
+    'dining_area',            # L  פינת אוכל מוגדרת
+    'currency',               # M  מטבע
+    'price_1',                # N  מחיר מעודכן 1
+    'price_2',                # O  מחיר מעודכן 2
+    'price_3',                # P  מחיר מעודכן 3
+    'price_4',                # Q  מחיר מעודכן 4
+    'floor',                  # R  קומה/מתוך כמה
+    'accessibility_details',  # S  נגישות (מפורט)
+    'accessibility_level',    # T  רמת נגישות
+    'elevator',               # U  מעלית
+    'balcony_1',              # V  מרפסת 1 (מפורט)
+    'balcony_2',              # W  מרפסת 2 (מפורט)
+    'balcony_3',              # X  מרפסת 3 (מפורט)
+    'storage',                # Y  מחסן (מפורט)
+    'shelter',                # Z  מקלט (מפורט)
+    'garden',                 # AA גינה (מפורט)
+    'parking',                # AB חניה (מפורט)
+    'condition',              # AC מצב הדירה
+    'vacancy',                # AD פינוי (מתי)
+    'notes',                  # AE הערות (פרטי הנכס)
+    'timestamp',              # AF
+    'group_name',             # AG
+    'status',                 # AH סטטוס
+    'internal_notes',         # AI הערות פנימיות
+]
+
+COLUMN_INDEX = {name: i for i, name in enumerate(ASSET_COLUMNS)}
+
+PRICE_COLUMNS = ['price_1', 'price_2', 'price_3', 'price_4']
+
+ASSETS_RANGE = 'Assets!A2:AI'
+REALTORS_RANGE = 'Realtors!A:B'
+STREETS_RANGE = 'Streets!A:C'
+APT_TYPES_RANGE = 'Apt_Types!A:A'
+APT_CONDITIONS_RANGE = 'Apt_Conditions!A:A'
+
+# Data rows start below the header row
+FIRST_DATA_ROW = 2
+
+
+def asset_value(row, column):
+    """Value of a named column in a raw sheet row, '' if the row is short."""
+    index = COLUMN_INDEX[column]
+    return row[index] if index < len(row) else ''
+
+
+def format_asset_id(number):
+    return str(number).zfill(4)
+
+
+def parse_asset_id(value):
+    """Numeric value of an asset ID such as "0042", or None if it isn't one.
+
+    Follows dataUtils.getNextAssetId: leading zeros are stripped and the
+    leading digits parsed, so "0000" and "" are not IDs.
+    """
+    match = re.match(r'\d+', str(value or '').strip().lstrip('0'))
+    return int(match.group()) if match else None
@@ -0,0 +1,151 @@
+"""Minimal Google Sheets v4 client built on requests.
+
+Only the handful of value endpoints the scraper uses are covered. The base URL
+can be pointed at a local fake server for tests and benchmarks.
+"""
+import os
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import requests
+
+from services import config
+
+SHEETS_API_URL = 'https://sheets.googleapis.com/v4/spreadsheets'
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+
+class SheetsError(Exception):
+    """A Sheets API call failed; status is the HTTP status code."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f'Sheets API error {status}: {message}')
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def is_quota(self):
+        return self.status == 429
+
+    @property
+    def is_retryable(self):
+        return self.status == 429 or self.status >= 500
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def service_account_token_provider(path=None):
+    """Return a callable producing OAuth tokens for the service account.
+
+    Signing the token request needs google-auth; when it isn't installed, a
+    ready-made token can be supplied in GOOGLE_ACCESS_TOKEN instead.
+    """
+    token = os.environ.get('GOOGLE_ACCESS_TOKEN')
+    if token:
+        return lambda: token
+
+    try:
+        from google.auth.transport.requests import Request
+        from google.oauth2 import service_account
+    except ImportError:
+        raise RuntimeError('Install google-auth or set GOOGLE_ACCESS_TOKEN to access Google Sheets')
+
+    credentials = service_account.Credentials.from_service_account_file(
+        path or config.SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+    def provider():
+        if not credentials.valid:
+            credentials.refresh(Request())
+        return credentials.token
+
+    return provider
+
+
+class SheetsClient:
+    def __init__(self, spreadsheet_id, token_provider=None, base_url=SHEETS_API_URL,
+                 http=None, timeout=30):
+        self.spreadsheet_id = spreadsheet_id
+        self.token_provider = token_provider
+        self.base_url = base_url.rstrip('/')
+        self.http = http or requests.Session()
+        self.timeout = timeout
+        self.calls = 0
+
+    def _request(self, method, path, params=None, body=None):
+        headers = {}
+        if self.token_provider:
+            headers['Authorization'] = f'Bearer {self.token_provider()}'
+        url = f'{self.base_url}/{self.spreadsheet_id}{path}'
+        self.calls += 1
+        try:
+            response = self.http.request(method, url, params=params, json=body,
+                                         headers=headers, timeout=self.timeout)
+        except requests.RequestException as error:
+            # Network failures are treated like a server error so callers retry them
+            raise SheetsError(599, str(error))
+
+        if response.status_code >= 400:
+            retry_after = response.headers.get('Retry-After')
+            try:
+                message = response.json().get('error', {}).get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise SheetsError(response.status_code, message, parse_retry_after(retry_after))
+        if not response.content:
+            return {}
+        try:
+            return response.json()
+        except ValueError:
+            # A proxy or captive portal answered instead of Sheets; retry like a network failure
+            raise SheetsError(599, f'Response is not JSON: {response.text[:100]}')
+
+    def get_values(self, range_, render='FORMATTED_VALUE'):
+        """Return the rows of a range as lists of strings."""
+        data = self._request('GET', f'/values/{quote(range_)}',
+                             params={'valueRenderOption': render})
+        return data.get('values', [])
+
+    def batch_get(self, ranges, render='FORMATTED_VALUE'):
+        """Fetch several ranges in one round trip; returns rows per range, in order."""
+        data = self._request('GET', '/values:batchGet',
+                             params={'ranges': list(ranges), 'valueRenderOption': render})
+        return [value_range.get('values', []) for value_range in data.get('valueRanges', [])]
+
+    def append_rows(self, range_, rows):
+        """Append rows after the table found in range_, like values.append with INSERT_ROWS."""
+        return self._request('POST', f'/values/{quote(range_)}:append',
+                             params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+                             body={'values': rows})
+
+    def batch_update_values(self, data):
+        """Write several {"range", "values"} blocks in one call."""
+        return self._request('POST', '/values:batchUpdate',
+                             body={'valueInputOption': 'RAW', 'data': data})
+
+
+def client_from_env(base_url=None, **kwargs):
+    """Create a client for the configured spreadsheet and service account.
+
+    A base_url points the client at a local stand-in (see services.fake_sheets),
+    which doesn't check credentials.
+    """
+    if base_url:
+        kwargs.setdefault('token_provider', None)
+        kwargs['base_url'] = base_url
+        return SheetsClient(os.environ.get('SPREADSHEET_ID', 'local'), **kwargs)
+    kwargs.setdefault('token_provider', service_account_token_provider())
+    return SheetsClient(config.spreadsheet_id(), **kwargs)
+
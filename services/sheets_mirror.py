@@ -0,0 +1,256 @@
+"""Local SQLite mirror of the Assets, Realtors and Streets sheets.
+
+dataUtils.js reads whole columns from Google Sheets for every message
+(getNextAssetId, getRealtorInfo, validateLocation) and queryBot downloads the
+full Assets range for every query. The mirror keeps an indexed copy of those
+sheets on disk and answers the realtor and location lookups locally. Asset IDs
+come from services.asset_ids, which reserves them; a MAX+1 over a mirror that
+lags the sheet would hand the same ID to concurrent writers.
+
+Syncing is incremental: Realtors and Streets are small and are only rewritten
+when their content changed, and Assets, which only grows at the bottom, is
+fetched from the last known row onwards. A full Assets resync runs every
+full_sync_interval seconds to pick up edits made to existing rows.
+
+Usage:
+    python -m services.sheets_mirror sync [--full]
+    python -m services.sheets_mirror serve [--port 8765] [--interval 60]
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from services import config
+from services.http_api import serve
+from services.schema import (ASSETS_RANGE, FIRST_DATA_ROW, REALTORS_RANGE, STREETS_RANGE,
+                             asset_value, parse_asset_id)
+from services.sheets_client import client_from_env
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    row INTEGER PRIMARY KEY,
+    asset_id TEXT,
+    asset_num INTEGER,
+    phone TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assets_asset_num ON assets(asset_num);
+CREATE INDEX IF NOT EXISTS assets_phone ON assets(phone);
+
+CREATE TABLE IF NOT EXISTS realtors (
+    phone TEXT PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS locations (
+    kind TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (kind, name_lower)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    sheet TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL DEFAULT 0,
+    digest TEXT,
+    synced_at REAL,
+    full_synced_at REAL
+);
+"""
+
+# Streets!A:C column for each location type, with the Hebrew label used in notes
+LOCATION_TYPES = {
+    'neighborhood': (0, 'שכונה'),
+    'street': (1, 'רחוב'),
+    'city': (2, 'עיר'),
+}
+
+
+def _digest(rows):
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def clean_location(location):
+    """Normalize a location the way dataUtils.validateLocation does."""
+    location = location.strip()
+    if location.startswith('ב'):
+        location = location[1:]
+    if location.startswith('ה'):
+        location = location[1:]
+    return location.strip()
+
+
+class SheetsMirror:
+    def __init__(self, client, path=None, full_sync_interval=3600):
+        self.client = client
+        self.full_sync_interval = full_sync_interval
+        self.db = sqlite3.connect(path or config.data_path('sheets_mirror.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.stats = {'syncs': 0, 'lookups': 0, 'sheet_calls': 0, 'last_sync_seconds': None}
+
+    def _state(self, sheet):
+        row = self.db.execute('SELECT rows, digest, full_synced_at FROM sync_state WHERE sheet = ?',
+                              (sheet,)).fetchone()
+        return row or (0, None, None)
+
+    def _save_state(self, sheet, rows, digest, full=False):
+        now = time.time()
+        self.db.execute(
+            'INSERT INTO sync_state (sheet, rows, digest, synced_at, full_synced_at) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(sheet) DO UPDATE SET rows = excluded.rows, digest = excluded.digest, '
+            'synced_at = excluded.synced_at, '
+            'full_synced_at = COALESCE(excluded.full_synced_at, sync_state.full_synced_at)',
+            (sheet, rows, digest, now, now if full else None))
+
+    # --- Syncing ---
+
+    def sync(self, full=False):
+        """Bring the mirror up to date with one batched Sheets request.
+
+        Returns a dict with the number of rows changed per sheet.
+        """
+        start = time.perf_counter()
+        asset_rows, _, full_synced_at = self._state('assets')
+        full = full or full_synced_at is None or time.time() - full_synced_at > self.full_sync_interval
+        first_row = FIRST_DATA_ROW if full else FIRST_DATA_ROW + asset_rows
+        assets_range = ASSETS_RANGE if full else f'Assets!A{first_row}:AI'
+
+        realtors, streets, assets = self.client.batch_get([REALTORS_RANGE, STREETS_RANGE, assets_range])
+        self.stats['sheet_calls'] += 1
+
+        with self.lock, self.db:
+            changed = {
+                'realtors': self._sync_realtors(realtors),
+                'locations': self._sync_locations(streets),
+                'assets': self._sync_assets(assets, first_row, full),
+            }
+        self.stats['syncs'] += 1
+        self.stats['last_sync_seconds'] = round(time.perf_counter() - start, 3)
+        return changed
+
+    def _sync_realtors(self, rows):
+        digest = _digest(rows)
+        if self._state('realtors')[1] == digest:
+            return 0
+        self.db.execute('DELETE FROM realtors')
+        # getRealtorInfo returns the first row with a matching phone
+        self.db.executemany('INSERT OR IGNORE INTO realtors (phone, name) VALUES (?, ?)',
+                            [(row[1], row[0]) for row in rows if len(row) > 1 and row[1]])
+        self._save_state('realtors', len(rows), digest, full=True)
+        return len(rows)
+
+    def _sync_locations(self, rows):
+        digest = _digest(rows)
+        if self._state('locations')[1] == digest:
+            return 0
+        self.db.execute('DELETE FROM locations')
+        entries = []
+        for row in rows:
+            for kind, (column, _) in LOCATION_TYPES.items():
+                if column < len(row) and row[column]:
+                    entries.append((kind, row[column].lower(), row[column]))
+        self.db.executemany('INSERT OR IGNORE INTO locations (kind, name_lower, name) VALUES (?, ?, ?)',
+                            entries)
+        self._save_state('locations', len(rows), digest, full=True)
+        return len(rows)
+
+    def _sync_assets(self, rows, first_row, full):
+        if full:
+            self.db.execute('DELETE FROM assets')
+        self.db.executemany(
+            'INSERT OR REPLACE INTO assets (row, asset_id, asset_num, phone, data) VALUES (?, ?, ?, ?, ?)',
+            [(first_row + i, asset_value(row, 'asset_id'), parse_asset_id(asset_value(row, 'asset_id')),
+              asset_value(row, 'phone'), json.dumps(row, ensure_ascii=False))
+             for i, row in enumerate(rows)])
+        total = (first_row - FIRST_DATA_ROW) + len(rows)
+        self._save_state('assets', total, None, full=full)
+        return len(rows)
+
+    def start_background_sync(self, interval=60):
+        """Sync every interval seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as error:
+                    print(f'Mirror sync failed: {error}')
+
+        thread = threading.Thread(target=loop, name='sheets-mirror-sync', daemon=True)
+        thread.start()
+        return thread
+
+    # --- Lookups (same results as dataUtils.js) ---
+
+    def realtor_info(self, phone):
+        """{"name", "phone"} of the realtor with this phone number, or None."""
+        self.stats['lookups'] += 1
+        with self.lock:
+            row = self.db.execute('SELECT name, phone FROM realtors WHERE phone = ?', (phone,)).fetchone()
+        return {'name': row[0], 'phone': row[1]} if row else None
+
+    def location_exists(self, location, kind):
+        if kind not in LOCATION_TYPES:
+            raise ValueError('Invalid location type')
+        self.stats['lookups'] += 1
+        with self.lock:
+            row = self.db.execute('SELECT 1 FROM locations WHERE kind = ? AND name_lower = ?',
+                                  (kind, location.lower())).fetchone()
+        return row is not None
+
+    def validate_location(self, location, kind):
+        """Mirror of dataUtils.validateLocation: {"value", "internalNote"}."""
+        if not location:
+            return {'value': '', 'internalNote': ''}
+        kind = kind.lower()
+        cleaned = clean_location(location)
+        if self.location_exists(cleaned, kind):
+            return {'value': cleaned, 'internalNote': ''}
+        label = LOCATION_TYPES[kind][1]
+        return {'value': cleaned,
+                'internalNote': f'נמצא/ה {label} חדש/ה: {cleaned}. יש להוסיף ידנית לרשימה.'}
+
+    def asset_rows(self):
+        """All mirrored Assets rows in sheet order, as raw value lists."""
+        with self.lock:
+            return [json.loads(data) for (data,) in self.db.execute('SELECT data FROM assets ORDER BY row')]
+
+    def routes(self):
+        return {
+            ('GET', '/realtors'): lambda query, body: self.realtor_info(query['phone']),
+            ('GET', '/locations/validate'): lambda query, body: self.validate_location(
+                query.get('location', ''), query['type']),
+            ('POST', '/sync'): lambda query, body: self.sync(full=bool(body and body.get('full'))),
+            ('GET', '/stats'): lambda query, body: self.stats,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local SQLite mirror of the scraper sheets.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync = commands.add_parser('sync', help='sync the mirror once')
+    sync.add_argument('--full', action='store_true', help='refetch every Assets row')
+    sync.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    serve_cmd = commands.add_parser('serve', help='serve lookups and keep the mirror in sync')
+    serve_cmd.add_argument('--port', type=int, default=8765)
+    serve_cmd.add_argument('--interval', type=int, default=60, help='seconds between syncs')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    args = parser.parse_args(argv)
+
+    mirror = SheetsMirror(client_from_env(args.sheets_url))
+    if args.command == 'sync':
+        print(json.dumps(mirror.sync(full=args.full)))
+        return
+
+    mirror.sync()
+    mirror.start_background_sync(args.interval)
+    serve(mirror.routes(), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Write-behind queue that batches rows into multi-row Sheets appends.
+
+sheetsUpdater.appendRow() makes one values.append call per listing, so a busy
+group quickly runs into the Sheets write quota and rows are lost. Rows
+queued here are stored in SQLite first and then flushed as multi-row appends
+when max_batch rows are waiting or the oldest has waited max_delay seconds.
+Quota (429) and server errors are retried with exponential backoff, honouring
+Retry-After, and so is any other failure of the flushing thread. Rows stay on
+disk until Sheets accepts them, so a restart picks up where the last run
+stopped. Flushing on shutdown gives up after flush_timeout seconds and leaves
+the rest queued for the next run.
+
+A flush that times out after Sheets already stored the rows will be retried,
+so in that rare case a row can be appended twice.
+
+Usage:
+    python -m services.sheets_writer serve [--port 8767] [--batch 50] [--delay 5]
+"""
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from services import config
+from services.http_api import serve
+from services.sheets_client import SheetsError, client_from_env
+
+DEFAULT_RANGE = 'Assets!A2'
+FLUSH_TIMEOUT = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    range TEXT NOT NULL,
+    row TEXT NOT NULL,
+    enqueued_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failed (
+    id INTEGER PRIMARY KEY,
+    range TEXT NOT NULL,
+    row TEXT NOT NULL,
+    error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class SheetsWriteQueue:
+    def __init__(self, client, path=None, max_batch=50, max_delay=5.0,
+                 base_backoff=1.0, max_backoff=120.0):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.db = sqlite3.connect(path or config.data_path('sheets_queue.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.flush_requested = False
+        self.thread = None
+        self.stats = {'queued': 0, 'written': 0, 'api_calls': 0, 'retries': 0,
+                      'quota_errors': 0, 'errors': 0, 'failed': 0}
+
+    # --- Producer side ---
+
+    def enqueue(self, rows, range_=DEFAULT_RANGE, then=None):
+        """Persist rows for writing; returns the number of rows now pending.
+
+        then, if given, is called with the database connection inside the
+        same transaction, so a caller can record its own progress in this
+        file atomically with the rows.
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany('INSERT INTO pending (range, row, enqueued_at) VALUES (?, ?, ?)',
+                                [(range_, json.dumps(row, ensure_ascii=False), now) for row in rows])
+            if then:
+                then(self.db)
+        self.stats['queued'] += len(rows)
+        pending = self.pending_count()
+        if pending >= self.max_batch:
+            self.wakeup.set()
+        return pending
+
+    def pending_count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    # --- Flushing ---
+
+    def _next_batch(self):
+        """Oldest pending rows that share a range, up to max_batch of them."""
+        with self.lock:
+            first = self.db.execute('SELECT range, enqueued_at FROM pending ORDER BY id LIMIT 1').fetchone()
+            if not first:
+                return None, None, []
+            rows = self.db.execute('SELECT id, row FROM pending WHERE range = ? ORDER BY id LIMIT ?',
+                                   (first[0], self.max_batch)).fetchall()
+        return first[0], first[1], rows
+
+    def _due(self, enqueued_at, count):
+        return count >= self.max_batch or time.time() - enqueued_at >= self.max_delay
+
+    def flush_once(self, force=False):
+        """Write one batch if it is due (or force is set); returns rows written.
+
+        Raises SheetsError for retryable failures (and passes on any other
+        exception) so the caller can back off.
+        """
+        range_, enqueued_at, batch = self._next_batch()
+        if not batch or not (force or self._due(enqueued_at, len(batch))):
+            return 0
+
+        ids = [row_id for row_id, _ in batch]
+        self.stats['api_calls'] += 1
+        try:
+            self.client.append_rows(range_, [json.loads(row) for _, row in batch])
+        except SheetsError as error:
+            if error.is_retryable:
+                raise
+            # The request itself is bad; retrying won't help, so park the rows
+            self._park(batch, range_, str(error))
+            return 0
+
+        with self.lock, self.db:
+            self.db.executemany('DELETE FROM pending WHERE id = ?', [(row_id,) for row_id in ids])
+        self.stats['written'] += len(ids)
+        return len(ids)
+
+    def _park(self, batch, range_, error):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany('INSERT INTO failed (id, range, row, error, failed_at) VALUES (?, ?, ?, ?, ?)',
+                                [(row_id, range_, row, error, now) for row_id, row in batch])
+            self.db.executemany('DELETE FROM pending WHERE id = ?', [(row_id,) for row_id, _ in batch])
+        self.stats['failed'] += len(batch)
+        print(f'Dropped {len(batch)} rows into the failed table: {error}')
+
+    def flush(self, timeout=None):
+        """Write everything that is pending now; returns True if nothing is left.
+
+        Failures are retried with backoff until timeout seconds have passed
+        (forever if None). Rows not written by then stay pending on disk.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt = 0
+        while self.pending_count():
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f'Gave up flushing after {timeout:g}s; {self.pending_count()} rows stay queued '
+                      'for the next run')
+                return False
+            try:
+                self.flush_once(force=True)
+                attempt = 0
+            except Exception as error:
+                self._backoff(error, attempt, deadline)
+                attempt += 1
+        return True
+
+    def _backoff(self, error, attempt, deadline=None):
+        self.stats['retries'] += 1
+        retry_after = None
+        if isinstance(error, SheetsError):
+            if error.is_quota:
+                self.stats['quota_errors'] += 1
+            retry_after, reason = error.retry_after, error.status
+        else:
+            self.stats['errors'] += 1
+            reason = f'{type(error).__name__}: {error}'
+        delay = min(self.max_backoff, retry_after or self.base_backoff * (2 ** attempt))
+        # Jitter keeps several writers from retrying in lockstep
+        delay *= random.uniform(1.0, 1.25)
+        if deadline is not None:
+            delay = max(0.0, min(delay, deadline - time.monotonic()))
+        print(f'Sheets write failed ({reason}), retrying in {delay:.1f}s')
+        self.stopping.wait(delay)
+
+    def _run(self):
+        attempt = 0
+        while not self.stopping.is_set():
+            try:
+                written = self.flush_once(force=self.flush_requested)
+                attempt = 0
+                if not written:
+                    self.flush_requested = False
+            except Exception as error:
+                # Whatever went wrong, the rows are still on disk; keep the thread alive
+                self._backoff(error, attempt)
+                attempt += 1
+                continue
+            if not written:
+                self.wakeup.wait(min(self.max_delay, 1.0))
+                self.wakeup.clear()
+
+    def start(self):
+        """Flush in the background until stop() is called."""
+        self.thread = threading.Thread(target=self._run, name='sheets-writer', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, flush=True, flush_timeout=FLUSH_TIMEOUT):
+        """Stop the background thread, then flush for up to flush_timeout seconds.
+
+        Returns True if no rows are left pending.
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        if flush:
+            self.stopping.clear()
+            return self.flush(flush_timeout)
+        return not self.pending_count()
+
+    def routes(self):
+        def enqueue(query, body):
+            if not isinstance(body, dict) or not ('rows' in body or 'row' in body):
+                raise ValueError('Expected a JSON body with "rows" or "row"')
+            rows = body['rows'] if 'rows' in body else [body['row']]
+            if not isinstance(rows, list) or not all(isinstance(row, list) for row in rows):
+                raise ValueError('Rows must be lists of cell values')
+            return {'pending': self.enqueue(rows, body.get('range', DEFAULT_RANGE))}
+
+        def flush(query, body):
+            self.flush_requested = True
+            self.wakeup.set()
+            return {'pending': self.pending_count()}
+
+        return {
+            ('POST', '/rows'): enqueue,
+            ('POST', '/flush'): flush,
+            ('GET', '/stats'): lambda query, body: dict(self.stats, pending=self.pending_count()),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batched, persistent Google Sheets writer.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_cmd = commands.add_parser('serve', help='accept rows over HTTP and write them in batches')
+    serve_cmd.add_argument('--port', type=int, default=8767)
+    serve_cmd.add_argument('--batch', type=int, default=50, help='rows per append call')
+    serve_cmd.add_argument('--delay', type=float, default=5.0, help='longest a row waits before a flush')
+    serve_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    flush_cmd = commands.add_parser('flush', help='write every pending row and exit')
+    flush_cmd.add_argument('--sheets-url', help='Sheets API base URL, e.g. a fake server')
+    flush_cmd.add_argument('--timeout', type=float, help='give up after this many seconds (default: keep trying)')
+    args = parser.parse_args(argv)
+
+    client = client_from_env(getattr(args, 'sheets_url', None))
+    if args.command == 'flush':
+        queue = SheetsWriteQueue(client)
+        queue.flush(args.timeout)
+        print(json.dumps(dict(queue.stats, pending=queue.pending_count())))
+        return
+
+    queue = SheetsWriteQueue(client, max_batch=args.batch, max_delay=args.delay).start()
+    try:
+        serve(queue.routes(), port=args.port)
+    finally:
+        queue.stop()
+
+
+if __name__ == '__main__':
+    main()
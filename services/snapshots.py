@@ -0,0 +1,294 @@
+"""Append-only, content-addressed snapshots of scraped rows for committing to git.
+
+Committing a full sheet export on every sync rewrites one big file each
+time, which git's delta compression handles poorly. A snapshot store keeps
+the rows as gzip-compressed JSON-lines segments instead. Each snapshot
+writes one segment holding only the rows that were added, changed or
+removed since the previous one, named after the hash of its content, and
+records it in a small manifest.json. Segments are never rewritten, so every
+commit adds one small new file.
+
+    snapshots/assets/
+        manifest.json
+        segments/3f9c...e1.jsonl.gz
+
+Rows are identified by a key column (the asset ID for the Assets sheet).
+Each written row also records its position in the export, and a segment
+holds the full key order only when rows that didn't change were reordered.
+A view at any snapshot is rebuilt by replaying its segments oldest first,
+in the export's row order. Segments are read through mmap.
+
+Usage:
+    python -m services.snapshots take assets.csv [--dir snapshots/assets] [--key asset_id]
+    python -m services.snapshots take --mirror [--dir snapshots/assets]
+    python -m services.snapshots log snapshots/assets
+    python -m services.snapshots view snapshots/assets [--at 3] [--csv out.csv]
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+from datetime import datetime
+
+from services.schema import ASSET_COLUMNS
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+SEGMENTS = 'segments'
+
+
+def _row_digest(row):
+    return hashlib.sha256(json.dumps(row, ensure_ascii=False).encode('utf-8')).hexdigest()[:32]
+
+
+def read_export(path):
+    """(columns, rows) from a CSV export with a header row, or JSON lines of row arrays."""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            return columns, [row for row in reader if any(row)]
+    with open(path, encoding='utf-8') as f:
+        return None, [json.loads(line) for line in f if line.strip()]
+
+
+class SnapshotStore:
+    def __init__(self, path, key=None):
+        self.path = path
+        self.segments_dir = os.path.join(path, SEGMENTS)
+        self.manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if key is not None and key != self.manifest['key']:
+                raise ValueError(f"{path} is keyed on {self.manifest['key']!r}, not {key!r}")
+        else:
+            self.manifest = {'format': FORMAT_VERSION, 'key': key, 'columns': None, 'snapshots': []}
+
+    @property
+    def snapshots(self):
+        return self.manifest['snapshots']
+
+    def _key_index(self, columns):
+        key = self.manifest['key']
+        if key is None:
+            # A new store is keyed on the export's first column
+            key = self.manifest['key'] = columns[0] if columns else 0
+        if isinstance(key, int):
+            return key
+        if not columns or key not in columns:
+            raise ValueError(f'Key column {key!r} is not in the export')
+        return columns.index(key)
+
+    def segment_path(self, segment):
+        return os.path.join(self.segments_dir, segment + '.jsonl.gz')
+
+    def read_segment(self, segment):
+        """Records of one segment.
+
+        {"k": key, "p": position, "r": row} for an added or changed row,
+        {"k": key, "d": 1} for a removal and {"o": [keys]} for a full key order.
+        """
+        with open(self.segment_path(segment), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                gzip.GzipFile(fileobj=data) as lines:
+            for line in lines:
+                yield json.loads(line)
+
+    def _segments(self, at=None):
+        """Segment ids up to and including snapshot at (default: the latest)."""
+        snapshots = self.snapshots if at is None else [s for s in self.snapshots if s['id'] <= at]
+        if at is not None and not any(s['id'] == at for s in self.snapshots):
+            raise ValueError(f'No snapshot {at} in {self.path}')
+        return [s['segment'] for s in snapshots if s['segment']]
+
+    def _replay(self, at=None):
+        """(keys in row order, {key: row}) at snapshot at (default: the latest)."""
+        order, rows = [], {}
+        for segment in self._segments(at):
+            placed, appended, touched, full = {}, [], set(), None
+            for record in self.read_segment(segment):
+                if 'o' in record:
+                    full = record['o']
+                    continue
+                touched.add(record['k'])
+                if 'd' in record:
+                    rows.pop(record['k'], None)
+                    continue
+                rows[record['k']] = record['r']
+                if 'p' in record:
+                    placed[record['p']] = record['k']
+                else:
+                    appended.append(record['k'])
+            if full is not None:
+                order = full
+                continue
+            # Rows that didn't change keep their order and fill the positions not written
+            rest = [key for key in order if key not in touched]
+            unplaced = iter(rest)
+            order = [placed[i] if i in placed else next(unplaced) for i in range(len(rest) + len(placed))]
+            order += appended
+        return order, rows
+
+    def view(self, at=None):
+        """(key, row) for every live row at snapshot at, in row order."""
+        order, rows = self._replay(at)
+        for key in order:
+            yield key, rows[key]
+
+    def write(self, rows, columns=None, label=None, keep_missing=False):
+        """Record rows as the next snapshot; returns its manifest entry, or None if nothing changed.
+
+        Rows missing from rows are recorded as removed unless keep_missing
+        is set (for partial exports). Rows without a key are keyed on their
+        content. A key seen again (the Assets sheet has duplicate IDs) gets a
+        "#2", "#3"... suffix so every row is kept; the entry counts them in
+        duplicate_keys.
+        """
+        key_index = self._key_index(columns)
+        previous_order, previous_rows = self._replay()
+        current = {key: _row_digest(row) for key, row in previous_rows.items()}
+        records, order, seen, occurrences = [], [], set(), {}
+        added = changed = duplicates = 0
+        for row in rows:
+            key = str(row[key_index]) if key_index < len(row) and row[key_index] != '' else None
+            digest = _row_digest(row)
+            key = key or 'sha:' + digest
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if occurrences[key] > 1:
+                duplicates += 1
+                key = f'{key}#{occurrences[key]}'
+            seen.add(key)
+            order.append(key)
+            if key not in current:
+                added += 1
+            elif current[key] != digest:
+                changed += 1
+            else:
+                continue
+            records.append({'k': key, 'p': len(order) - 1, 'r': row})
+        removed = 0
+        if keep_missing:
+            order += [key for key in previous_order if key not in seen]
+        else:
+            for key in previous_order:
+                if key not in seen:
+                    records.append({'k': key, 'd': 1})
+                    removed += 1
+
+        touched = {record['k'] for record in records}
+        if [key for key in order if key not in touched] != [key for key in previous_order if key not in touched]:
+            # Unchanged rows moved, so positions alone can't rebuild the order
+            records.insert(0, {'o': order})
+        if not records and self.snapshots:
+            return None
+        segment = self._write_segment(records) if records else None
+        entry = {
+            'id': (self.snapshots[-1]['id'] + 1) if self.snapshots else 1,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'label': label or '',
+            'segment': segment,
+            'rows': len(order),
+            'added': added,
+            'changed': changed,
+            'removed': removed,
+            'duplicate_keys': duplicates,
+        }
+        self.snapshots.append(entry)
+        if columns:
+            self.manifest['columns'] = columns
+        self._save_manifest()
+        return entry
+
+    def _write_segment(self, records):
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        segment = hashlib.sha256(data).hexdigest()[:40]
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            os.makedirs(self.segments_dir, exist_ok=True)
+            # mtime=0 keeps the compressed bytes identical for identical content
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+                f.write(data)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp, path)
+        return segment
+
+    def _save_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+            f.write('\n')
+        os.replace(tmp, self.manifest_path)
+
+
+def print_log(store):
+    print(f"{'id':>4}  {'created':<19}  {'rows':>7}  {'added':>6}  {'changed':>7}  {'removed':>7}  label")
+    for s in store.snapshots:
+        print(f"{s['id']:>4}  {s['created_at']:<19}  {s['rows']:>7}  {s['added']:>6}  {s['changed']:>7}  "
+              f"{s['removed']:>7}  {s['label']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append-only compressed snapshots of scraped rows.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    take = commands.add_parser('take', help='record an export (or the mirrored Assets rows) as a snapshot')
+    take.add_argument('export', nargs='?', help='CSV with a header row, or JSON lines of row arrays')
+    take.add_argument('--mirror', action='store_true', help='snapshot the Assets rows of the sheets mirror')
+    take.add_argument('--dir', help='snapshot directory (default: snapshots/<export name>)')
+    take.add_argument('--key', help='key column name (default: the first column)')
+    take.add_argument('--label', help='note stored with the snapshot')
+    take.add_argument('--keep-missing', action='store_true', help="don't record rows missing from the export as removed")
+    log = commands.add_parser('log', help='list the snapshots in a directory')
+    log.add_argument('dir')
+    view = commands.add_parser('view', help='print the rows of a snapshot')
+    view.add_argument('dir')
+    view.add_argument('--at', type=int, help='snapshot id (default: the latest)')
+    view.add_argument('--csv', help='write the rows to this CSV file instead')
+    args = parser.parse_args(argv)
+
+    if args.command == 'log':
+        print_log(SnapshotStore(args.dir))
+        return
+    if args.command == 'view':
+        store = SnapshotStore(args.dir)
+        out = open(args.csv, 'w', newline='', encoding='utf-8') if args.csv else sys.stdout
+        writer = csv.writer(out)
+        if store.manifest['columns']:
+            writer.writerow(store.manifest['columns'])
+        for _, row in store.view(args.at):
+            writer.writerow(row)
+        if args.csv:
+            out.close()
+        return
+
+    if args.mirror:
+        # Imported here: GitPush uses this module without the services' dependencies
+        from services.sheets_mirror import SheetsMirror
+        columns, rows, name = ASSET_COLUMNS, SheetsMirror(client=None).asset_rows(), 'assets'
+    elif args.export:
+        (columns, rows), name = read_export(args.export), os.path.splitext(os.path.basename(args.export))[0]
+    else:
+        parser.error('take needs an export file or --mirror')
+    store = SnapshotStore(args.dir or os.path.join('snapshots', name), args.key)
+    entry = store.write(rows, columns, args.label, args.keep_missing)
+    if entry is None:
+        print(f'No changes since snapshot {store.snapshots[-1]["id"]}.')
+        return
+    print(f"Snapshot {entry['id']}: {entry['rows']} rows, {entry['added']} added, {entry['changed']} changed, "
+          f"{entry['removed']} removed" + (f" -> {store.segment_path(entry['segment'])}" if entry['segment'] else ''))
+    if entry['duplicate_keys']:
+        print(f"Warning: {entry['duplicate_keys']} rows repeat an earlier {store.manifest['key']!r}; "
+              'they are kept under suffixed keys')
+
+
+if __name__ == '__main__':
+    main()
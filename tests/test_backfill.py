@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from services.backfill import Backfill, Checkpoints, parse_export, skip_reason
+from services.ingest import NON_TEXT
+from services.sheets_writer import SheetsWriteQueue
+
+ANDROID = '''12/03/2024, 14:35 - Messages and calls are end-to-end encrypted.
+12/03/2024, 14:36 - דנה נכסים: למכירה דירת 4 חדרים ברחוב הרצל, 2,450,000 ₪
+קומה 3 עם מעלית
+12/03/2024, 14:40 - +972 50-123-4567: <Media omitted>
+13/03/2024, 09:05 - +972 50-123-4567: תודה <This message was edited>
+'''.splitlines(True)
+
+IOS = [
+    '‎[03.12.24, 2:35:12 PM] Dana: דירת 3 חדרים בשכונת נווה שאנן 1,200,000 ש"ח\n',
+    '[03.12.24, 9:01:00 AM] Dana: ‎image omitted\n',
+]
+
+
+def listing(i):
+    return {'groupId': '', 'groupName': 'g', 'sender': 's', 'phone': '', 'timestamp': '',
+            'text': f'דירת {i} חדרים למכירה ברחוב הרצל במחיר טוב'}
+
+
+class FakePipeline:
+    """Turns every message into one row, failing on the texts in fail."""
+
+    def __init__(self, fail=()):
+        self.writer = None
+        self.fail = set(fail)
+        self.stats = {'errors': 0}
+
+    async def process(self, message):
+        if message['text'] in self.fail:
+            self.stats['errors'] += 1
+            return
+        self.writer.enqueue([[message['text']]])
+
+
+def make_writer(tmp_path):
+    return SheetsWriteQueue(client=None, path=str(tmp_path / 'queue.db'))
+
+
+def pending_rows(writer):
+    return [json.loads(row)[0] for (row,) in writer.db.execute('SELECT row FROM pending ORDER BY id')]
+
+
+def test_parse_android_export():
+    messages = list(parse_export(ANDROID, 'נדל"ן', 'jid'))
+    assert [m['sender'] for m in messages] == ['דנה נכסים', '+972 50-123-4567', '+972 50-123-4567']
+    assert messages[0]['text'] == 'למכירה דירת 4 חדרים ברחוב הרצל, 2,450,000 ₪\nקומה 3 עם מעלית'
+    assert messages[0]['timestamp'] == '12/03/2024 14:36'
+    assert (messages[0]['groupName'], messages[0]['groupId'], messages[0]['phone']) == ('נדל"ן', 'jid', '')
+    assert (messages[1]['text'], messages[1]['phone']) == (NON_TEXT, '972501234567')
+    assert messages[2]['text'] == 'תודה'
+
+
+def test_parse_ios_export_with_marks_and_am_pm():
+    messages = list(parse_export(IOS, month_first=False))
+    assert [m['timestamp'] for m in messages] == ['03/12/2024 14:35', '03/12/2024 09:01']
+    assert messages[1]['text'] == NON_TEXT
+    assert list(parse_export(IOS, month_first=True))[0]['timestamp'] == '12/03/2024 14:35'
+
+
+def test_skip_reasons():
+    messages = list(parse_export(ANDROID))
+    assert [skip_reason(m) for m in messages] == [None, 'media', 'short']
+
+
+def test_checkpoint_and_rows_commit_together(tmp_path):
+    writer = make_writer(tmp_path)
+    checkpoints = Checkpoints(writer)
+    checkpoints.save('a.txt', 10, 2, [['r1'], ['r2']])
+    assert checkpoints.get('a.txt') == (10, 2)
+    assert pending_rows(writer) == ['r1', 'r2']
+
+    def broken(db):
+        raise RuntimeError('crash before the checkpoint')
+
+    with pytest.raises(RuntimeError):
+        writer.enqueue([['r3']], then=broken)
+    assert pending_rows(writer) == ['r1', 'r2']
+
+
+def test_resume_queues_every_row_once(tmp_path):
+    writer = make_writer(tmp_path)
+    messages = [listing(i) for i in range(10)]
+    failing = Backfill(FakePipeline(fail=[messages[6]['text']]), Checkpoints(writer), batch_size=3)
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing.run_source('a.txt', iter(messages)))
+    assert Checkpoints(writer).get('a.txt') == (6, 6)
+
+    resumed = Backfill(FakePipeline(), Checkpoints(make_writer(tmp_path)), batch_size=3)
+    assert asyncio.run(resumed.run_source('a.txt', iter(messages))) == (10, 10)
+    assert pending_rows(writer) == [m['text'] for m in messages]
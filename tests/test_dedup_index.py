@@ -0,0 +1,64 @@
+from services.dedup_index import DedupIndex, phone_key
+from services.schema import ASSET_COLUMNS
+
+MESSAGE = ('למכירה דירת 4 חדרים מרווחת ברחוב הרצל 12 בתל אביב, קומה 3 מתוך 5, מרפסת שמש, '
+           'חניה ומחסן, משופצת מהיסוד. מחיר 2,450,000 ₪. לפרטים נוספים התקשרו')
+
+
+def asset_row(**values):
+    row = [''] * len(ASSET_COLUMNS)
+    for name, value in values.items():
+        row[ASSET_COLUMNS.index(name)] = value
+    return row
+
+
+def seeded_index(tmp_path):
+    index = DedupIndex(str(tmp_path / 'dedup.db'))
+    index.seed_from_assets([
+        asset_row(asset_id='0001', phone='050-1234567', street='הרצל', house_number='12', city='תל אביב',
+                  rooms='4', apartment_type='דירה', price_1='2,450,000', notes='משופצת'),
+        asset_row(asset_id='0002', phone='050-1234567', street='ביאליק', house_number='3', city='תל אביב',
+                  rooms='3', price_1='1,900,000'),
+    ])
+    return index
+
+
+def test_phone_key_ignores_country_code():
+    assert phone_key('+972 50-123-4567') == phone_key('0501234567')
+
+
+def test_message_matches_seeded_row_by_fields(tmp_path):
+    index = seeded_index(tmp_path)
+    fields = {'street': 'הרצל', 'house_number': '12', 'city': 'תל אביב', 'rooms': '4'}
+    result = index.classify(MESSAGE, '972501234567', fields)
+    assert (result['status'], result['asset_id'], result['match']) == ('duplicate', '0001', 'key')
+
+
+def test_message_matches_seeded_row_by_text(tmp_path):
+    result = seeded_index(tmp_path).classify(MESSAGE, '0501234567')
+    assert (result['status'], result['asset_id']) == ('duplicate', '0001')
+
+
+def test_new_price_is_a_price_update(tmp_path):
+    result = seeded_index(tmp_path).classify(MESSAGE.replace('2,450,000', '2,300,000'), '0501234567')
+    assert (result['status'], result['previous_price'], result['price']) == ('price_update', 2450000, 2300000)
+
+
+def test_other_phone_or_rooms_is_new(tmp_path):
+    index = seeded_index(tmp_path)
+    assert index.classify(MESSAGE, '0529999999')['status'] == 'new'
+    assert index.classify(MESSAGE.replace('4 חדרים', '5 חדרים'), '0501234567')['status'] == 'new'
+
+
+def test_reposted_message_is_a_duplicate(tmp_path):
+    index = DedupIndex(str(tmp_path / 'dedup.db'))
+    first = index.observe('0007', MESSAGE, '0541111111')
+    again = index.classify(MESSAGE.replace('משופצת מהיסוד', 'משופצת'), '0541111111')
+    assert first['status'] == 'new'
+    assert (again['status'], again['asset_id'], again['match']) == ('duplicate', '0007', 'text')
+
+
+def test_seeding_twice_adds_nothing(tmp_path):
+    index = seeded_index(tmp_path)
+    assert index.seed_from_assets([asset_row(asset_id='0001', phone='0501234567')]) == 0
+    assert len(index) == 2
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.extraction_worker import ExtractionCache, ExtractionService, full_prompt
+
+MESSAGE = {'groupName': 'נדל"ן', 'sender': 'Dana', 'phone': '0501234567', 'text': 'דירת 4 חדרים ברחוב הרצל'}
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, model, messages):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        content = '```json\n{"רחוב": "הרצל", "מספר החדרים": "4"}\n```'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def fake_client():
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+
+def test_empty_cache_passed_in_is_used(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'cache.db'))
+    assert len(cache) == 0
+    assert ExtractionService(full_prompt(lambda: 'prompt'), client=fake_client(), cache=cache).cache is cache
+
+
+def test_cross_posts_share_one_call(tmp_path):
+    client = fake_client()
+    service = ExtractionService(full_prompt(lambda: 'prompt'), client=client,
+                                cache=ExtractionCache(str(tmp_path / 'cache.db')))
+
+    async def run():
+        service.start()
+        results = await asyncio.gather(*(service.extract(dict(MESSAGE, groupName=f'group {i}')) for i in range(3)))
+        again = await service.extract(MESSAGE)
+        await service.stop()
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert results == [{'רחוב': 'הרצל', 'מספר החדרים': '4'}] * 3
+    assert again == results[0]
+    assert client.chat.completions.calls == 1
+    assert (service.stats['shared_inflight'], service.stats['cache_hits']) == (2, 1)
+
+
+def test_warm_builds_the_prompt_before_the_loop(tmp_path):
+    loads = []
+
+    def system_prompt():
+        loads.append(1)
+        return 'prompt'
+
+    ExtractionService(full_prompt(system_prompt), client=fake_client(),
+                      cache=ExtractionCache(str(tmp_path / 'cache.db'))).warm()
+    assert loads == [1]
@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import GitPush
+
+HASH = "0" * 40
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def test_parse_branch_headers():
+    snapshot = GitPush.parse_porcelain_v2(
+        f"# branch.oid {HASH}\0# branch.head main\0# branch.upstream origin/main\0# branch.ab +2 -3\0")
+    assert (snapshot.head, snapshot.branch, snapshot.upstream) == (HASH, "main", "origin/main")
+    assert (snapshot.ahead, snapshot.behind, snapshot.has_changes) == (2, 3, False)
+
+
+def test_parse_initial_and_detached_heads():
+    snapshot = GitPush.parse_porcelain_v2("# branch.oid (initial)\0# branch.head (detached)\0")
+    assert (snapshot.head, snapshot.branch) == (None, "")
+
+
+def test_parse_entries():
+    output = "\0".join([
+        f"1 M. N... 100644 100644 100644 {HASH} {HASH} staged file.txt",
+        f"1 .M N... 100644 100644 100644 {HASH} {HASH} both/../edited.py",
+        f"1 MM N... 100644 100644 100644 {HASH} {HASH} twice.md",
+        f"2 R. N... 100644 100644 100644 {HASH} {HASH} R100 new name.txt", "old name.txt",
+        f"u UU N... 100644 100644 100644 100644 {HASH} {HASH} {HASH} conflict.js",
+        "? untracked dir/file.txt",
+        "? twice.md",
+    ]) + "\0"
+    snapshot = GitPush.parse_porcelain_v2(output)
+    assert [e.path for e in snapshot.staged] == ["staged file.txt", "twice.md", "new name.txt"]
+    assert [e.path for e in snapshot.unstaged] == ["both/../edited.py", "twice.md"]
+    assert snapshot.renamed == [GitPush.StatusEntry("new name.txt", "R", ".", "old name.txt")]
+    assert [e.path for e in snapshot.conflicted] == ["conflict.js"]
+    assert snapshot.untracked == ["untracked dir/file.txt", "twice.md"]
+    assert snapshot.changed_paths() == ["staged file.txt", "twice.md", "new name.txt", "both/../edited.py",
+                                        "conflict.js", "untracked dir/file.txt"]
+
+
+def test_parse_real_git_status(tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    git(tmp_path, "config", "user.name", "test")
+    git(tmp_path, "config", "user.email", "test@example.com")
+    for name in ("a.txt", "b.txt", "old.txt"):
+        (tmp_path / name).write_text(name * 20)
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "init")
+    (tmp_path / "a.txt").write_text("changed")
+    git(tmp_path, "mv", "old.txt", "renamed file.txt")
+    (tmp_path / "c d.txt").write_text("new")
+    os.remove(tmp_path / "b.txt")
+
+    output = subprocess.run(["git", "-C", str(tmp_path), "status", "--porcelain=v2", "-z", "--branch"],
+                            check=True, capture_output=True, text=True).stdout
+    snapshot = GitPush.parse_porcelain_v2(output)
+    assert snapshot.branch == "main" and snapshot.head
+    assert [(e.path, e.orig_path) for e in snapshot.renamed] == [("renamed file.txt", "old.txt")]
+    assert sorted((e.path, e.worktree) for e in snapshot.unstaged) == [("a.txt", "M"), ("b.txt", "D")]
+    assert snapshot.untracked == ["c d.txt"]
+
+
+def test_commit_message_placeholders(monkeypatch):
+    monkeypatch.setattr(GitPush.session, "status", lambda: GitPush.parse_porcelain_v2("? a.txt\0? b.txt\0"))
+    message = GitPush.format_commit_message("Sync {branch}: {files} files on {date}", "main")
+    assert message.startswith("Sync main: 2 files on 20")
+
+
+def test_commit_message_keeps_other_braces():
+    message = 'Update {"a": 1} and {unknown} }{'
+    assert GitPush.format_commit_message(message, "main") == message
+
+
+def test_shared_connection_skips_repos_without_ssh_remotes(tmp_path, capsys):
+    entries = []
+    for name, url in [("https", "https://example.com/a.git"), ("ssh", "git@example.com:b.git")]:
+        repo = tmp_path / name
+        git(tmp_path, "init", "-q", str(repo))
+        git(repo, "remote", "add", "origin", url)
+        entries.append({"path": str(repo)})
+    GitPush.open_shared_connection(entries, dict(os.environ, GIT_SSH_COMMAND="false"))
+    assert "shared SSH connection for git@example.com:b.git" in capsys.readouterr().out
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer
+
+import requests
+
+from services.http_api import make_handler
+from services.sheets_client import SheetsClient, SheetsError, parse_retry_after
+from services.sheets_writer import SheetsWriteQueue
+
+
+class FakeClient:
+    """append_rows() raises the queued errors in turn, then records the rows."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.appended = []
+
+    def append_rows(self, range_, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.appended.append((range_, rows))
+
+
+def make_queue(tmp_path, client, **kwargs):
+    kwargs.setdefault('base_backoff', 0.01)
+    return SheetsWriteQueue(client, path=str(tmp_path / 'queue.db'), max_delay=0.05, **kwargs)
+
+
+def test_retry_after_seconds_and_http_date():
+    assert parse_retry_after('7') == 7.0
+    assert 50 <= parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_flush_retries_quota_errors(tmp_path):
+    client = FakeClient(SheetsError(429, 'quota', retry_after=0.01), SheetsError(503, 'unavailable'))
+    queue = make_queue(tmp_path, client)
+    queue.enqueue([['0001', 'a'], ['0002', 'b']])
+    assert queue.flush(timeout=5)
+    assert client.appended == [('Assets!A2', [['0001', 'a'], ['0002', 'b']])]
+    assert (queue.stats['retries'], queue.stats['quota_errors']) == (2, 1)
+
+
+def test_bad_request_is_parked(tmp_path):
+    queue = make_queue(tmp_path, FakeClient(SheetsError(400, 'bad range')))
+    queue.enqueue([['0001']])
+    assert queue.flush(timeout=5)
+    assert queue.stats['failed'] == 1
+    assert queue.db.execute('SELECT COUNT(*) FROM failed').fetchone()[0] == 1
+
+
+def test_flush_gives_up_and_keeps_rows(tmp_path):
+    client = FakeClient(*[SheetsError(503, 'unavailable')] * 1000)
+    queue = make_queue(tmp_path, client)
+    queue.enqueue([['0001']])
+    start = time.monotonic()
+    assert not queue.flush(timeout=0.2)
+    assert time.monotonic() - start < 2
+    assert queue.pending_count() == 1
+    # The next run starts from the same file and writes the row
+    client.errors = []
+    assert make_queue(tmp_path, client).flush(timeout=5)
+    assert client.appended == [('Assets!A2', [['0001']])]
+
+
+def test_background_thread_survives_unexpected_errors(tmp_path):
+    client = FakeClient(ValueError('bad Retry-After'), RuntimeError('token refresh failed'))
+    queue = make_queue(tmp_path, client).start()
+    try:
+        queue.enqueue([['0001']])
+        deadline = time.monotonic() + 5
+        while not client.appended and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert queue.thread.is_alive()
+        assert client.appended == [('Assets!A2', [['0001']])]
+        assert queue.stats['errors'] == 2
+    finally:
+        assert queue.stop(flush_timeout=1)
+
+
+def test_non_json_response_is_retryable():
+    class Response:
+        status_code, headers, content, text = 200, {}, b'<html>', '<html>'
+
+        def json(self):
+            raise ValueError('not JSON')
+
+    class Http:
+        def request(self, *args, **kwargs):
+            return Response()
+
+    try:
+        SheetsClient('sheet', http=Http()).append_rows('Assets!A2', [['x']])
+    except SheetsError as error:
+        assert error.is_retryable
+    else:
+        raise AssertionError('expected a SheetsError')
+
+
+def test_rows_route_rejects_empty_body(tmp_path):
+    queue = make_queue(tmp_path, FakeClient())
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(queue.routes()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/rows'
+    try:
+        assert requests.post(url).status_code == 400
+        assert requests.post(url, json={'rows': 'x'}).status_code == 400
+        response = requests.post(url, data=json.dumps({'row': ['0001']}))
+        assert (response.status_code, response.json()) == (200, {'pending': 1})
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,99 @@
+import os
+import random
+
+from services.snapshots import SnapshotStore, read_export
+
+COLUMNS = ['asset_id', 'city', 'price_1']
+
+
+def rows(*ids, price='1000000'):
+    return [[f'{i:04d}', 'תל אביב', price] for i in ids]
+
+
+def keys(store, at=None):
+    return [key for key, _ in store.view(at)]
+
+
+def test_first_snapshot_round_trips(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    entry = store.write(rows(3, 1, 2), COLUMNS, 'first')
+    assert (entry['id'], entry['rows'], entry['added']) == (1, 3, 3)
+    assert list(store.view()) == [(row[0], row) for row in rows(3, 1, 2)]
+    assert SnapshotStore(str(tmp_path / 'assets')).manifest['key'] == 'asset_id'
+
+
+def test_unchanged_export_writes_nothing(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    store.write(rows(1, 2), COLUMNS)
+    assert store.write(rows(1, 2), COLUMNS) is None
+    assert len(os.listdir(store.segments_dir)) == 1
+
+
+def test_delta_keeps_row_order(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    store.write(rows(1, 2, 3), COLUMNS)
+    new = rows(1, 2, 4)
+    new[1][2] = '950000'
+    entry = store.write(new, COLUMNS)
+    assert (entry['added'], entry['changed'], entry['removed'], entry['rows']) == (1, 1, 1, 3)
+    assert list(store.view()) == [(row[0], row) for row in new]
+    assert keys(store, at=1) == ['0001', '0002', '0003']
+
+
+def test_inserted_and_reordered_rows(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    store.write(rows(1, 2, 3), COLUMNS)
+    store.write(rows(5, 1, 2, 6, 3), COLUMNS)
+    assert keys(store) == ['0005', '0001', '0002', '0006', '0003']
+    store.write(rows(3, 1, 2, 5, 6), COLUMNS)
+    assert keys(store) == ['0003', '0001', '0002', '0005', '0006']
+    assert keys(store, at=2) == ['0005', '0001', '0002', '0006', '0003']
+
+
+def test_duplicate_keys_keep_every_row(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    export = rows(1, 2) + [['0002', 'חיפה', '700000'], ['', 'חיפה', '1'], ['', 'חיפה', '1']]
+    entry = store.write(export, COLUMNS)
+    assert (entry['rows'], entry['duplicate_keys']) == (5, 2)
+    assert [row for _, row in store.view()] == export
+    assert keys(store)[2] == '0002#2'
+
+    export[2][2] = '650000'
+    entry = store.write(export, COLUMNS)
+    assert (entry['changed'], entry['added'], entry['removed']) == (1, 0, 0)
+    assert [row for _, row in store.view()] == export
+
+
+def test_keep_missing_keeps_rows(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    store.write(rows(1, 2, 3), COLUMNS)
+    entry = store.write(rows(2, price='900000'), COLUMNS, keep_missing=True)
+    assert (entry['changed'], entry['removed'], entry['rows']) == (1, 0, 3)
+    assert dict(store.view())['0002'][2] == '900000'
+    assert sorted(keys(store)) == ['0001', '0002', '0003']
+
+
+def test_random_edits_rebuild_every_snapshot(tmp_path):
+    rng = random.Random(7)
+    store = SnapshotStore(str(tmp_path / 'assets'))
+    current, exports, next_id = rows(*range(1, 41)), [], 41
+    for _ in range(15):
+        current = [list(row) for row in current if rng.random() > 0.1]
+        for row in rng.sample(current, min(3, len(current))):
+            row[2] = str(rng.randrange(10 ** 6, 10 ** 7))
+        for _ in range(rng.randrange(4)):
+            current.insert(rng.randrange(len(current) + 1), rows(next_id)[0])
+            next_id += 1
+        if rng.random() < 0.2:
+            rng.shuffle(current)
+        if store.write(current, COLUMNS):
+            exports.append([list(row) for row in current])
+    for at, export in enumerate(exports, 1):
+        assert [row for _, row in store.view(at)] == export
+
+
+def test_read_export_csv_and_json_lines(tmp_path):
+    (tmp_path / 'a.csv').write_text('﻿asset_id,city\n0001,חיפה\n\n', encoding='utf-8')
+    (tmp_path / 'a.jsonl').write_text('["0001", "חיפה"]\n\n', encoding='utf-8')
+    assert read_export(str(tmp_path / 'a.csv')) == (['asset_id', 'city'], [['0001', 'חיפה']])
+    assert read_export(str(tmp_path / 'a.jsonl')) == (None, [['0001', 'חיפה']])